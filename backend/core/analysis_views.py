@@ -4,17 +4,23 @@ from pymongo import MongoClient
 import uuid
 import pandas as pd
 import numpy as np
-import io
 from datetime import datetime
 import os
 from dotenv import load_dotenv
 import random
+from .boundary_registry import registry as boundary_registry, analysis_params
+from .streaming import json_stream_response
+from .ingestion import read_upload, IngestionError, UPLOAD_MAX_BYTES
+from .result_cache import analysis_cache, file_digest
 
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
 DB_MONGO_NAME = os.getenv("DB_MONGO_NAME")
 
+# Versi logika analisis APS, naikkan bila rumus/kategori/teks berubah (cache hasil lama diabaikan)
+ANALYTICS_VERSION = "aps-2"
+
 # Koneksi MongoDB
 client = MongoClient(MONGO_URI)
 mongo_db = client[DB_MONGO_NAME]
@@ -39,6 +45,10 @@ class PendidikanAnalytics:
             'SMA': 0.30,  # 16-18 tahun
             'PT': 0.15    # 19-23 tahun
         }
+        self.jenjang_mapping = {
+            'APS_7_12': 'SD', 'APS_13_15': 'SMP',
+            'APS_16_18': 'SMA', 'APS_19_23': 'PT'
+        }
 
         # Bank Kebijakan Luas (Database Tindakan Strategis)
         self.action_pool = {
@@ -118,12 +128,8 @@ class PendidikanAnalytics:
         """Hitung Weighted Education Risk Index (WERI)"""
         weri = 0
         total_weight = 0
-        jenjang_mapping = {
-            'APS_7_12': 'SD', 'APS_13_15': 'SMP', 
-            'APS_16_18': 'SMA', 'APS_19_23': 'PT'
-        }
         
-        for aps_key, jenjang in jenjang_mapping.items():
+        for aps_key, jenjang in self.jenjang_mapping.items():
             if aps_key in aps_data and aps_data[aps_key] is not None:
                 pgi = self.calculate_pgi(aps_data[aps_key])
                 if pgi is not None:
@@ -132,6 +138,37 @@ class PendidikanAnalytics:
         
         return round(weri / total_weight if total_weight > 0 else 0, 2)
 
+    def score_frame(self, aps_frame):
+        """
+        Skor APS untuk seluruh baris sekaligus (operasi kolom, tanpa loop per baris).
+        aps_frame: kolom APS_7_12..APS_19_23 (nilai mentah).
+        Returns: DataFrame APS_* (numerik), PGI_*, rata_aps, weri, kategori
+        """
+        aps = aps_frame.apply(pd.to_numeric, errors='coerce').astype(np.float64)
+        pgi = (100 - aps).round(2)
+        pgi.columns = [col.replace('APS', 'PGI') for col in aps.columns]
+        
+        # WERI = rata-rata PGI berbobot, hanya atas jenjang yang punya nilai
+        weights = np.array([self.weights[self.jenjang_mapping[col]] for col in aps.columns], dtype=np.float64)
+        present = pgi.notna().to_numpy()
+        total_weight = present @ weights
+        weighted = pgi.fillna(0).to_numpy() @ weights
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weri = np.where(total_weight > 0, weighted / total_weight, 0.0)
+        
+        rata_aps = aps.mean(axis=1)
+        kategori = np.select(
+            [rata_aps.isna(), rata_aps >= 85, rata_aps >= 70],
+            ["SEDANG", "TINGGI", "SEDANG"],
+            "RENDAH"
+        )
+        
+        scores = pd.concat([aps, pgi], axis=1)
+        scores['rata_aps'] = rata_aps.fillna(0)
+        scores['weri'] = np.round(weri, 2)
+        scores['kategori'] = kategori
+        return scores
+
     def categorize_province(self, aps_data):
         """Kategorikan provinsi berdasarkan rata-rata APS"""
         keys = ['APS_7_12', 'APS_13_15', 'APS_16_18', 'APS_19_23']
@@ -205,7 +242,7 @@ class PendidikanAnalytics:
 
         return recommendations
 
-    def generate_insights(self, provinsi, aps_data, kategori, avg_aps):
+    def generate_insights(self, provinsi, aps_data, kategori, avg_aps, weri=None):
         """Generate insight profesional dengan gaya bahasa variatif"""
         prefixes = [
             f"Analisis untuk {provinsi} menunjukkan",
@@ -221,8 +258,9 @@ class PendidikanAnalytics:
         if sma_val is not None and sma_val < 70:
             insights.append(f"⚠️ Perhatian khusus diperlukan pada jenjang SMA/SMK ({sma_val:.1f}%) yang berada di bawah ambang batas kritis.")
         
-        # Analisis Risiko WERI
-        weri = self.calculate_weri(aps_data)
+        # Analisis Risiko WERI (pakai skor yang sudah dihitung bila ada)
+        if weri is None:
+            weri = self.calculate_weri(aps_data)
         if weri > 25:
             insights.append(f"📉 Skor Risiko Pendidikan ({weri:.1f}) mengindikasikan perlunya akselerasi kebijakan jangka pendek.")
         elif weri < 15:
@@ -231,306 +269,266 @@ class PendidikanAnalytics:
         return insights
 
 
-# HELPER FUNCTIONS
-def normalize_name(name):
-    """Normalisasi nama provinsi"""
-    if not isinstance(name, str):
-        name = str(name)
-    
-    name = name.upper().strip()
-    
-    # Singkatan umum
-    abbreviations = {
-        'KEP.': 'KEPULAUAN',
-        'DIY': 'DAERAH ISTIMEWA YOGYAKARTA',
-        'DI': 'DAERAH ISTIMEWA',
-        'DKI': 'DAERAH KHUSUS IBUKOTA JAKARTA',
-        'JATIM': 'JAWA TIMUR',
-        'JATENG': 'JAWA TENGAH',
-        'JABAR': 'JAWA BARAT',
-        'NTB': 'NUSA TENGGARA BARAT',
-        'NTT': 'NUSA TENGGARA TIMUR',
-        'KALBAR': 'KALIMANTAN BARAT',
-        'KALTENG': 'KALIMANTAN TENGAH'
-    }
+# PIPELINE ANALISIS (tanpa geometri, hasilnya bisa di-cache)
+def run_aps_analysis(df, level, boundary_layer):
+    """
+    Analisis APS satu DataFrame terhadap layer batas.
+    Returns: {'result': ringkasan tanpa geometri, 'matched_results': [(key fitur, analisis)]}
+    """
+    wilayah = 'kabupaten/kota' if level == 'kabupaten' else 'provinsi'
     
-    for abbr, full in abbreviations.items():
-        if name == abbr or name.startswith(abbr):
-            name = name.replace(abbr, full)
+    if len(df.columns) < 2:
+        raise IngestionError("Format file tidak valid")
     
-    # Hapus prefix
-    prefixes = ['PROVINSI ', 'KAB. ', 'KABUPATEN ', 'KOTA ']
-    for prefix in prefixes:
-        if name.startswith(prefix):
-            name = name[len(prefix):]
+    # Standarisasi kolom
+    df.columns = [str(col).strip().upper() for col in df.columns]
     
-    return name.strip()
-
-
-def read_file_to_dataframe(file):
-    """Baca file CSV atau XLSX menjadi DataFrame"""
-    filename = file.name.lower()
-    
-    if filename.endswith('.xlsx') or filename.endswith('.xls'):
-        # Baca Excel
-        df = pd.read_excel(file)
-    elif filename.endswith('.csv'):
-        # Baca CSV dengan deteksi separator
-        content = file.read().decode('utf-8-sig')
-        for sep in [',', ';', '\t']:
-            try:
-                df = pd.read_csv(io.StringIO(content), sep=sep)
-                if len(df.columns) > 1:
+    # Cari kolom wilayah (level kabupaten: kolom kabupaten/kota didahulukan dari provinsi)
+    region_keywords = ['PROVINSI', 'PROV', 'DAERAH', 'NAMA', 'WILAYAH']
+    if level == 'kabupaten':
+        region_keywords = ['KABUPATEN', 'KAB', 'KOTA', 'DAERAH', 'NAMA', 'WILAYAH']
+    prov_col = None
+    for kw in region_keywords:
+        prov_col = next((col for col in df.columns if kw in col and 'KODE' not in col), None)
+        if prov_col is not None:
+            break
+    
+    if prov_col is None:
+        prov_col = df.columns[0]
+    
+    # Kolom kode wilayah opsional (kode BPS/Kemendagri), dipakai bila nama tidak cocok persis
+    code_col = next((col for col in df.columns if col.startswith('KODE') or col in ('KD', 'KODE_BPS', 'BPS')), None)
+    
+    # Identifikasi kolom APS
+    aps_cols = {}
+    patterns = {
+        'APS_7_12': ['7-12', '7/12', '7_12', 'SD', '7 12'],
+        'APS_13_15': ['13-15', '13/15', '13_15', 'SMP', '13 15'],
+        'APS_16_18': ['16-18', '16/18', '16_18', 'SMA', '16 18'],
+        'APS_19_23': ['19-23', '19/23', '19_23', 'PT', '19 23', 'PERGURUAN']
+    }
+    
+    for target, patterns_list in patterns.items():
+        for col in df.columns:
+            col_upper = str(col).upper()
+            for pattern in patterns_list:
+                if pattern.upper() in col_upper:
+                    aps_cols[target] = col
                     break
-            except:
+            if target in aps_cols:
+                break
+    
+    # Jika tidak ditemukan, asumsikan kolom 2-5 adalah APS
+    if len(aps_cols) < 2 and len(df.columns) >= 5:
+        default_cols = ['APS_7_12', 'APS_13_15', 'APS_16_18', 'APS_19_23']
+        for i, target in enumerate(default_cols, 1):
+            if i < len(df.columns) and target not in aps_cols:
+                aps_cols[target] = df.columns[i]
+    
+    print(f"DEBUG: Kolom APS ditemukan: {aps_cols}")
+    
+    # Inisialisasi analytics
+    analytics = PendidikanAnalytics()
+    
+    # Proses analisis: hasil (key fitur, analisis), geometri ditempel saat response
+    matched_results = []
+    analysis_summary = []
+    kategori_counts = {"RENDAH": 0, "SEDANG": 0, "TINGGI": 0}
+    
+    # Skor seluruh baris sekaligus: koersi numerik, rata-rata, PGI, WERI, kategori
+    aps_keys = list(aps_cols.keys())
+    pgi_keys = [key.replace('APS', 'PGI') for key in aps_keys]
+    scores = analytics.score_frame(df[list(aps_cols.values())].set_axis(aps_keys, axis=1))
+    
+    # Baris tanpa nama wilayah atau tanpa satu pun nilai APS dilewati
+    names = df[prov_col].astype(str).str.strip()
+    valid = names.ne('') & names.str.upper().ne('NAN') & scores[aps_keys].notna().any(axis=1)
+    codes = df[code_col] if code_col is not None else None
+    
+    rows = scores.loc[valid]
+    records = rows[aps_keys + pgi_keys].astype(object).where(rows[aps_keys + pgi_keys].notna(), None)
+    
+    # Hanya pencocokan wilayah & teks insight/rekomendasi yang masih per baris
+    for idx, csv_name, record, avg_aps, weri, kategori in zip(
+        rows.index, names[valid], records.to_dict('records'),
+        rows['rata_aps'].tolist(), rows['weri'].tolist(), rows['kategori'].tolist()
+    ):
+        try:
+            # Cari matching boundary (alias, exact, kode, fuzzy)
+            match = boundary_layer.match(csv_name, codes[idx] if codes is not None else None)
+            if match is None:
                 continue
-    else:
-        raise ValueError("Format file tidak didukung. Gunakan CSV atau XLSX")
+            official_name = match.name
+    
+            aps_data = {key: record[key] for key in aps_keys}
+            pgi_data = {
+                pgi_key: record[pgi_key]
+                for key, pgi_key in zip(aps_keys, pgi_keys) if record[key] is not None
+            }
+    
+            # Analisis
+            warna = analytics.colors[kategori]
+            insights = analytics.generate_insights(csv_name, aps_data, kategori, avg_aps, weri)
+            recommendations = analytics.generate_recommendations(kategori, aps_data)
+    
+            # Update counts
+            kategori_counts[kategori] = kategori_counts.get(kategori, 0) + 1
+    
+            # Hasil analisis per wilayah (nama_provinsi dipertahankan untuk frontend, juga di level kabupaten)
+            matched_results.append((match.key, {
+                'nama_provinsi': csv_name,
+                'nama_resmi': official_name,
+                'match_confidence': match.confidence,
+                'kategori': kategori,
+                'warna': warna,
+                'rata_aps': round(avg_aps, 2),
+                'weri': weri,
+                'insights': insights,
+                'rekomendasi': recommendations,
+                'aps_data': aps_data,
+                'pgi_data': pgi_data
+            }))
+    
+            # Tambahkan ke summary
+            analysis_summary.append({
+                'provinsi': csv_name,
+                'kategori': kategori,
+                'warna': warna,
+                'rata_aps': round(avg_aps, 2),
+                'weri': weri,
+                'aps_sd': aps_data.get('APS_7_12'),
+                'aps_smp': aps_data.get('APS_13_15'),
+                'aps_sma': aps_data.get('APS_16_18'),
+                'aps_pt': aps_data.get('APS_19_23'),
+                'matched': True
+            })
+    
+        except Exception as e:
+            print(f"DEBUG: Error processing row {idx}: {e}")
+            continue
+    
+    # Hitung statistik nasional
+    total_matched = len(matched_results)
+    total_rows = len(df)
+    
+    # Cari provinsi dengan kondisi terburuk
+    sorted_by_weri = []
+    sorted_by_sma = []
+    
+    if analysis_summary:
+        # Peringkat berdasarkan WERI tertinggi
+        sorted_by_weri = sorted(
+            [s for s in analysis_summary if s['weri'] is not None],
+            key=lambda x: x['weri'],
+            reverse=True
+        )[:3]
     
-    return df
+        # Peringkat berdasarkan APS SMA terendah
+        sorted_by_sma = sorted(
+            [s for s in analysis_summary if s['aps_sma'] is not None],
+            key=lambda x: x['aps_sma']
+        )[:3]
+    
+    # Generate rekomendasi nasional
+    national_recommendations = []
+    
+    if kategori_counts['RENDAH'] > 0:
+        national_recommendations.append({
+            'priority': 'Tinggi',
+            'title': 'Fokus Daerah Tertinggal',
+            'content': f'Terdapat {kategori_counts["RENDAH"]} {wilayah} dalam kategori RENDAH yang memerlukan intervensi khusus.',
+            'actions': [
+                'Alokasi anggaran khusus untuk daerah tertinggal',
+                'Program percepatan wajib belajar 12 tahun',
+                'Pengiriman guru berkualitas ke daerah 3T'
+            ]
+        })
+    
+    # Rekomendasi berdasarkan APS SMA
+    if analysis_summary:
+        sma_values = [s['aps_sma'] for s in analysis_summary if s['aps_sma'] is not None]
+        if sma_values and min(sma_values) < 70:
+            national_recommendations.append({
+                'priority': 'Tinggi',
+                'title': 'Krisis Pendidikan Menengah',
+                'content': f'Beberapa {wilayah} memiliki APS SMA di bawah 70%, mengancam kualitas SDM masa depan.',
+                'actions': [
+                    'Program SMA/SMK gratis untuk keluarga miskin',
+                    'Beasiswa lanjut sekolah untuk lulusan SMP',
+                    'Revitalisasi SMK sesuai kebutuhan industri'
+                ]
+            })
+    
+    result = {
+        'status': 'success',
+        'level': level,
+        'total_data': total_rows,
+        'total_matched': total_matched,
+        'match_rate': f"{total_matched}/{total_rows}",
+        'kategori_distribusi': kategori_counts,
+        'analysis_summary': analysis_summary,
+        'national_recommendations': national_recommendations,
+        'top_risky': sorted_by_weri,
+        'colors': analytics.colors
+    }
+    return {'result': result, 'matched_results': matched_results}
 
 
 # MAIN ANALYSIS API
 @api_view(['POST'])
 def analyze_aps_csv(request):
     """Analisis CSV/XLSX APS - TIDAK AUTO SAVE"""
+    # Tolak upload terlalu besar sebelum body multipart di-parse
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > UPLOAD_MAX_BYTES + 64 * 1024:
+        return Response({"error": f"File melebihi batas {UPLOAD_MAX_BYTES // (1024 * 1024)} MB"}, status=413)
+    
     file = request.FILES.get('csv_file') or request.FILES.get('file')
     
     if not file:
         return Response({"error": "File tidak ditemukan"}, status=400)
     
     try:
-        # Baca file (support CSV & XLSX)
-        df = read_file_to_dataframe(file)
-        
-        if len(df.columns) < 2:
-            return Response({"error": "Format file tidak valid"}, status=400)
-        
-        # Standarisasi kolom
-        df.columns = [str(col).strip().upper() for col in df.columns]
-        
-        # Cari kolom provinsi
-        prov_col = None
-        for col in df.columns:
-            if any(kw in col for kw in ['PROVINSI', 'PROV', 'DAERAH', 'NAMA', 'WILAYAH']):
-                prov_col = col
-                break
-        
-        if prov_col is None:
-            prov_col = df.columns[0]
+        # Level analisis: provinsi (default) atau kabupaten/kota
+        try:
+            level, band = analysis_params(request.data, request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
         
-        # Identifikasi kolom APS
-        aps_cols = {}
-        patterns = {
-            'APS_7_12': ['7-12', '7/12', '7_12', 'SD', '7 12'],
-            'APS_13_15': ['13-15', '13/15', '13_15', 'SMP', '13 15'],
-            'APS_16_18': ['16-18', '16/18', '16_18', 'SMA', '16 18'],
-            'APS_19_23': ['19-23', '19/23', '19_23', 'PT', '19 23', 'PERGURUAN']
-        }
+        # Batas wilayah dari registry (tanpa query MongoDB per request)
+        boundary_layer = boundary_registry.layer(level)
         
-        for target, patterns_list in patterns.items():
-            for col in df.columns:
-                col_upper = str(col).upper()
-                for pattern in patterns_list:
-                    if pattern.upper() in col_upper:
-                        aps_cols[target] = col
-                        break
-                if target in aps_cols:
-                    break
+        # Cache hasil: hash isi file + versi analitik + level + versi layer batas
+        cache_key = analysis_cache.key(file_digest(file), ANALYTICS_VERSION, level, boundary_layer.fingerprint())
+        analysis, cache_source = analysis_cache.get(cache_key)
         
-        # Jika tidak ditemukan, asumsikan kolom 2-5 adalah APS
-        if len(aps_cols) < 2 and len(df.columns) >= 5:
-            default_cols = ['APS_7_12', 'APS_13_15', 'APS_16_18', 'APS_19_23']
-            for i, target in enumerate(default_cols, 1):
-                if i < len(df.columns) and target not in aps_cols:
-                    aps_cols[target] = df.columns[i]
-        
-        print(f"DEBUG: Kolom APS ditemukan: {aps_cols}")
-        
-        # Ambil data batas provinsi
-        cursor = mongo_db["batas_provinsi"].find({}, {'_id': 0})
-        boundary_features = list(cursor)
-        
-        # Buat mapping nama provinsi
-        province_map = {}
-        for feature in boundary_features:
-            props = feature.get('properties', {})
-            for field in ['NAMOBJ', 'name', 'WADMPR', 'Provinsi']:
-                if field in props and props[field]:
-                    official_name = str(props[field]).upper().strip()
-                    province_map[official_name] = feature
-        
-        # Inisialisasi analytics
-        analytics = PendidikanAnalytics()
-        
-        # Proses analisis
-        matched_features = []
-        analysis_summary = []
-        kategori_counts = {"RENDAH": 0, "SEDANG": 0, "TINGGI": 0}
-        
-        for idx, row in df.iterrows():
+        if analysis is None:
+            # Baca file (support CSV & XLSX) secara streaming dengan batas ukuran & baris
             try:
-                csv_name = str(row[prov_col]).strip()
-                if not csv_name or csv_name.upper() == 'NAN':
-                    continue
-                
-                normalized_name = normalize_name(csv_name)
-                
-                # Cari matching boundary
-                matched_feature = None
-                official_name = None
-                
-                # Coba exact match
-                if normalized_name in province_map:
-                    matched_feature = province_map[normalized_name]
-                    official_name = normalized_name
-                else:
-                    # Coba partial match
-                    for prov_name, feature in province_map.items():
-                        if normalized_name in prov_name or prov_name in normalized_name:
-                            matched_feature = feature
-                            official_name = prov_name
-                            break
-                
-                if not matched_feature:
-                    continue
-                
-                # Kumpulkan data APS
-                aps_data = {}
-                for target_col, csv_col in aps_cols.items():
-                    if csv_col in row:
-                        try:
-                            value = pd.to_numeric(row[csv_col], errors='coerce')
-                            aps_data[target_col] = float(value) if not pd.isna(value) else None
-                        except:
-                            aps_data[target_col] = None
-                
-                # Skip jika tidak ada data APS
-                if not any(v is not None for v in aps_data.values()):
-                    continue
-                
-                # Analisis
-                kategori, avg_aps = analytics.categorize_province(aps_data)
-                warna = analytics.colors[kategori]
-                insights = analytics.generate_insights(csv_name, aps_data, kategori, avg_aps)
-                recommendations = analytics.generate_recommendations(kategori, aps_data)
-                weri = analytics.calculate_weri(aps_data)
-                
-                # Hitung PGI per jenjang
-                pgi_data = {}
-                for target_col in aps_cols.keys():
-                    if target_col in aps_data and aps_data[target_col] is not None:
-                        pgi_data[target_col.replace('APS', 'PGI')] = analytics.calculate_pgi(aps_data[target_col])
-                
-                # Update counts
-                kategori_counts[kategori] = kategori_counts.get(kategori, 0) + 1
-                
-                # Tambahkan ke feature
-                feature_copy = matched_feature.copy()
-                props = feature_copy.get('properties', {})
-                
-                props['analysis'] = {
-                    'nama_provinsi': csv_name,
-                    'nama_resmi': official_name,
-                    'kategori': kategori,
-                    'warna': warna,
-                    'rata_aps': round(avg_aps, 2),
-                    'weri': weri,
-                    'insights': insights,
-                    'rekomendasi': recommendations,
-                    'aps_data': aps_data,
-                    'pgi_data': pgi_data
-                }
-                
-                feature_copy['properties'] = props
-                matched_features.append(feature_copy)
-                
-                # Tambahkan ke summary
-                analysis_summary.append({
-                    'provinsi': csv_name,
-                    'kategori': kategori,
-                    'warna': warna,
-                    'rata_aps': round(avg_aps, 2),
-                    'weri': weri,
-                    'aps_sd': aps_data.get('APS_7_12'),
-                    'aps_smp': aps_data.get('APS_13_15'),
-                    'aps_sma': aps_data.get('APS_16_18'),
-                    'aps_pt': aps_data.get('APS_19_23'),
-                    'matched': True
-                })
-                
-            except Exception as e:
-                print(f"DEBUG: Error processing row {idx}: {e}")
-                continue
-        
-        # Hitung statistik nasional
-        total_matched = len(matched_features)
-        total_rows = len(df)
-        
-        # Cari provinsi dengan kondisi terburuk
-        sorted_by_weri = []
-        sorted_by_sma = []
-        
-        if analysis_summary:
-            # Peringkat berdasarkan WERI tertinggi
-            sorted_by_weri = sorted(
-                [s for s in analysis_summary if s['weri'] is not None],
-                key=lambda x: x['weri'],
-                reverse=True
-            )[:3]
-            
-            # Peringkat berdasarkan APS SMA terendah
-            sorted_by_sma = sorted(
-                [s for s in analysis_summary if s['aps_sma'] is not None],
-                key=lambda x: x['aps_sma']
-            )[:3]
-        
-        # Generate rekomendasi nasional
-        national_recommendations = []
-        
-        if kategori_counts['RENDAH'] > 0:
-            national_recommendations.append({
-                'priority': 'Tinggi',
-                'title': 'Fokus Daerah Tertinggal',
-                'content': f'Terdapat {kategori_counts["RENDAH"]} provinsi dalam kategori RENDAH yang memerlukan intervensi khusus.',
-                'actions': [
-                    'Alokasi anggaran khusus untuk daerah tertinggal',
-                    'Program percepatan wajib belajar 12 tahun',
-                    'Pengiriman guru berkualitas ke daerah 3T'
-                ]
-            })
-        
-        # Rekomendasi berdasarkan APS SMA
-        if analysis_summary:
-            sma_values = [s['aps_sma'] for s in analysis_summary if s['aps_sma'] is not None]
-            if sma_values and min(sma_values) < 70:
-                national_recommendations.append({
-                    'priority': 'Tinggi',
-                    'title': 'Krisis Pendidikan Menengah',
-                    'content': f'Beberapa provinsi memiliki APS SMA di bawah 70%, mengancam kualitas SDM masa depan.',
-                    'actions': [
-                        'Program SMA/SMK gratis untuk keluarga miskin',
-                        'Beasiswa lanjut sekolah untuk lulusan SMP',
-                        'Revitalisasi SMK sesuai kebutuhan industri'
-                    ]
-                })
-        
-        # TIDAK AUTO SAVE - hanya return data
-        return Response({
-            'status': 'success',
-            'total_data': total_rows,
-            'total_matched': total_matched,
-            'match_rate': f"{total_matched}/{total_rows}",
-            'kategori_distribusi': kategori_counts,
+                df = read_upload(file)
+                analysis = run_aps_analysis(df, level, boundary_layer)
+            except IngestionError as e:
+                return Response({"error": str(e)}, status=e.status)
+            analysis_cache.set(cache_key, analysis)
+        
+        # TIDAK AUTO SAVE - hanya return data (geometri ditempel dari layer batas, tidak ikut di-cache)
+        features = boundary_layer.annotated_features(analysis['matched_results'], 'analysis', band)
+        result = {
+            **analysis['result'],
             'matched_features': {
                 "type": "FeatureCollection",
-                "features": matched_features
+                "features": features if level == 'kabupaten' else list(features)
             },
-            'analysis_summary': analysis_summary,
-            'national_recommendations': national_recommendations,
-            'top_risky': sorted_by_weri,
-            'colors': analytics.colors
-        })
+            'cache': {'hit': cache_source is not None, 'source': cache_source}
+        }
+        
+        # Level kabupaten (±514 wilayah): FeatureCollection di-stream per fitur
+        if level == 'kabupaten':
+            return json_stream_response(result)
+        return Response(result)
         
     except Exception as e:
         print(f"ERROR: {str(e)}")
@@ -1,5 +1,33 @@
+import os
+import sys
 from django.apps import AppConfig
 
 
+def _is_serving():
+    """Proses server (runserver, gunicorn, uwsgi, ...), bukan perintah manage.py lain (migrate, shell, ...)"""
+    return os.path.basename(sys.argv[0]) != "manage.py" or sys.argv[1:2] == ["runserver"]
+
+
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import model_registry, mongo_indexes, boundary_registry, detection_jobs
+
+        # Worker deteksi bisa pre-load model saat boot (YOLO_WARMUP=True)
+        if model_registry.YOLO_WARMUP:
+            model_registry.warm_up_in_background()
+
+        # Index MongoDB untuk query fitur (pagination, filter, spasial)
+        if mongo_indexes.MONGO_ENSURE_INDEXES:
+            mongo_indexes.ensure_indexes_in_background()
+
+        # Job deteksi yang tertinggal queued/running dari proses sebelumnya (antrian in-memory hilang)
+        if detection_jobs.DETECTION_JOB_CLEANUP_ON_START and _is_serving():
+            detection_jobs.fail_orphaned_jobs_in_background()
+
+        # Pre-compute layer batas wilayah (semua band resolusi)
+        if boundary_registry.BOUNDARY_PRELOAD:
+            boundary_registry.registry.warm_in_background()
+        if boundary_registry.BOUNDARY_WATCH:
+            boundary_registry.registry.start_watcher()
@@ -0,0 +1,235 @@
+import os
+import time
+import numpy as np
+import shapely
+from .detection import DETECTION_SIZE, DETECTION_BATCH_SIZE, SIMPLIFY_TOLERANCE_M, parse_result
+from .geometry import lnglat_to_pixel, pixel_to_lnglat, geo_ring_areas, valid_polygon
+from .tile_source import open_tile_source, TileMosaic, window_origins
+
+# Konfigurasi deteksi area (server-side tile)
+AREA_WINDOW_OVERLAP = int(os.getenv("AREA_WINDOW_OVERLAP", 64))
+AREA_MAX_WINDOWS = int(os.getenv("AREA_MAX_WINDOWS", 256))
+AREA_DEDUP_OVERLAP = float(os.getenv("AREA_DEDUP_OVERLAP", 0.6))
+
+
+def parse_bbox(bbox_raw):
+    """Parse bbox "minLng,minLat,maxLng,maxLat" (string atau list) -> tuple float"""
+    values = bbox_raw.split(',') if isinstance(bbox_raw, str) else bbox_raw
+    min_lng, min_lat, max_lng, max_lat = [float(v) for v in values]
+
+    if min_lng >= max_lng or min_lat >= max_lat:
+        raise ValueError("bbox tidak valid")
+    return min_lng, min_lat, max_lng, max_lat
+
+
+def area_windows(bbox, zoom):
+    """Window 640px (dengan overlap) yang menutupi bbox pada zoom tertentu"""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    # Pixel y membesar ke arah selatan
+    corners = lnglat_to_pixel([[min_lng, max_lat], [max_lng, min_lat]], zoom)
+    bounds = (
+        int(np.floor(corners[0, 0])), int(np.floor(corners[0, 1])),
+        int(np.ceil(corners[1, 0])), int(np.ceil(corners[1, 1]))
+    )
+    return window_origins(bounds, DETECTION_SIZE, AREA_WINDOW_OVERLAP)
+
+
+def _detections_from_result(result, origin, zoom, selected_categories, simplify_tolerance_m):
+    """Ubah hasil prediksi satu window menjadi ring pixel global + atributnya"""
+    origin_x, origin_y = origin
+    center = pixel_to_lnglat([[origin_x + DETECTION_SIZE / 2, origin_y + DETECTION_SIZE / 2]], zoom)[0]
+
+    parsed = parse_result(result, center[1], DETECTION_SIZE, selected_categories, simplify_tolerance_m, zoom)
+
+    if "coords" in parsed:
+        rings = np.split(parsed["coords"], parsed["starts"][1:]) if len(parsed["labels"]) else []
+    else:
+        # Fallback bounding box -> poligon persegi
+        rings = [
+            np.array([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], dtype=np.float64)
+            for x1, y1, x2, y2 in parsed["bbox"].tolist()
+        ]
+
+    detections = []
+    for label, confidence, ring in zip(parsed["labels"].tolist(), parsed["confidence"].tolist(), rings):
+        if len(ring) < 3:
+            continue
+
+        # Deteksi yang menyentuh tepi window kemungkinan terpotong
+        truncated = bool(ring.min() <= 1 or ring.max() >= DETECTION_SIZE - 1)
+        global_ring = ring + np.array([origin_x, origin_y], dtype=np.float64)
+        detections.append({
+            "kategori": label,
+            "confidence_score": confidence,
+            "ring": global_ring,
+            "bbox": np.concatenate((global_ring.min(axis=0), global_ring.max(axis=0))),
+            "truncated": truncated,
+            "window": (origin_x, origin_y)
+        })
+
+    return detections
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def merge_seam_duplicates(detections, overlap_threshold=AREA_DEDUP_OVERLAP):
+    """
+    Rapikan deteksi di sambungan window (hanya antar kategori sama):
+    - Deteksi yang sebagian besar tertutup deteksi lain (irisan / luas yang lebih kecil > threshold)
+      dibuang. Prioritas: tidak terpotong tepi window, lalu confidence tertinggi.
+    - Potongan objek yang terpotong di window berbeda dan saling beririsan di strip overlap
+      digabung (union) menjadi satu poligon, confidence tertinggi dipakai.
+    """
+    if not detections:
+        return []
+
+    polygons = np.array([valid_polygon(d["ring"]) for d in detections], dtype=object)
+    labels = np.array([d["kategori"] for d in detections])
+    areas = shapely.area(polygons)
+
+    # Pasangan kandidat dari STRtree, lalu luas irisan eksak per pasangan
+    left, right = shapely.STRtree(polygons).query(polygons, predicate="intersects")
+    same = (left < right) & (labels[left] == labels[right])
+    left, right = left[same], right[same]
+    inter = shapely.area(shapely.intersection(polygons[left], polygons[right]))
+    contained = inter / np.maximum(np.minimum(areas[left], areas[right]), 1e-9) > overlap_threshold
+
+    covering = {}
+    for i, j in zip(left[contained].tolist(), right[contained].tolist()):
+        covering.setdefault(i, []).append(j)
+        covering.setdefault(j, []).append(i)
+
+    order = sorted(
+        range(len(detections)),
+        key=lambda i: (detections[i]["truncated"], -detections[i]["confidence_score"])
+    )
+    kept = set()
+    for i in order:
+        if not any(j in kept for j in covering.get(i, [])):
+            kept.add(i)
+
+    # Potongan terpotong dari window berbeda yang beririsan -> satu grup (union-find)
+    parent = list(range(len(detections)))
+    for i, j, area in zip(left.tolist(), right.tolist(), inter.tolist()):
+        if (
+            area > 0 and i in kept and j in kept
+            and detections[i]["truncated"] and detections[j]["truncated"]
+            and detections[i]["window"] != detections[j]["window"]
+        ):
+            parent[_find(parent, i)] = _find(parent, j)
+
+    groups = {}
+    for i in sorted(kept):
+        groups.setdefault(_find(parent, i), []).append(i)
+
+    merged = []
+    for members in sorted(groups.values()):
+        if len(members) == 1:
+            merged.append(detections[members[0]])
+            continue
+
+        union = shapely.union_all(polygons[members])
+        parts = list(getattr(union, "geoms", [union]))
+        ring = np.asarray(max(parts, key=lambda part: part.area).exterior.coords, dtype=np.float64)[:-1]
+        best = max(members, key=lambda i: detections[i]["confidence_score"])
+        merged.append({
+            **detections[best],
+            "ring": ring,
+            "bbox": np.concatenate((ring.min(axis=0), ring.max(axis=0))),
+            "fragments": len(members)
+        })
+
+    return merged
+
+
+def run_area_detection(model, bbox, zoom, selected_categories, batch_size=DETECTION_BATCH_SIZE,
+                       simplify_tolerance_m=SIMPLIFY_TOLERANCE_M, tile_source_path=None):
+    """
+    Deteksi seluruh bbox dari tile lokal.
+    Returns: FeatureCollection GeoJSON (koordinat lng/lat)
+    """
+    origins = area_windows(bbox, zoom)
+    if len(origins) > AREA_MAX_WINDOWS:
+        raise ValueError(
+            f"Area terlalu besar: {len(origins)} window (maksimal {AREA_MAX_WINDOWS}), perkecil bbox atau zoom"
+        )
+
+    started = time.perf_counter()
+    source = open_tile_source(tile_source_path)
+    mosaic = TileMosaic(source, zoom)
+    detections = []
+    empty_windows = 0
+
+    try:
+        for start in range(0, len(origins), batch_size):
+            batch_origins = []
+            batch_images = []
+            for origin in origins[start:start + batch_size]:
+                image, found = mosaic.render(origin[0], origin[1], DETECTION_SIZE)
+                # Window tanpa tile tidak perlu diinferensi
+                if not found:
+                    empty_windows += 1
+                    continue
+                batch_origins.append(origin)
+                batch_images.append(image)
+
+            if not batch_images:
+                continue
+
+            results = model.predict(source=batch_images, save=False, verbose=False)
+            for result, origin in zip(results, batch_origins):
+                detections.extend(
+                    _detections_from_result(result, origin, zoom, selected_categories, simplify_tolerance_m)
+                )
+    finally:
+        source.close()
+
+    merged = merge_seam_duplicates(detections)
+
+    # Georeferensi semua ring sekaligus
+    rings_lnglat = []
+    if merged:
+        counts = [len(d["ring"]) for d in merged]
+        all_lnglat = pixel_to_lnglat(np.concatenate([d["ring"] for d in merged]), zoom)
+        rings_lnglat = np.split(all_lnglat, np.cumsum(counts)[:-1])
+    areas = geo_ring_areas(rings_lnglat).tolist() if merged else []
+
+    features = []
+    for detection, ring, luas_m2 in zip(merged, rings_lnglat, areas):
+        coordinates = ring.tolist()
+        coordinates.append(coordinates[0])
+        features.append({
+            "type": "Feature",
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [coordinates]
+            },
+            "properties": {
+                "nama": f"{detection['kategori'].capitalize()} Terdeteksi",
+                "kategori": detection["kategori"],
+                "confidence_score": detection["confidence_score"],
+                "luas_m2": round(luas_m2, 2)
+            }
+        })
+
+    elapsed = time.perf_counter() - started
+    return {
+        "type": "FeatureCollection",
+        "features": features,
+        "metadata": {
+            "bbox": list(bbox),
+            "zoom": zoom,
+            "windows": len(origins),
+            "empty_windows": empty_windows,
+            "window_overlap": AREA_WINDOW_OVERLAP,
+            "raw_detections": len(detections),
+            "merged_duplicates": len(detections) - len(merged),
+            "merged_fragments": sum(d.get("fragments", 1) - 1 for d in merged),
+            "elapsed_seconds": round(elapsed, 3)
+        }
+    }
@@ -0,0 +1,392 @@
+import os
+import gzip
+import json
+import hashlib
+import threading
+import time
+import numpy as np
+from pymongo import MongoClient
+from dotenv import load_dotenv
+from .geometry import simplify_geo_ring
+from .topojson import build_topology
+from .region_matcher import RegionMatcher, RegionMatch, normalize_region_code
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+DB_MONGO_NAME = os.getenv("DB_MONGO_NAME")
+
+# Pre-load semua layer batas saat startup
+BOUNDARY_PRELOAD = os.getenv("BOUNDARY_PRELOAD") == "True"
+
+# Refresh cache batas: TTL (detik) dan/atau change stream MongoDB (butuh replica set)
+BOUNDARY_CACHE_TTL = int(os.getenv("BOUNDARY_CACHE_TTL", 3600))
+BOUNDARY_WATCH = os.getenv("BOUNDARY_WATCH") == "True"
+
+# Koleksi batas wilayah per level
+BOUNDARY_COLLECTIONS = {
+    "provinsi": "batas_provinsi",
+    "kabupaten": "batas_kabupaten"
+}
+
+# Band resolusi: (nama, zoom maksimal, toleransi simplifikasi meter, desimal koordinat)
+BOUNDARY_BANDS = [
+    ("z5", 5, 2000, 3),
+    ("z8", 8, 400, 4),
+    ("z11", 11, 80, 5),
+    ("full", None, 0, None),
+]
+FULL_BAND = "full"
+
+# Kuantisasi TopoJSON per band (jumlah langkah grid per sumbu)
+TOPOJSON_QUANTIZATION = {"z5": 1e4, "z8": 1e5, "z11": 1e6, "full": 1e7}
+BOUNDARY_FORMATS = ["geojson", "topojson"]
+
+# Field nama wilayah di properties batas, per level
+NAME_FIELDS = {
+    "provinsi": ['NAMOBJ', 'name', 'WADMPR', 'Provinsi', 'Propinsi'],
+    "kabupaten": ['NAMOBJ', 'name', 'WADMKK', 'Kabupaten', 'KAB_KOTA']
+}
+
+# Field kode wilayah (BPS/Kemendagri) di properties batas, per level
+CODE_FIELDS = {
+    "provinsi": ['KODE', 'code', 'KDPPUM', 'KODE_PROV', 'kode_prov'],
+    "kabupaten": ['KODE', 'code', 'KDPKAB', 'KODE_KAB', 'kode_kab', 'KDBPS']
+}
+
+# Band geometri default untuk hasil analisis per level (514 kabupaten/kota: disimplifikasi)
+ANALYSIS_BANDS = {"provinsi": FULL_BAND, "kabupaten": "z8"}
+
+client = MongoClient(MONGO_URI)
+mongo_db = client[DB_MONGO_NAME]
+
+
+def select_band(zoom=None, tolerance_m=None):
+    """Pilih band dari zoom peta atau toleransi (meter), default resolusi penuh"""
+    if tolerance_m is not None:
+        # Band paling kasar yang toleransinya tidak melebihi permintaan
+        for name, _, band_tolerance, _ in BOUNDARY_BANDS:
+            if band_tolerance <= tolerance_m:
+                return name
+        return FULL_BAND
+    if zoom is not None:
+        for name, max_zoom, _, _ in BOUNDARY_BANDS:
+            if max_zoom is not None and zoom <= max_zoom:
+                return name
+    return FULL_BAND
+
+
+def request_band(zoom=None, tolerance=None):
+    """
+    Band dari parameter request zoom/tolerance (teks atau angka, kosong = tidak diisi).
+    Zoom boleh pecahan (zoom Leaflet). ValueError jika bukan angka.
+    """
+    return select_band(
+        zoom=float(zoom) if zoom not in (None, '') else None,
+        tolerance_m=float(tolerance) if tolerance not in (None, '') else None
+    )
+
+
+def analysis_params(*sources):
+    """
+    Level & band geometri untuk endpoint analisis dari parameter request
+    (level=provinsi|kabupaten, zoom/tolerance opsional). ValueError jika tidak valid.
+    """
+    def get(name):
+        for source in sources:
+            value = source.get(name) if source is not None else None
+            if value not in (None, ''):
+                return value
+        return None
+
+    level = str(get('level') or 'provinsi').strip().lower()
+    if level not in BOUNDARY_COLLECTIONS:
+        raise ValueError(f"level harus salah satu dari {list(BOUNDARY_COLLECTIONS)}")
+
+    zoom, tolerance = get('zoom'), get('tolerance')
+    if zoom is None and tolerance is None:
+        return level, ANALYSIS_BANDS[level]
+    return level, request_band(zoom, tolerance)
+
+
+def _simplify_ring(ring, tolerance_m, decimals):
+    """Simplifikasi + kuantisasi satu ring, None jika ring kolaps"""
+    points = simplify_geo_ring(ring, tolerance_m) if tolerance_m > 0 else np.asarray(ring, dtype=np.float64)
+    points = np.round(points.reshape(-1, 2), decimals)
+
+    # Titik berurutan yang sama setelah pembulatan dibuang
+    if len(points):
+        changed = np.any(points != np.roll(points, 1, axis=0), axis=1)
+        changed[0] = True
+        points = points[changed]
+    if len(points) and not np.array_equal(points[0], points[-1]):
+        points = np.vstack((points, points[:1]))
+
+    return points.tolist() if len(points) >= 4 else None
+
+
+def _simplify_polygon(rings, tolerance_m, decimals):
+    exterior = _simplify_ring(rings[0], tolerance_m, decimals) if rings else None
+    if exterior is None:
+        return None
+    holes = [h for h in (_simplify_ring(r, tolerance_m, decimals) for r in rings[1:]) if h]
+    return [exterior] + holes
+
+
+def simplify_geometry(geometry, tolerance_m, decimals):
+    """Simplifikasi Polygon/MultiPolygon GeoJSON, pulau yang kolaps di band ini dibuang"""
+    if not geometry:
+        return geometry
+    geom_type = geometry.get("type")
+    coordinates = geometry.get("coordinates") or []
+
+    if geom_type == "Polygon":
+        simplified = _simplify_polygon(coordinates, tolerance_m, decimals)
+        if simplified is None:
+            simplified = _simplify_polygon(coordinates, 0, decimals)
+        return {"type": "Polygon", "coordinates": simplified or coordinates}
+
+    if geom_type == "MultiPolygon":
+        parts = [p for p in (_simplify_polygon(poly, tolerance_m, decimals) for poly in coordinates) if p]
+        if not parts and coordinates:
+            # Semua bagian kolaps: pertahankan bagian pertama tanpa simplifikasi
+            parts = [_simplify_polygon(coordinates[0], 0, decimals) or coordinates[0]]
+        return {"type": "MultiPolygon", "coordinates": parts}
+
+    return geometry
+
+
+def _payload(document):
+    """
+    Serialisasi compact + varian terkompresi (gzip, brotli jika tersedia).
+    Returns: dict encoding -> (bytes, ETag)
+    """
+    body = json.dumps(document, separators=(',', ':'), default=str).encode('utf-8')
+    digest = hashlib.sha1(body).hexdigest()
+
+    variants = {"identity": (body, f'"{digest}"')}
+    variants["gzip"] = (gzip.compress(body, compresslevel=6), f'"{digest}-gzip"')
+    if brotli is not None:
+        variants["br"] = (brotli.compress(body, quality=9), f'"{digest}-br"')
+    return variants
+
+
+class BoundaryLayer:
+    """Satu level batas (provinsi/kabupaten) dengan payload per band yang di-cache"""
+
+    def __init__(self, level, features):
+        self.level = level
+        self.features = features
+        self.loaded_at = time.time()
+        self._payloads = {}
+        self._band_features = {FULL_BAND: features}
+        self._matcher = None
+        self._codes = None
+        self._fingerprint = None
+        self._lock = threading.Lock()
+
+    def matcher(self):
+        """RegionMatcher (alias, exact, trigram) atas nama-nama fitur layer ini"""
+        if self._matcher is None:
+            entries = []
+            for key, feature in enumerate(self.features):
+                props = feature.get('properties', {})
+                for field in NAME_FIELDS[self.level]:
+                    if field in props and props[field]:
+                        entries.append((key, props[field]))
+            self._matcher = RegionMatcher(entries, self.level)
+        return self._matcher
+
+    def fingerprint(self):
+        """Hash urutan nama & kode fitur: key fitur hasil analisis yang di-cache tetap valid selama sama"""
+        if self._fingerprint is None:
+            digest = hashlib.sha1(self.level.encode('utf-8'))
+            for feature in self.features:
+                props = feature.get('properties', {})
+                fields = NAME_FIELDS[self.level] + CODE_FIELDS[self.level]
+                digest.update(json.dumps([props.get(f) for f in fields], default=str).encode('utf-8'))
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def code_index(self):
+        """Index kode wilayah ternormalisasi -> key fitur"""
+        if self._codes is None:
+            codes = {}
+            for key, feature in enumerate(self.features):
+                props = feature.get('properties', {})
+                for field in CODE_FIELDS[self.level]:
+                    code = normalize_region_code(props.get(field), self.level)
+                    if code:
+                        codes.setdefault(code, key)
+            self._codes = codes
+        return self._codes
+
+    def match(self, name, code=None):
+        """
+        Cocokkan wilayah dari nama dan/atau kode.
+        Nama yang cocok persis diutamakan (kode BPS dan Kemendagri tidak selalu sama),
+        lalu kode, lalu pencocokan fuzzy nama.
+        """
+        name_match = self.matcher().match(name) if name else None
+        if name_match is not None and name_match.method == "exact":
+            return name_match
+
+        key = self.code_index().get(normalize_region_code(code, self.level))
+        if key is not None:
+            props = self.features[key].get('properties', {})
+            official = next((props[f] for f in NAME_FIELDS[self.level] if props.get(f)), name)
+            return RegionMatch(key, str(official), 1.0, "code")
+        return name_match
+
+    def feature(self, key, band=FULL_BAND):
+        """Salinan fitur dengan properties baru (copy-on-write), geometri dipakai bersama"""
+        feature = self.band_features(band)[key]
+        return {**feature, 'properties': dict(feature.get('properties', {}))}
+
+    def band_features(self, band):
+        """Fitur dengan geometri disimplifikasi untuk band, dihitung sekali per layer"""
+        features = self._band_features.get(band)
+        if features is None:
+            _, _, tolerance_m, decimals = next(b for b in BOUNDARY_BANDS if b[0] == band)
+            features = [
+                {**feature, "geometry": simplify_geometry(feature.get("geometry"), tolerance_m, decimals)}
+                for feature in self.features
+            ]
+            self._band_features[band] = features
+        return features
+
+    def annotated_features(self, results, prop_name, band=FULL_BAND):
+        """Generator fitur hasil analysis: results iterable (key, dict analisis)"""
+        for key, analysis in results:
+            feature = self.feature(key, band)
+            feature['properties'][prop_name] = analysis
+            yield feature
+
+    def band_topology(self, band):
+        """TopoJSON: sisi bersama disimpan sekali, simplifikasi per arc"""
+        _, _, tolerance_m, _ = next(b for b in BOUNDARY_BANDS if b[0] == band)
+        return build_topology(
+            self.features, TOPOJSON_QUANTIZATION[band], tolerance_m, object_name=BOUNDARY_COLLECTIONS[self.level]
+        )
+
+    def payload(self, band, fmt="geojson"):
+        """Varian bytes (identity/gzip/br) + ETag untuk band & format, dihitung sekali"""
+        key = (band, fmt)
+        cached = self._payloads.get(key)
+        if cached is None:
+            with self._lock:
+                cached = self._payloads.get(key)
+                if cached is None:
+                    started = time.perf_counter()
+                    if fmt == "topojson":
+                        document = self.band_topology(band)
+                    else:
+                        document = {"type": "FeatureCollection", "features": self.band_features(band)}
+                    cached = _payload(document)
+                    self._payloads[key] = cached
+                    print(f"✓ Batas {self.level} band {band} ({fmt}): "
+                          f"{len(cached['identity'][0]) / 1e6:.2f} MB, gzip {len(cached['gzip'][0]) / 1e6:.2f} MB "
+                          f"({time.perf_counter() - started:.2f}s)")
+        return cached
+
+    def warm(self):
+        for name, _, _, _ in BOUNDARY_BANDS:
+            for fmt in BOUNDARY_FORMATS:
+                self.payload(name, fmt)
+
+
+class BoundaryRegistry:
+    """Cache batas wilayah per proses (satu kali baca MongoDB per level)"""
+
+    def __init__(self, db, ttl=BOUNDARY_CACHE_TTL):
+        self.db = db
+        self.ttl = ttl
+        self._layers = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._watcher = None
+
+    def _load(self, level):
+        features = list(self.db[BOUNDARY_COLLECTIONS[level]].find({}, {'_id': 0}))
+        print(f"✓ Batas {level} dimuat: {len(features)} fitur")
+        return BoundaryLayer(level, features)
+
+    def _refresh(self, level):
+        try:
+            layer = self._load(level)
+            with self._lock:
+                self._layers[level] = layer
+        except Exception as e:
+            print(f"⚠ Gagal refresh batas {level}: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(level)
+
+    def layer(self, level):
+        """
+        Layer batas untuk satu level. Load pertama blocking, setelah TTL habis
+        layer lama tetap dipakai sementara versi baru dimuat di background.
+        Request sebaiknya memegang satu layer selama diproses (snapshot konsisten).
+        """
+        if level not in BOUNDARY_COLLECTIONS:
+            raise ValueError(f"Level batas tidak dikenal: {level}")
+
+        layer = self._layers.get(level)
+        if layer is None:
+            with self._lock:
+                layer = self._layers.get(level)
+                if layer is None:
+                    layer = self._load(level)
+                    self._layers[level] = layer
+        elif self.ttl and time.time() - layer.loaded_at > self.ttl:
+            self.invalidate(level)
+        return layer
+
+    def invalidate(self, level):
+        """Muat ulang satu level di background (sekali jalan per level)"""
+        with self._lock:
+            if level in self._refreshing:
+                return
+            self._refreshing.add(level)
+        threading.Thread(target=self._refresh, args=(level,), name=f"boundary-refresh-{level}", daemon=True).start()
+
+    def _watch(self):
+        """Change stream: perubahan koleksi batas memicu refresh"""
+        levels = {collection: level for level, collection in BOUNDARY_COLLECTIONS.items()}
+        try:
+            pipeline = [{'$match': {'ns.coll': {'$in': list(levels)}}}]
+            with self.db.watch(pipeline) as stream:
+                for change in stream:
+                    level = levels.get(change.get('ns', {}).get('coll'))
+                    if level:
+                        print(f"Perubahan batas {level} terdeteksi, refresh cache")
+                        self.invalidate(level)
+        except Exception as e:
+            # Mongo standalone tidak mendukung change stream, cukup andalkan TTL
+            print(f"⚠ Change stream batas tidak aktif: {str(e)}")
+
+    def start_watcher(self):
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name="boundary-watch", daemon=True)
+            self._watcher.start()
+        return self._watcher
+
+    def payload(self, level, band=FULL_BAND, fmt="geojson"):
+        return self.layer(level).payload(band, fmt)
+
+    def warm(self):
+        for level in BOUNDARY_COLLECTIONS:
+            self.layer(level).warm()
+
+    def warm_in_background(self):
+        thread = threading.Thread(target=self.warm, name="boundary-warmup", daemon=True)
+        thread.start()
+        return thread
+
+
+registry = BoundaryRegistry(mongo_db)
@@ -0,0 +1,404 @@
+import os
+import re
+import json
+import zlib
+import time
+import random
+import threading
+from collections import namedtuple, OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from datetime import datetime, timedelta
+import requests
+from requests.adapters import HTTPAdapter
+from pymongo import MongoClient
+from dotenv import load_dotenv
+from .bps_snapshots import SnapshotStore
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+DB_MONGO_NAME = os.getenv("DB_MONGO_NAME")
+BPS_API_KEY = os.getenv("BPS_WEB_API_KEY")
+# Base URL WebAPI BPS (bisa diarahkan ke stub server lokal untuk pengujian)
+BPS_API_BASE_URL = os.getenv("BPS_API_BASE_URL", "https://webapi.bps.go.id/v1/api").rstrip("/")
+
+# Timeout per request & deadline total satu batch fetch (detik)
+BPS_REQUEST_TIMEOUT = float(os.getenv("BPS_REQUEST_TIMEOUT", 10))
+BPS_DEADLINE = float(os.getenv("BPS_DEADLINE", 30))
+# Retry dengan exponential backoff + full jitter
+BPS_MAX_RETRIES = int(os.getenv("BPS_MAX_RETRIES", 3))
+BPS_BACKOFF_BASE = float(os.getenv("BPS_BACKOFF_BASE", 0.5))
+BPS_BACKOFF_MAX = 8.0
+# Jumlah fetch paralel & ukuran pool koneksi keep-alive
+BPS_MAX_WORKERS = int(os.getenv("BPS_MAX_WORKERS", 8))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Cache dataset BPS: segar selama TTL, setelah itu disajikan basi (stale) sambil di-refresh
+# di background sampai MAX_STALE (detik). Data BPS umumnya berubah paling sering tahunan.
+BPS_CACHE_ENABLED = os.getenv("BPS_CACHE_ENABLED", "True") == "True"
+BPS_CACHE_TTL = int(os.getenv("BPS_CACHE_TTL", 7 * 24 * 3600))
+BPS_CACHE_MAX_STALE = int(os.getenv("BPS_CACHE_MAX_STALE", 180 * 24 * 3600))
+BPS_CACHE_SIZE = int(os.getenv("BPS_CACHE_SIZE", 128))
+BPS_CACHE_COLLECTION = "bps_cache"
+
+# Mode offline: dataset hanya dibaca dari snapshot lokal (manage.py bps_snapshot), tanpa jaringan
+BPS_OFFLINE_MODE = os.getenv("BPS_OFFLINE_MODE") == "True"
+
+# Koneksi MongoDB (cache dataset)
+mongo_client = MongoClient(MONGO_URI)
+mongo_db = mongo_client[DB_MONGO_NAME]
+
+# Domain BPS: 0000 = nasional (vervar per provinsi), kode provinsi + "00" = kabupaten/kota di provinsi itu
+BPS_NATIONAL_DOMAIN = "0000"
+BPS_PROVINCE_DOMAINS = [
+    "1100", "1200", "1300", "1400", "1500", "1600", "1700", "1800", "1900", "2100",
+    "3100", "3200", "3300", "3400", "3500", "3600", "5100", "5200", "5300",
+    "6100", "6200", "6300", "6400", "6500", "7100", "7200", "7300", "7400", "7500", "7600",
+    "8100", "8200", "9100", "9200", "9400", "9500", "9600", "9700",
+]
+
+# Satu tabel data BPS
+BPSDataset = namedtuple("BPSDataset", ["var", "th", "domain"])
+
+
+def dataset_for(config, domain=None, var=None):
+    """Dataset dari konfigurasi indikator ({"var", "th"}), domain/var bisa di-override"""
+    return BPSDataset(str(var or config["var"]), str(config["th"]), str(domain or BPS_NATIONAL_DOMAIN))
+
+
+def parse_flag(value):
+    """Parameter boolean request ("true", "1", True, ...) -> bool"""
+    return str(value).strip().lower() in ("1", "true", "yes", "ya")
+
+
+class BPSCache:
+    """
+    Cache dataset BPS dua tingkat: LRU in-memory per proses di depan koleksi MongoDB
+    (payload JSON zlib, dihapus TTL index saat expires_at = fetched_at + max_stale lewat).
+    """
+
+    def __init__(self, collection, ttl=BPS_CACHE_TTL, max_stale=BPS_CACHE_MAX_STALE, max_entries=BPS_CACHE_SIZE):
+        self.collection = collection
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self.counters = Counter()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(dataset):
+        return f"{dataset.var}/{dataset.th}/{dataset.domain}"
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def _remember(self, key, fetched_at, data):
+        with self._lock:
+            self._entries[key] = (fetched_at, data)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def lookup(self, key):
+        """Returns: (fetched_at epoch, data, 'memory'|'mongo') atau None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[0], entry[1], "memory"
+        try:
+            document = self.collection.find_one({'_id': key})
+        except Exception as e:
+            print(f"⚠ Cache BPS tidak bisa dibaca: {str(e)}")
+            return None
+        if not document:
+            return None
+
+        fetched_at = (document['fetched_at'] - datetime(1970, 1, 1)).total_seconds()
+        data = json.loads(zlib.decompress(document['payload']).decode('utf-8'))
+        self._remember(key, fetched_at, data)
+        return fetched_at, data, "mongo"
+
+    def store(self, key, data):
+        fetched_at = time.time()
+        self._remember(key, fetched_at, data)
+        fetched = datetime.utcfromtimestamp(fetched_at)
+        try:
+            self.collection.replace_one({'_id': key}, {
+                '_id': key,
+                'payload': zlib.compress(json.dumps(data, separators=(',', ':')).encode('utf-8'), 6),
+                'fetched_at': fetched,
+                'expires_at': fetched + timedelta(seconds=self.max_stale)
+            }, upsert=True)
+        except Exception as e:
+            print(f"⚠ Cache BPS tidak tersimpan: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "entries_memory": len(self._entries)}
+
+
+class BPSClient:
+    """
+    Klien WebAPI BPS bersama: satu Session (pool koneksi keep-alive) dan satu thread pool
+    per proses, retry dengan backoff + jitter, timeout per request dan deadline per batch.
+    """
+
+    def __init__(self, base_url=BPS_API_BASE_URL, api_key=BPS_API_KEY, timeout=BPS_REQUEST_TIMEOUT,
+                 deadline=BPS_DEADLINE, max_retries=BPS_MAX_RETRIES, max_workers=BPS_MAX_WORKERS, cache=None,
+                 snapshots=None, offline=BPS_OFFLINE_MODE):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.max_workers = max_workers
+        self.cache = cache
+        self.snapshots = snapshots
+        self.offline = offline
+        self._inflight = {}
+        self._listeners = []
+        self._session = None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_workers)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._session = session
+        return self._session
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bps-fetch")
+        return self._executor
+
+    def url(self, dataset):
+        return (f"{self.base_url}/list/model/data/lang/ind/domain/{dataset.domain}"
+                f"/var/{dataset.var}/th/{dataset.th}/key/{self.api_key}/")
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(BPS_BACKOFF_MAX, BPS_BACKOFF_BASE * (2 ** attempt)))
+
+    def fetch(self, dataset, deadline_at=None):
+        """
+        Ambil satu dataset. Error jaringan, timeout, 429 & 5xx di-retry selama deadline masih ada.
+        Returns: JSON response atau None
+        """
+        deadline_at = deadline_at or time.monotonic() + self.deadline
+        label = f"var {dataset.var}/th {dataset.th}/domain {dataset.domain}"
+
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                print(f"✗ {label}: deadline habis")
+                return None
+            try:
+                response = self.session.get(self.url(dataset), timeout=min(self.timeout, remaining))
+                if response.status_code == 200:
+                    data = response.json()
+                    if data.get("data-availability") == "list-not-available":
+                        print(f"✗ {label}: data tidak tersedia")
+                        return None
+                    print(f"✓ {label}: Success")
+                    return data
+                if response.status_code not in RETRY_STATUS:
+                    print(f"✗ {label}: HTTP {response.status_code}")
+                    return None
+                error = f"HTTP {response.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = type(e).__name__
+            except ValueError as e:
+                print(f"✗ {label}: response bukan JSON - {e}")
+                return None
+
+            if attempt < self.max_retries:
+                delay = min(self._backoff(attempt), max(0, deadline_at - time.monotonic()))
+                print(f"⟳ {label}: {error}, retry {attempt + 1} dalam {delay:.2f}s")
+                time.sleep(delay)
+            else:
+                print(f"✗ {label}: {error} (retry habis)")
+        return None
+
+    def add_listener(self, callback):
+        """Daftarkan callback(dataset, data) yang dipanggil setiap dataset baru diambil dari BPS"""
+        self._listeners.append(callback)
+
+    def _notify(self, dataset, data):
+        for callback in list(self._listeners):
+            try:
+                callback(dataset, data)
+            except Exception as e:
+                print(f"⚠ Listener dataset BPS gagal: {str(e)}")
+
+    def _fetch_single_flight(self, dataset, deadline_at=None):
+        """Fetch + simpan ke cache; request bersamaan untuk dataset yang sama menunggu satu fetch"""
+        key = BPSCache.key(dataset)
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+
+        if not owner:
+            remaining = (deadline_at or time.monotonic() + self.deadline) - time.monotonic()
+            try:
+                return future.result(timeout=max(0, remaining))
+            except Exception:
+                return None
+
+        data = None
+        try:
+            data = self.fetch(dataset, deadline_at)
+            if data is not None and self.cache is not None:
+                self.cache.store(key, data)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            future.set_result(data)
+        if data is not None:
+            self._notify(dataset, data)
+        return data
+
+    def _refresh_in_background(self, dataset):
+        with self._lock:
+            if BPSCache.key(dataset) in self._inflight:
+                return
+        threading.Thread(
+            target=self._fetch_single_flight, args=(dataset,), name="bps-refresh", daemon=True
+        ).start()
+
+    def get(self, dataset, deadline_at=None, force_refresh=False, offline=False):
+        """
+        Dataset lewat cache (stale-while-revalidate), atau dari snapshot saja di mode offline.
+        Returns: (data atau None, sumber 'fresh'|'stale'|'network'|'snapshot'|'error')
+        """
+        if offline or self.offline:
+            data = self.snapshots.read(dataset) if self.snapshots is not None else None
+            if data is None:
+                print(f"✗ var {dataset.var}/th {dataset.th}/domain {dataset.domain}: tidak ada di snapshot")
+            return data, "snapshot" if data is not None else "error"
+
+        if self.cache is None:
+            data = self._fetch_single_flight(dataset, deadline_at)
+            return data, "network" if data is not None else "error"
+
+        cache = self.cache
+        cached = None if force_refresh else cache.lookup(BPSCache.key(dataset))
+        if cached is not None:
+            fetched_at, data, where = cached
+            age = time.time() - fetched_at
+            if age < cache.ttl:
+                cache.count(f"hit_{where}")
+                return data, "fresh"
+            if age < cache.max_stale:
+                # Sajikan data lama sekarang, refresh di background
+                cache.count("stale")
+                self._refresh_in_background(dataset)
+                return data, "stale"
+
+        cache.count("refresh" if force_refresh else "miss")
+        data = self._fetch_single_flight(dataset, deadline_at)
+        if data is not None:
+            return data, "network"
+
+        # BPS tidak bisa dihubungi: pakai salinan apa pun yang masih ada
+        fallback = cache.lookup(BPSCache.key(dataset))
+        if fallback is not None:
+            cache.count("fallback")
+            return fallback[1], "stale"
+        cache.count("error")
+        return None, "error"
+
+    def fetch_many(self, datasets, deadline=None, force_refresh=False, sources=None, offline=False):
+        """
+        Ambil banyak dataset paralel (lewat cache bila aktif, atau snapshot bila offline).
+        datasets: dict nama -> BPSDataset.
+        sources: dict opsional yang diisi sumber per nama (fresh/stale/network/error).
+        Returns: dict nama -> JSON atau None (gagal / melewati deadline total)
+        """
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        futures = {
+            name: self.executor.submit(self.get, dataset, deadline_at, force_refresh, offline)
+            for name, dataset in datasets.items()
+        }
+        wait(futures.values(), timeout=max(0, deadline_at - time.monotonic()))
+
+        results = {}
+        for name, future in futures.items():
+            if future.done() and not future.cancelled() and future.exception() is None:
+                results[name], source = future.result()
+            else:
+                future.cancel()
+                results[name], source = None, "error"
+            if sources is not None:
+                sources[name] = source
+        return results
+
+client = BPSClient(
+    cache=BPSCache(mongo_db[BPS_CACHE_COLLECTION]) if BPS_CACHE_ENABLED else None,
+    snapshots=SnapshotStore()
+)
+
+
+def parse_domains(value):
+    """Parameter domain ("3200", "3200,3300" atau list) -> list domain 4 digit; kosong = semua provinsi"""
+    if not value:
+        return list(BPS_PROVINCE_DOMAINS)
+    if isinstance(value, str):
+        value = value.split(',')
+    domains = []
+    for item in value:
+        digits = re.sub(r"\D", "", str(item))
+        if len(digits) == 2:
+            digits += "00"
+        if len(digits) != 4:
+            raise ValueError(f"Domain BPS tidak valid: {item}")
+        domains.append(digits)
+    return domains
+
+
+def is_regency_code(code):
+    """Kode vervar 4 digit kabupaten/kota (bukan total provinsi xx00 atau INDONESIA 9999)"""
+    code = str(code)
+    return len(code) == 4 and code.isdigit() and not code.endswith("00") and code != "9999"
+
+
+def merge_datasets(responses):
+    """Gabungkan response data BPS beberapa domain (vervar per domain tidak bertabrakan)"""
+    responses = [r for r in responses if r]
+    if not responses:
+        return None
+    merged = {"datacontent": {}, "vervar": [], "turvar": []}
+    for response in responses:
+        merged["datacontent"].update(response.get("datacontent") or {})
+        merged["vervar"].extend(response.get("vervar") or [])
+        if not merged["turvar"]:
+            merged["turvar"] = response.get("turvar") or []
+    return merged
+
+
+def vervar_codes(raw_data, level="provinsi"):
+    """Nama wilayah (upper) -> kode vervar, untuk pencocokan batas berbasis kode"""
+    codes = {}
+    for item in (raw_data or {}).get("vervar", []):
+        code = str(item.get("val", ""))
+        label = str(item.get("label", "")).upper().strip()
+        if not code or not label or code == "9999":
+            continue
+        if level == "kabupaten" and not is_regency_code(code):
+            continue
+        codes[label] = code
+    return codes
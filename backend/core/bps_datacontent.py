@@ -0,0 +1,203 @@
+import numpy as np
+import pandas as pd
+from .bps_client import is_regency_code
+
+# Kode vervar INDONESIA (agregat nasional)
+NATIONAL_VERVAR = 9999
+
+# Key datacontent BPS = vervar + var + turvar + tahun + turtahun (kode angka digabung tanpa pemisah),
+# contoh "15005012121240". Lebar turtahun/tahun/turvar di belakang tetap per response (dari
+# metadata), vervar di depan dicocokkan dengan daftar kode vervar, var adalah sisa di tengah.
+CODE_COLUMNS = ["vervar", "var", "turvar", "tahun", "turtahun"]
+TAIL_COLUMNS = [("turtahun", 1), ("tahun", 3), ("turvar", 1)]
+
+
+def _code_width(items, default):
+    """Lebar kode di daftar metadata jika seragam, selain itu default"""
+    widths = {len(str(item.get("val"))) for item in items or [] if item.get("val") is not None}
+    return widths.pop() if len(widths) == 1 else default
+
+
+def _labels(items):
+    return {str(item.get("val")): item.get("label", "") for item in items or [] if item.get("val") is not None}
+
+
+def _number(chars, start, stop):
+    """Kolom karakter [start:stop] matriks key (baris x byte ASCII) -> kode integer"""
+    if stop <= start:
+        return np.zeros(len(chars), dtype=np.int64)
+    return (chars[:, start:stop].astype(np.int64) - 48) @ (10 ** np.arange(stop - start - 1, -1, -1, dtype=np.int64))
+
+
+def _values(values, count):
+    """Nilai datacontent -> float (None & teks non-angka = NaN)"""
+    try:
+        return np.fromiter(values, dtype=float, count=count)
+    except (TypeError, ValueError):
+        values = pd.Series(list(values), dtype=object)
+        numbers = pd.to_numeric(values, errors="coerce").to_numpy(dtype=float, copy=True)
+        # Parser teks pandas tidak selalu dibulatkan tepat, teks angka dikonversi ulang seperti float()
+        text = np.flatnonzero(values.map(type).to_numpy() == str)
+        text = text[~np.isnan(numbers[text])]
+        numbers[text] = values.iloc[text].to_numpy(dtype=str).astype(float)
+        return numbers
+
+
+def _last_rows(rows, groups, group_count):
+    """Baris terakhir per grup (key datacontent yang muncul terakhir menang, seperti dict biasa)"""
+    last = np.full(group_count, -1, dtype=np.int64)
+    np.maximum.at(last, groups, np.arange(len(groups)))
+    return rows[last[last >= 0]]
+
+
+class DataContent:
+    """
+    Response data BPS sebagai tabel kolom (vervar, var, turvar, tahun, turtahun, value) dengan
+    label vervar/turvar. Semua key di-decode sekali lewat slicing matriks byte numpy
+    (per kelompok panjang key, bukan per key), label di-join lewat kode unik.
+    """
+
+    def __init__(self, raw_data):
+        raw_data = raw_data or {}
+        self.vervar_labels = _labels(raw_data.get("vervar"))
+        self.turvar_labels = _labels(raw_data.get("turvar"))
+        self.tahun_labels = _labels(raw_data.get("tahun"))
+
+        # Kode vervar angka (terurut) -> nama wilayah (upper), satu kali per kode
+        regions = {}
+        for code, label in self.vervar_labels.items():
+            if code.isdigit():
+                regions[int(code)] = (str(label or "").upper().strip(), is_regency_code(code))
+        codes = np.array(sorted(regions), dtype=np.int64)
+        self.columns, self.values = self._decode(raw_data, codes)
+        self._frame = None
+
+        # Baris -> indeks kode berlabel; baris tanpa label ke indeks terakhir (nama kosong)
+        position = np.searchsorted(codes, self.columns["vervar"])
+        known = codes[np.minimum(position, len(codes) - 1)] == self.columns["vervar"] if len(codes) else False
+        code_index = np.where(known, position, len(codes))
+
+        names = [regions[code][0] for code in codes.tolist()] + [""]
+        self._wilayah, wilayah_of_code = np.unique(np.array(names, dtype=object), return_inverse=True)
+        self._wilayah_index = wilayah_of_code[code_index]
+        has_label = np.array([bool(name) for name in names]) & np.append(codes != NATIONAL_VERVAR, False)
+        regency = np.array([regions[code][1] for code in codes.tolist()] + [False], dtype=bool)
+        self._analysis_rows = {
+            "provinsi": has_label[code_index],
+            "kabupaten": (has_label & regency)[code_index],
+        }
+
+    def _decode(self, raw_data, codes):
+        datacontent = raw_data.get("datacontent") or {}
+        count = len(datacontent)
+        columns = {column: np.full(count, -1, dtype=np.int64) for column in CODE_COLUMNS}
+        values = _values(datacontent.values(), count)
+        if not count:
+            return columns, values
+
+        tail_widths = [(column, _code_width(raw_data.get(column), default)) for column, default in TAIL_COLUMNS]
+        tail = sum(width for _, width in tail_widths)
+        code_widths = np.char.str_len(codes.astype(str))
+        widths = sorted(set(code_widths.tolist()), reverse=True) or [4]
+
+        # Semua key digabung jadi satu buffer byte; posisi & panjang key dari posisi pemisah
+        buffer = np.frombuffer(("\n".join(datacontent) + "\n").encode("ascii", "replace"), dtype=np.uint8)
+        ends = np.flatnonzero(buffer == 10)
+        starts = np.concatenate(([0], ends[:-1] + 1))
+        lengths = ends - starts
+
+        # Key dengan karakter non-angka atau terlalu pendek dilewati (kode tetap -1, tidak masuk analisis)
+        valid = lengths > tail
+        invalid_chars = np.flatnonzero((buffer - 48 > 9) & (buffer != 10))
+        if len(invalid_chars):
+            valid[np.searchsorted(ends, invalid_chars)] = False
+
+        # Satu matriks byte per panjang key (biasanya semua key sama panjang -> langsung reshape)
+        length_counts = np.bincount(lengths[valid])
+        for length in np.flatnonzero(length_counts).tolist():
+            if length_counts[length] == count:
+                rows = slice(None)
+                chars = buffer.reshape(count, length + 1)[:, :length]
+            else:
+                rows = np.flatnonzero(valid & (lengths == length))
+                chars = buffer[starts[rows, None] + np.arange(length)]
+
+            stop = length
+            for column, width in tail_widths:
+                columns[column][rows] = _number(chars, stop - width, stop)
+                stop -= width
+
+            # Lebar vervar per key: prefix yang cocok dengan kode vervar (kode terpanjang dulu)
+            vervar_widths = np.full(len(chars), widths[-1])
+            if len(widths) > 1:
+                matched = np.zeros(len(chars), dtype=bool)
+                for width in widths:
+                    if width < stop:
+                        hit = ~matched & np.isin(_number(chars, 0, width), codes[code_widths == width])
+                        vervar_widths[hit] = width
+                        matched |= hit
+
+            for width in widths:
+                subset = vervar_widths == width
+                if width >= stop or not subset.any():
+                    continue
+                if subset.all():
+                    target, part = rows, chars
+                else:
+                    target = np.flatnonzero(subset) if isinstance(rows, slice) else rows[subset]
+                    part = chars[subset]
+                columns["vervar"][target] = _number(part, 0, width)
+                columns["var"][target] = _number(part, width, stop)
+        return columns, values
+
+    @property
+    def frame(self):
+        """Tabel lengkap (DataFrame) termasuk label wilayah, dibuat sekali saat pertama dipakai"""
+        if self._frame is None:
+            self._frame = pd.DataFrame({**self.columns, "value": self.values, "wilayah": self._wilayah[self._wilayah_index]})
+        return self._frame
+
+    def mask(self, level="provinsi", tahun=None, turvar=None):
+        """
+        Baris yang dipakai analisis: nilai numerik, vervar berlabel, tanpa INDONESIA.
+        Level kabupaten: baris total provinsi (xx00) dibuang. tahun/turvar = kode BPS.
+        """
+        mask = self._analysis_rows["kabupaten" if level == "kabupaten" else "provinsi"] & ~np.isnan(self.values)
+        if tahun is not None:
+            mask &= self.columns["tahun"] == int(tahun)
+        if turvar is not None:
+            mask &= self.columns["turvar"] == int(turvar)
+        return mask
+
+    def select(self, level="provinsi", tahun=None, turvar=None):
+        """Potongan tabel (DataFrame) tanpa parse ulang"""
+        return self.frame[self.mask(level, tahun, turvar)]
+
+    def region_values(self, level="provinsi"):
+        """Nama wilayah (upper) -> nilai"""
+        rows = np.flatnonzero(self.mask(level))
+        rows = _last_rows(rows, self._wilayah_index[rows], len(self._wilayah))
+        return dict(zip(self._wilayah[self._wilayah_index[rows]], self.values[rows].tolist()))
+
+    def region_breakdown(self, level="provinsi"):
+        """
+        Nilai per turvar (mis. Laki-laki/Perempuan) per wilayah.
+        Returns: (wilayah -> rata-rata turvar dibulatkan 2 desimal, wilayah -> {label turvar: nilai})
+        """
+        rows = np.flatnonzero(self.mask(level))
+        codes, turvar_index = np.unique(self.columns["turvar"][rows], return_inverse=True)
+        turvar_names, name_of_code = np.unique(
+            np.array([self.turvar_labels.get(str(code), "Unknown") for code in codes.tolist()], dtype=object),
+            return_inverse=True
+        )
+        turvar_index = name_of_code[turvar_index]
+        groups = self._wilayah_index[rows] * len(turvar_names) + turvar_index
+        last = _last_rows(np.arange(len(rows)), groups, len(self._wilayah) * len(turvar_names))
+
+        details = {}
+        for wilayah, turvar, value in zip(
+            self._wilayah_index[rows[last]].tolist(), turvar_index[last].tolist(), self.values[rows[last]].tolist()
+        ):
+            details.setdefault(self._wilayah[wilayah], {})[turvar_names[turvar]] = value
+        values = {wilayah: round(sum(v.values()) / len(v), 2) for wilayah, v in details.items()}
+        return values, details
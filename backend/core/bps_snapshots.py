@@ -0,0 +1,161 @@
+import os
+import gzip
+import json
+import hashlib
+import shutil
+import itertools
+import tempfile
+import threading
+from datetime import datetime
+
+# Folder snapshot dataset BPS: <dir>/<versi>/<var>_<th>_<domain>.json.gz + manifest.json,
+# file CURRENT berisi versi aktif
+BPS_SNAPSHOT_DIR = os.getenv("BPS_SNAPSHOT_DIR") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bps_snapshots"
+)
+# Versi snapshot yang dipakai (kosong = CURRENT), untuk load test yang reproducible
+BPS_SNAPSHOT_VERSION = os.getenv("BPS_SNAPSHOT_VERSION", "")
+
+MANIFEST_NAME = "manifest.json"
+CURRENT_NAME = "CURRENT"
+PARTIAL_SUFFIX = ".partial"
+
+
+def _file_name(dataset):
+    return f"{dataset.var}_{dataset.th}_{dataset.domain}.json.gz"
+
+
+def _write_atomic(path, data):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+class SnapshotStore:
+    """Snapshot dataset BPS berversi di disk (JSON gzip, response asli BPS apa adanya)"""
+
+    def __init__(self, directory=BPS_SNAPSHOT_DIR, version=BPS_SNAPSHOT_VERSION):
+        self.directory = directory
+        self.pinned_version = version or None
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def versions(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if not name.endswith(PARTIAL_SUFFIX) and os.path.isfile(os.path.join(self.directory, name, MANIFEST_NAME))
+        )
+
+    def current_version(self):
+        if self.pinned_version:
+            return self.pinned_version
+        try:
+            with open(os.path.join(self.directory, CURRENT_NAME)) as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def manifest(self, version=None):
+        version = version or self.current_version()
+        if not version:
+            return None
+        try:
+            with open(os.path.join(self.directory, version, MANIFEST_NAME)) as f:
+                return json.load(f)
+        except OSError:
+            return None
+
+    def read(self, dataset, version=None):
+        """Dataset dari snapshot (versi aktif), di-cache di memori. None jika tidak ada."""
+        version = version or self.current_version()
+        if not version:
+            return None
+        key = (version, dataset)
+        data = self._loaded.get(key)
+        if data is None:
+            try:
+                with gzip.open(os.path.join(self.directory, version, _file_name(dataset)), 'rb') as f:
+                    data = json.loads(f.read().decode('utf-8'))
+            except OSError:
+                return None
+            with self._lock:
+                self._loaded[key] = data
+        return data
+
+    def _reserve_version(self):
+        """
+        Nama versi baru (waktu UTC per detik, akhiran -2, -3, ... jika detik yang sama sudah dipakai).
+        Folder staging dibuat dengan mkdir eksklusif sehingga dua proses tidak memakai versi yang sama.
+        Returns: (versi, folder staging)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        base = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        for attempt in itertools.count(1):
+            version = base if attempt == 1 else f"{base}-{attempt}"
+            staging = os.path.join(self.directory, version + PARTIAL_SUFFIX)
+            try:
+                os.mkdir(staging)
+            except FileExistsError:
+                continue
+            if os.path.exists(os.path.join(self.directory, version)):
+                os.rmdir(staging)
+                continue
+            return version, staging
+
+    def write(self, datasets, activate=True, carried=None, missing=()):
+        """
+        Tulis snapshot baru. datasets: list (BPSDataset, data JSON).
+        carried: dict BPSDataset -> versi asal untuk dataset yang dibawa dari snapshot lama,
+        missing: BPSDataset yang tidak ada sama sekali (dicatat di manifest)
+        Returns: manifest versi baru
+        """
+        carried = carried or {}
+        version, staging = self._reserve_version()
+
+        entries = []
+        for dataset, data in datasets:
+            body = json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+            compressed = gzip.compress(body, compresslevel=9)
+            _write_atomic(os.path.join(staging, _file_name(dataset)), compressed)
+            entry = {
+                "var": dataset.var, "th": dataset.th, "domain": dataset.domain,
+                "file": _file_name(dataset),
+                "sha256": hashlib.sha256(body).hexdigest(),
+                "bytes": len(body),
+                "compressed_bytes": len(compressed)
+            }
+            if dataset in carried:
+                entry["carried_from"] = carried[dataset]
+            entries.append(entry)
+
+        manifest = {
+            "version": version,
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "complete": not missing,
+            "datasets": entries,
+            "missing": [{"var": d.var, "th": d.th, "domain": d.domain} for d in missing]
+        }
+        _write_atomic(os.path.join(staging, MANIFEST_NAME), json.dumps(manifest, indent=2).encode('utf-8'))
+        os.replace(staging, os.path.join(self.directory, version))
+
+        if activate:
+            self.activate(version)
+        return manifest
+
+    def activate(self, version):
+        if not os.path.isfile(os.path.join(self.directory, version, MANIFEST_NAME)):
+            raise ValueError(f"Snapshot {version} tidak ditemukan")
+        _write_atomic(os.path.join(self.directory, CURRENT_NAME), version.encode('utf-8'))
+
+    def prune(self, keep):
+        """Hapus snapshot lama, sisakan `keep` versi terbaru (versi aktif tidak dihapus)"""
+        current = self.current_version()
+        removed = []
+        for version in self.versions()[:-keep] if keep > 0 else []:
+            if version != current:
+                shutil.rmtree(os.path.join(self.directory, version), ignore_errors=True)
+                removed.append(version)
+        return removed
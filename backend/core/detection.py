@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import math
+import numpy as np
+from PIL import Image
+from .geometry import (
+    DEFAULT_DETECTION_ZOOM, pack_rings, pixel_ring_areas_packed, meters_per_pixel, simplify_packed
+)
+
+# Ukuran input model YOLO
+DETECTION_SIZE = 640
+
+# Konfigurasi mini-batch untuk deteksi multi-tile
+DETECTION_BATCH_SIZE = int(os.getenv("DETECTION_BATCH_SIZE", 8))
+DETECTION_MAX_BATCH_SIZE = int(os.getenv("DETECTION_MAX_BATCH_SIZE", 32))
+DETECTION_MAX_TILES = int(os.getenv("DETECTION_MAX_TILES", 500))
+
+# Simplifikasi poligon (Douglas–Peucker), toleransi dalam meter (0 = nonaktif)
+SIMPLIFY_TOLERANCE_M = float(os.getenv("SIMPLIFY_TOLERANCE_M", 0.5))
+
+# Batas vertex per kategori, contoh: {"bangunan": 64, "default": 256}
+VERTEX_CAPS = json.loads(os.getenv("DETECTION_VERTEX_CAPS", "{}"))
+
+
+def vertex_cap(kategori):
+    """Batas jumlah vertex untuk satu kategori (None = tanpa batas)"""
+    return VERTEX_CAPS.get(kategori, VERTEX_CAPS.get("default"))
+
+
+def prepare_image(image_file):
+    """Buka gambar upload dan resize ke ukuran input model"""
+    img = Image.open(image_file)
+
+    if img.size != (DETECTION_SIZE, DETECTION_SIZE):
+        return img.resize((DETECTION_SIZE, DETECTION_SIZE), Image.LANCZOS)
+    return img
+
+
+def _to_numpy(values):
+    """Tensor torch (CPU/GPU) atau array -> numpy"""
+    if hasattr(values, 'cpu'):
+        values = values.cpu().numpy()
+    return np.asarray(values)
+
+
+def parse_result(result, lat, capture_size, selected_categories, simplify_tolerance_m=SIMPLIFY_TOLERANCE_M,
+                 zoom=DEFAULT_DETECTION_ZOOM):
+    """
+    Post-processing satu hasil prediksi YOLO, semua tetap dalam array NumPy.
+    Returns: dict {labels, confidence, coords, starts, counts, areas, simplification} untuk mask,
+             atau {labels, confidence, bbox} untuk fallback bounding box
+    """
+    scale = capture_size / DETECTION_SIZE
+    boxes = result.boxes
+
+    # Filter kelas sesuai kategori yang dipilih (satu operasi array)
+    label_lookup = np.array([str(result.names[i]).lower() for i in range(len(result.names))])
+    cls_idx = _to_numpy(boxes.cls).astype(np.int64)
+    keep = np.flatnonzero(np.isin(label_lookup[cls_idx], selected_categories))
+
+    parsed = {
+        "labels": label_lookup[cls_idx[keep]],
+        "confidence": np.round(_to_numpy(boxes.conf).astype(np.float64)[keep], 2)
+    }
+
+    if result.masks is not None:
+        # Semua mask digabung ke satu array, scaling & luas sekali jalan
+        coords, starts, counts = pack_rings([result.masks.xy[i] for i in keep])
+        coords *= scale
+        mpp = meters_per_pixel(lat, zoom)
+        areas = pixel_ring_areas_packed(coords, starts, counts) * mpp ** 2
+
+        # Simplifikasi setelah luas dihitung dari mask asli
+        caps = [vertex_cap(label) for label in parsed["labels"].tolist()]
+        if coords.size and (simplify_tolerance_m > 0 or any(caps)):
+            bytes_before = len(json.dumps(coords.tolist()))
+            vertices_before = len(coords)
+            coords, starts, counts = simplify_packed(coords, starts, counts, simplify_tolerance_m / mpp, caps)
+            parsed["simplification"] = {
+                "tolerance_m": simplify_tolerance_m,
+                "vertices_before": vertices_before,
+                "vertices_after": len(coords),
+                "bytes_saved": bytes_before - len(json.dumps(coords.tolist()))
+            }
+
+        parsed.update({
+            "coords": coords,
+            "starts": starts,
+            "counts": counts,
+            "areas": np.round(areas, 2)
+        })
+    else:
+        # Bounding box fallback
+        parsed["bbox"] = (_to_numpy(boxes.xyxy)[keep] * scale).astype(np.int64)
+
+    return parsed
+
+
+def serialize_detections(parsed, lat, lng, capture_size):
+    """Ubah hasil parse_result menjadi list dict JSON (list Python baru dibuat di sini)"""
+    detected_data = []
+    labels = parsed["labels"].tolist()
+    confidences = parsed["confidence"].tolist()
+
+    if "coords" in parsed:
+        segments = np.split(parsed["coords"], parsed["starts"][1:]) if len(labels) else []
+        areas = parsed["areas"].tolist()
+
+        for raw_label, confidence, segment, luas_m2 in zip(labels, confidences, segments, areas):
+            detected_data.append({
+                "nama": f"{raw_label.capitalize()} Terdeteksi",
+                "kategori": raw_label,
+                "segmentation": segment.tolist(),
+                "confidence_score": confidence,
+                "luas_m2": luas_m2,
+                "lat": lat,
+                "lng": lng,
+                "capture_size": capture_size
+            })
+    else:
+        for raw_label, confidence, bbox in zip(labels, confidences, parsed["bbox"].tolist()):
+            detected_data.append({
+                "nama": f"{raw_label.capitalize()} Terdeteksi",
+                "kategori": raw_label,
+                "bbox": bbox,
+                "confidence_score": confidence,
+                "lat": lat,
+                "lng": lng,
+                "capture_size": capture_size
+            })
+
+    return detected_data
+
+
+def process_results(results, lat, lng, capture_size, selected_categories, simplify_tolerance_m=SIMPLIFY_TOLERANCE_M):
+    """
+    Post-processing semua hasil prediksi satu tile.
+    Returns: (list objek terdeteksi, statistik {postprocess_ms, simplification})
+    """
+    started = time.perf_counter()
+    detected_data = []
+    simplification = {"tolerance_m": simplify_tolerance_m, "vertices_before": 0, "vertices_after": 0, "bytes_saved": 0}
+
+    for result in results:
+        parsed = parse_result(result, lat, capture_size, selected_categories, simplify_tolerance_m)
+        for key, value in parsed.get("simplification", {}).items():
+            if key != "tolerance_m":
+                simplification[key] += value
+        detected_data.extend(serialize_detections(parsed, lat, lng, capture_size))
+
+    return detected_data, {
+        "postprocess_ms": round((time.perf_counter() - started) * 1000, 3),
+        "simplification": simplification
+    }
+
+
+def tile_metadata(capture_size, stats=None):
+    """Metadata standar hasil deteksi satu tile"""
+    return {
+        "capture_size": capture_size,
+        "detection_size": DETECTION_SIZE,
+        "scale_factor": capture_size / DETECTION_SIZE,
+        **(stats or {})
+    }
+
+
+def detect_tiles(model, images, tiles, selected_categories, batch_size=DETECTION_BATCH_SIZE,
+                 simplify_tolerance_m=SIMPLIFY_TOLERANCE_M):
+    """
+    Jalankan deteksi untuk banyak tile dalam mini-batch.
+    images: list gambar PIL (sudah di-resize)
+    tiles: list dict {index, lat, lng, capture_size}, sejajar dengan images
+    Returns: list hasil per tile (urutan sama dengan input)
+    """
+    tile_results = []
+
+    for start in range(0, len(images), batch_size):
+        batch_images = images[start:start + batch_size]
+        batch_tiles = tiles[start:start + batch_size]
+
+        results = model.predict(source=batch_images, save=False, verbose=False)
+
+        for result, tile in zip(results, batch_tiles):
+            detected_data, stats = process_results(
+                [result], tile["lat"], tile["lng"], tile["capture_size"], selected_categories, simplify_tolerance_m
+            )
+            tile_results.append({
+                "index": tile["index"],
+                "status": "success",
+                "results": detected_data,
+                "metadata": tile_metadata(tile["capture_size"], stats)
+            })
+
+    return tile_results
+
+
+def run_batch(model, image_files, tiles, selected_categories, batch_size=DETECTION_BATCH_SIZE,
+              simplify_tolerance_m=SIMPLIFY_TOLERANCE_M):
+    """
+    Deteksi multi-tile + statistik throughput.
+    image_files: file gambar upload sejajar dengan tiles, di-decode per mini-batch (bukan sekaligus)
+    supaya memori hanya menampung satu mini-batch gambar. Tile yang gagal di-decode -> status error.
+    """
+    batch_size = max(1, min(int(batch_size), DETECTION_MAX_BATCH_SIZE))
+
+    started = time.perf_counter()
+    tile_results = []
+    for start in range(0, len(tiles), batch_size):
+        batch_images = []
+        batch_tiles = []
+        for image_file, tile in zip(image_files[start:start + batch_size], tiles[start:start + batch_size]):
+            try:
+                batch_images.append(prepare_image(image_file))
+                batch_tiles.append(tile)
+            except Exception as e:
+                # Tile rusak tidak menggagalkan seluruh batch
+                tile_results.append({"index": tile["index"], "status": "error", "error": str(e)})
+
+        if batch_images:
+            tile_results.extend(detect_tiles(
+                model, batch_images, batch_tiles, selected_categories, batch_size, simplify_tolerance_m
+            ))
+
+    elapsed = time.perf_counter() - started
+    detected = [t for t in tile_results if t["status"] == "success"]
+    postprocess_times = [t["metadata"]["postprocess_ms"] for t in detected]
+    bytes_saved = sum(t["metadata"]["simplification"]["bytes_saved"] for t in detected)
+
+    return tile_results, {
+        "total_tiles": len(tiles),
+        "total_batches": math.ceil(len(tiles) / batch_size),
+        "batch_size": batch_size,
+        "elapsed_seconds": round(elapsed, 3),
+        "tiles_per_second": round(len(tiles) / elapsed, 2) if elapsed > 0 else None,
+        "avg_postprocess_ms": round(sum(postprocess_times) / len(postprocess_times), 3) if postprocess_times else None,
+        "bytes_saved": bytes_saved
+    }
@@ -0,0 +1,329 @@
+import io
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from pymongo import MongoClient
+from dotenv import load_dotenv
+from .detection import (
+    DETECTION_BATCH_SIZE, DETECTION_MAX_TILES, SIMPLIFY_TOLERANCE_M, prepare_image, detect_tiles
+)
+from .model_registry import get_model
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+DB_MONGO_NAME = os.getenv("DB_MONGO_NAME")
+
+# Konfigurasi worker pool lokal
+DETECTION_JOB_WORKERS = int(os.getenv("DETECTION_JOB_WORKERS", 1))
+DETECTION_JOB_QUEUE_SIZE = int(os.getenv("DETECTION_JOB_QUEUE_SIZE", 16))
+# Total bytes gambar yang boleh tertahan di antrian (job yang sedang jalan ikut dihitung)
+DETECTION_JOB_QUEUE_MAX_BYTES = int(os.getenv("DETECTION_JOB_QUEUE_MAX_BYTES", 512 * 1024 * 1024))
+
+# Job queued/running dianggap yatim (proses pemiliknya mati/restart, antrian in-memory hilang)
+# jika heartbeat-nya lebih lama dari DETECTION_JOB_ORPHAN_AFTER detik
+DETECTION_JOB_HEARTBEAT = int(os.getenv("DETECTION_JOB_HEARTBEAT", 15))
+DETECTION_JOB_ORPHAN_AFTER = int(os.getenv("DETECTION_JOB_ORPHAN_AFTER", 120))
+# Bersihkan job yatim saat server start (tidak dijalankan untuk perintah manage.py lain)
+DETECTION_JOB_CLEANUP_ON_START = os.getenv("DETECTION_JOB_CLEANUP_ON_START", "True") == "True"
+ACTIVE_STATUSES = ["queued", "running"]
+
+# Koneksi MongoDB: state job di detection_jobs, hasil per tile di detection_job_results
+# (satu dokumen per (job_id, tile_index), supaya job besar tidak melewati batas 16 MB dokumen)
+# tz_aware: heartbeat_at dibaca kembali sebagai datetime UTC (sebanding dengan _now())
+client = MongoClient(MONGO_URI, tz_aware=True)
+mongo_db = client[DB_MONGO_NAME]
+jobs_collection = mongo_db["detection_jobs"]
+results_collection = mongo_db["detection_job_results"]
+
+# Antrian job terbatas (jumlah job & bytes gambar) + worker thread
+_job_queue = queue.Queue(maxsize=DETECTION_JOB_QUEUE_SIZE)
+_queued_bytes = 0
+_queue_lock = threading.Lock()
+_workers = []
+_workers_lock = threading.Lock()
+# Pemilik job di proses ini, diisi saat worker start (setelah fork worker server)
+_owner = None
+
+
+def _now():
+    """Satu jam untuk semua timestamp job: UTC, timezone-aware"""
+    return datetime.now(timezone.utc)
+
+
+class QueueFullError(Exception):
+    """Antrian job penuh, client harus mencoba lagi nanti"""
+    pass
+
+
+def _ensure_workers():
+    """Start worker thread (dan heartbeat) saat job pertama masuk"""
+    global _owner
+    with _workers_lock:
+        if _workers:
+            return
+        _owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        for i in range(max(1, DETECTION_JOB_WORKERS)):
+            worker = threading.Thread(target=_worker_loop, name=f"detection-worker-{i}", daemon=True)
+            worker.start()
+            _workers.append(worker)
+        threading.Thread(target=_heartbeat_loop, name="detection-heartbeat", daemon=True).start()
+
+
+def _heartbeat_loop():
+    """Perbarui heartbeat semua job aktif milik proses ini"""
+    while True:
+        time.sleep(DETECTION_JOB_HEARTBEAT)
+        try:
+            jobs_collection.update_many(
+                {"owner": _owner, "status": {"$in": ACTIVE_STATUSES}},
+                {"$set": {"heartbeat_at": _now()}}
+            )
+        except Exception as e:
+            print(f"⚠ Heartbeat job deteksi gagal: {str(e)}")
+
+
+def _enqueue(item, nbytes):
+    """Masukkan job ke antrian jika kuota jumlah job & bytes masih cukup"""
+    global _queued_bytes
+    with _queue_lock:
+        if _queued_bytes + nbytes > DETECTION_JOB_QUEUE_MAX_BYTES:
+            return False
+        try:
+            _job_queue.put_nowait(item)
+        except queue.Full:
+            return False
+        _queued_bytes += nbytes
+    return True
+
+
+def _drop_images(tiles):
+    """Lepas bytes gambar tile yang sudah diproses dari memori dan kuota antrian"""
+    global _queued_bytes
+    released = sum(len(tile.pop("image_bytes", None) or b"") for tile in tiles)
+    with _queue_lock:
+        _queued_bytes -= released
+
+
+def submit_job(tiles, selected_categories, batch_size=DETECTION_BATCH_SIZE,
+               simplify_tolerance_m=SIMPLIFY_TOLERANCE_M, user_id=None):
+    """
+    Masukkan job deteksi ke antrian.
+    tiles: list dict {index, lat, lng, capture_size, image_bytes}
+    Returns: job_id
+    Raises: QueueFullError jika antrian penuh
+    """
+    if len(tiles) > DETECTION_MAX_TILES:
+        raise ValueError(f"Maksimal {DETECTION_MAX_TILES} tile per job")
+    job_bytes = sum(len(tile["image_bytes"]) for tile in tiles)
+    if job_bytes > DETECTION_JOB_QUEUE_MAX_BYTES:
+        raise ValueError(f"Ukuran gambar job melebihi {DETECTION_JOB_QUEUE_MAX_BYTES} byte")
+
+    _ensure_workers()
+
+    job_id = str(uuid.uuid4())
+    job_document = {
+        "job_id": job_id,
+        "user_id": user_id,
+        "status": "queued",
+        "total_tiles": len(tiles),
+        "processed_tiles": 0,
+        "categories": selected_categories,
+        "batch_size": batch_size,
+        "simplify_tolerance_m": simplify_tolerance_m,
+        "image_bytes": job_bytes,
+        "error": None,
+        "owner": _owner,
+        "heartbeat_at": _now(),
+        "created_at": _now().isoformat(),
+        "started_at": None,
+        "finished_at": None
+    }
+    jobs_collection.insert_one(job_document)
+
+    if not _enqueue((job_id, tiles, selected_categories, batch_size, simplify_tolerance_m), job_bytes):
+        jobs_collection.update_one(
+            {"job_id": job_id},
+            {"$set": {"status": "rejected", "error": "Antrian penuh", "finished_at": _now().isoformat()}}
+        )
+        raise QueueFullError("Antrian deteksi penuh, coba lagi nanti")
+
+    return job_id
+
+
+def get_job(job_id, since=0):
+    """Ambil status job, hasil tile mulai dari index `since` (untuk polling bertahap)"""
+    job = jobs_collection.find_one({"job_id": job_id}, {"_id": 0})
+    if not job:
+        return None
+
+    # Job yang pemiliknya sudah mati diselesaikan di sini supaya polling tidak menunggu selamanya
+    if job["status"] in ACTIVE_STATUSES and _is_orphaned(job):
+        fail_orphaned_jobs({"job_id": job_id})
+        job = jobs_collection.find_one({"job_id": job_id}, {"_id": 0})
+    job.pop("heartbeat_at", None)
+
+    cursor = results_collection.find(
+        {"job_id": job_id, "tile_index": {"$gte": max(0, since)}},
+        {"_id": 0, "result": 1}
+    ).sort("tile_index", 1).limit(DETECTION_MAX_TILES)
+    job["results"] = [document["result"] for document in cursor]
+    return job
+
+
+def fail_orphaned_jobs(query=None):
+    """
+    Tandai gagal job queued/running yang tidak akan pernah selesai: heartbeat kedaluwarsa,
+    atau pemiliknya proses di host ini yang sudah tidak hidup (restart).
+    Returns: jumlah job yang ditandai gagal
+    """
+    cutoff = _now() - timedelta(seconds=DETECTION_JOB_ORPHAN_AFTER)
+    owners = [
+        owner for owner in jobs_collection.distinct("owner", {"status": {"$in": ACTIVE_STATUSES}, **(query or {})})
+        if _is_dead_local_owner(owner)
+    ]
+    result = jobs_collection.update_many(
+        {
+            **(query or {}),
+            "status": {"$in": ACTIVE_STATUSES},
+            "$or": [
+                {"heartbeat_at": {"$lt": cutoff}},
+                {"heartbeat_at": {"$exists": False}},
+                {"owner": {"$in": owners}}
+            ]
+        },
+        {"$set": {
+            "status": "failed",
+            "error": "Worker berhenti sebelum job selesai, kirim ulang job",
+            "finished_at": _now().isoformat()
+        }}
+    )
+    return result.modified_count
+
+
+def _is_orphaned(job):
+    heartbeat_at = job.get("heartbeat_at")
+    cutoff = _now() - timedelta(seconds=DETECTION_JOB_ORPHAN_AFTER)
+    return heartbeat_at is None or heartbeat_at < cutoff or _is_dead_local_owner(job.get("owner"))
+
+
+def _is_dead_local_owner(owner):
+    """Owner = host:pid:token; hanya proses di host ini yang bisa dicek langsung"""
+    try:
+        host, pid, _ = owner.rsplit(":", 2)
+        pid = int(pid)
+    except (AttributeError, ValueError):
+        return False
+    if host != socket.gethostname():
+        return False
+    if pid == os.getpid():
+        # pid sama dengan proses ini tapi token berbeda: proses lama sudah digantikan
+        return owner != _owner
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass
+    return False
+
+
+def fail_orphaned_jobs_in_background():
+    """Bersihkan job yatim saat startup tanpa menahan boot"""
+    def run():
+        try:
+            count = fail_orphaned_jobs()
+            if count:
+                print(f"⚠ {count} job deteksi yatim ditandai gagal")
+        except Exception as e:
+            print(f"⚠ Gagal membersihkan job deteksi yatim: {str(e)}")
+
+    thread = threading.Thread(target=run, name="detection-orphans", daemon=True)
+    thread.start()
+    return thread
+
+
+def queue_status():
+    """Info kapasitas antrian"""
+    return {
+        "queued": _job_queue.qsize(),
+        "capacity": DETECTION_JOB_QUEUE_SIZE,
+        "queued_bytes": _queued_bytes,
+        "max_bytes": DETECTION_JOB_QUEUE_MAX_BYTES,
+        "workers": len(_workers)
+    }
+
+
+def _worker_loop():
+    """Worker: ambil job dari antrian dan jalankan deteksi per mini-batch"""
+    while True:
+        job_id, tiles, selected_categories, batch_size, simplify_tolerance_m = _job_queue.get()
+        try:
+            _run_job(job_id, tiles, selected_categories, batch_size, simplify_tolerance_m)
+        except Exception as e:
+            print(f"Error job deteksi {job_id}: {str(e)}")
+            jobs_collection.update_one(
+                {"job_id": job_id},
+                {"$set": {"status": "failed", "error": str(e), "finished_at": _now().isoformat()}}
+            )
+        finally:
+            _drop_images(tiles)
+            _job_queue.task_done()
+
+
+def _run_job(job_id, tiles, selected_categories, batch_size, simplify_tolerance_m):
+    jobs_collection.update_one(
+        {"job_id": job_id},
+        {"$set": {"status": "running", "started_at": _now().isoformat()}}
+    )
+
+    model = get_model()
+    started = time.perf_counter()
+
+    for start in range(0, len(tiles), batch_size):
+        batch_tiles = []
+        batch_images = []
+        tile_results = []
+
+        chunk = tiles[start:start + batch_size]
+        for tile in chunk:
+            try:
+                batch_images.append(prepare_image(io.BytesIO(tile["image_bytes"])))
+                batch_tiles.append(tile)
+            except Exception as e:
+                tile_results.append({"index": tile["index"], "status": "error", "error": str(e)})
+
+        if batch_images:
+            tile_results.extend(detect_tiles(
+                model, batch_images, batch_tiles, selected_categories, batch_size, simplify_tolerance_m
+            ))
+        tile_results.sort(key=lambda t: t["index"])
+        _drop_images(chunk)
+
+        # Simpan progres per mini-batch (satu dokumen per tile) supaya client bisa polling hasil parsial
+        if tile_results:
+            results_collection.insert_many(
+                [{"job_id": job_id, "tile_index": result["index"], "result": result} for result in tile_results],
+                ordered=False
+            )
+        jobs_collection.update_one(
+            {"job_id": job_id},
+            {"$inc": {"processed_tiles": len(tile_results)}}
+        )
+
+    elapsed = time.perf_counter() - started
+    jobs_collection.update_one(
+        {"job_id": job_id},
+        {"$set": {
+            "status": "done",
+            "finished_at": _now().isoformat(),
+            "stats": {
+                "elapsed_seconds": round(elapsed, 3),
+                "tiles_per_second": round(len(tiles) / elapsed, 2) if elapsed > 0 else None
+            }
+        }}
+    )
@@ -0,0 +1,364 @@
+import numpy as np
+import shapely
+
+# Perhitungan geometri berbasis NumPy untuk banyak ring sekaligus
+# (operasi poligon eksak seperti irisan/gabungan lewat shapely).
+# Semua fungsi menerima list ring (tiap ring: [[x, y], ...] atau array (N, 2)).
+# Ring boleh tertutup (titik terakhir = titik pertama) atau terbuka,
+# sisi penutup selalu ikut dihitung.
+
+# Radius bumi rata-rata (IUGG) dalam meter
+EARTH_RADIUS = 6371008.8
+
+# Keliling ekuator Web Mercator, dipakai untuk estimasi meter per pixel
+EARTH_CIRCUMFERENCE = 40075016.686
+
+# Zoom default saat capture deteksi (asumsi zoom 18-20)
+DEFAULT_DETECTION_ZOOM = 19
+
+
+def pack_rings(rings):
+    """
+    Gabungkan list ring menjadi satu array koordinat.
+    Returns: (coords (N, 2), starts (R,), counts (R,))
+    """
+    arrays = [np.asarray(r, dtype=np.float64).reshape(-1, 2) for r in rings]
+    counts = np.array([len(a) for a in arrays], dtype=np.int64)
+    coords = np.concatenate(arrays) if arrays else np.empty((0, 2), dtype=np.float64)
+
+    starts = np.zeros(len(counts), dtype=np.int64)
+    if len(counts) > 1:
+        starts[1:] = np.cumsum(counts)[:-1]
+
+    return coords, starts, counts
+
+
+def _segment_sums(values, starts, counts):
+    """Jumlahkan values per ring (ring kosong = 0)"""
+    out = np.zeros(len(counts), dtype=np.float64)
+    valid = counts > 0
+    if values.size and valid.any():
+        out[valid] = np.add.reduceat(values, starts[valid])
+    return out
+
+
+def _next_index(starts, counts):
+    """Index titik berikutnya per vertex, titik terakhir kembali ke titik awal ring"""
+    next_idx = np.arange(1, int(counts.sum()) + 1)
+    valid = counts > 0
+    next_idx[starts[valid] + counts[valid] - 1] = starts[valid]
+    return next_idx
+
+
+def _localize(coords, starts, counts):
+    """Geser tiap ring ke titik pertamanya agar shoelace tetap presisi"""
+    if not coords.size:
+        return coords, np.empty((0, 2), dtype=np.float64)
+    origins = coords[starts[counts > 0]]
+    return coords - np.repeat(origins, counts[counts > 0], axis=0), origins
+
+
+def _shoelace(coords, starts, counts):
+    """
+    Luas bertanda dan momen centroid per ring (rumus Shoelace).
+    Returns: (signed_area, moment_x, moment_y) dalam koordinat lokal ring
+    """
+    next_idx = _next_index(starts, counts)
+    x, y = coords[:, 0], coords[:, 1]
+    xn, yn = x[next_idx], y[next_idx]
+    cross = x * yn - xn * y
+
+    signed_area = 0.5 * _segment_sums(cross, starts, counts)
+    moment_x = _segment_sums((x + xn) * cross, starts, counts) / 6.0
+    moment_y = _segment_sums((y + yn) * cross, starts, counts) / 6.0
+
+    signed_area[counts < 3] = 0.0
+    return signed_area, moment_x, moment_y
+
+
+def project_equal_area(lng_lat):
+    """Proyeksi Lambert Cylindrical Equal-Area (sferis), lng/lat derajat -> meter"""
+    lng_lat = np.asarray(lng_lat, dtype=np.float64).reshape(-1, 2)
+    x = EARTH_RADIUS * np.radians(lng_lat[:, 0])
+    y = EARTH_RADIUS * np.sin(np.radians(lng_lat[:, 1]))
+    return np.column_stack((x, y))
+
+
+def unproject_equal_area(xy):
+    """Invers proyeksi equal-area, meter -> lng/lat derajat"""
+    xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+    lng = np.degrees(xy[:, 0] / EARTH_RADIUS)
+    lat = np.degrees(np.arcsin(np.clip(xy[:, 1] / EARTH_RADIUS, -1.0, 1.0)))
+    return np.column_stack((lng, lat))
+
+
+def meters_per_pixel(lat, zoom=DEFAULT_DETECTION_ZOOM):
+    """Resolusi tile Web Mercator (meter/pixel) pada latitude & zoom tertentu"""
+    lat = np.asarray(lat, dtype=np.float64)
+    return EARTH_CIRCUMFERENCE * np.abs(np.cos(np.radians(lat))) / (256 * 2.0 ** zoom)
+
+
+def lnglat_to_pixel(lng_lat, zoom, tile_size=256):
+    """Koordinat lng/lat -> pixel global Web Mercator (XYZ) pada zoom tertentu"""
+    lng_lat = np.asarray(lng_lat, dtype=np.float64).reshape(-1, 2)
+    world_size = tile_size * 2.0 ** zoom
+    sin_lat = np.clip(np.sin(np.radians(lng_lat[:, 1])), -0.9999, 0.9999)
+
+    x = (lng_lat[:, 0] + 180.0) / 360.0 * world_size
+    y = (0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * np.pi)) * world_size
+    return np.column_stack((x, y))
+
+
+def pixel_to_lnglat(pixels, zoom, tile_size=256):
+    """Pixel global Web Mercator -> lng/lat derajat"""
+    pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+    world_size = tile_size * 2.0 ** zoom
+
+    lng = pixels[:, 0] / world_size * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi - 2 * np.pi * pixels[:, 1] / world_size)))
+    return np.column_stack((lng, lat))
+
+
+def pixel_ring_areas_packed(coords, starts, counts):
+    """Luas ring (hasil pack_rings) dalam pixel²"""
+    local, _ = _localize(coords, starts, counts)
+    signed_area, _, _ = _shoelace(local, starts, counts)
+    return np.abs(signed_area)
+
+
+def pixel_ring_areas(rings):
+    """Luas ring dalam pixel² (Shoelace, sisi penutup ikut dihitung)"""
+    return pixel_ring_areas_packed(*pack_rings(rings))
+
+
+def pixel_ring_areas_m2(rings, lat, zoom=DEFAULT_DETECTION_ZOOM):
+    """Luas ring segmentasi (koordinat pixel) dalam m²"""
+    return pixel_ring_areas(rings) * meters_per_pixel(lat, zoom) ** 2
+
+
+def geo_ring_areas(rings):
+    """Luas ring geografis [[lng, lat], ...] dalam m² (proyeksi equal-area)"""
+    coords, starts, counts = pack_rings(rings)
+    local, _ = _localize(project_equal_area(coords), starts, counts)
+    signed_area, _, _ = _shoelace(local, starts, counts)
+    return np.abs(signed_area)
+
+
+def geo_ring_perimeters(rings):
+    """Keliling ring geografis dalam meter (haversine, sisi penutup ikut dihitung)"""
+    coords, starts, counts = pack_rings(rings)
+    if not coords.size:
+        return np.zeros(len(counts), dtype=np.float64)
+
+    next_idx = _next_index(starts, counts)
+    lng, lat = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    dlng = lng[next_idx] - lng
+    dlat = lat[next_idx] - lat
+
+    h = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(lat[next_idx]) * np.sin(dlng / 2) ** 2
+    distances = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+    return _segment_sums(distances, starts, counts)
+
+
+def geo_ring_centroids(rings):
+    """Centroid ring geografis [[lng, lat], ...] (dihitung di ruang equal-area)"""
+    coords, starts, counts = pack_rings(rings)
+    centroids = np.full((len(counts), 2), np.nan)
+    if not coords.size:
+        return centroids
+
+    local, origins = _localize(project_equal_area(coords), starts, counts)
+    signed_area, moment_x, moment_y = _shoelace(local, starts, counts)
+
+    valid = counts > 0
+    nonzero = valid & (np.abs(signed_area) > 1e-9)
+
+    # Ring tanpa luas (garis/titik): pakai rata-rata vertex
+    mean_local = _segment_sums(local[:, 0], starts, counts), _segment_sums(local[:, 1], starts, counts)
+    cx = np.where(valid, mean_local[0] / np.maximum(counts, 1), np.nan)
+    cy = np.where(valid, mean_local[1] / np.maximum(counts, 1), np.nan)
+
+    safe_area = np.where(nonzero, signed_area, 1.0)
+    cx = np.where(nonzero, moment_x / safe_area, cx)
+    cy = np.where(nonzero, moment_y / safe_area, cy)
+
+    projected = np.column_stack((cx[valid], cy[valid])) + origins
+    centroids[valid] = unproject_equal_area(projected)
+    return centroids
+
+
+def geo_ring_metrics(rings):
+    """Luas (m²), keliling (m) dan centroid [lng, lat] untuk banyak ring sekaligus"""
+    return geo_ring_areas(rings), geo_ring_perimeters(rings), geo_ring_centroids(rings)
+
+
+def project_local_meters(lng_lat):
+    """Proyeksi equirectangular lokal (meter) di sekitar titik pertama, untuk toleransi jarak"""
+    lng_lat = np.asarray(lng_lat, dtype=np.float64).reshape(-1, 2)
+    if not lng_lat.size:
+        return lng_lat
+    lat0 = np.radians(lng_lat[0, 1])
+    x = EARTH_RADIUS * np.radians(lng_lat[:, 0] - lng_lat[0, 0]) * np.cos(lat0)
+    y = EARTH_RADIUS * np.radians(lng_lat[:, 1] - lng_lat[0, 1])
+    return np.column_stack((x, y))
+
+
+def _douglas_peucker(points, tolerance):
+    """Douglas–Peucker untuk polyline, return mask vertex yang dipertahankan"""
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+
+        a, b = points[start], points[end]
+        segment = points[start + 1:end] - a
+        direction = b - a
+        length = np.hypot(direction[0], direction[1])
+
+        if length == 0:
+            distances = np.hypot(segment[:, 0], segment[:, 1])
+        else:
+            distances = np.abs(direction[0] * segment[:, 1] - direction[1] * segment[:, 0]) / length
+
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    return keep
+
+
+def simplify_line_mask(points, tolerance):
+    """Simplifikasi polyline (titik ujung selalu dipertahankan), return mask vertex"""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) < 3 or tolerance <= 0:
+        return np.ones(len(points), dtype=bool)
+    return _douglas_peucker(points, tolerance)
+
+
+def _simplify_open_ring(points, tolerance):
+    """Simplifikasi ring tanpa titik penutup: dipecah di vertex terjauh dari titik awal"""
+    m = len(points)
+    if tolerance <= 0:
+        return np.ones(m, dtype=bool)
+
+    offsets = points - points[0]
+    split = int(np.argmax(np.hypot(offsets[:, 0], offsets[:, 1])))
+    if split == 0:
+        return np.ones(m, dtype=bool)
+
+    mask = np.zeros(m, dtype=bool)
+    mask[:split + 1] |= _douglas_peucker(points[:split + 1], tolerance)
+    mask[split:] |= _douglas_peucker(np.vstack((points[split:], points[:1])), tolerance)[:-1]
+    return mask
+
+
+def simplify_ring_mask(ring, tolerance, max_vertices=None):
+    """
+    Simplifikasi satu ring (Douglas–Peucker) + batas jumlah vertex opsional.
+    Returns: mask boolean vertex yang dipertahankan (ring tertutup tetap tertutup)
+    """
+    ring = np.asarray(ring, dtype=np.float64).reshape(-1, 2)
+    n = len(ring)
+    keep = np.ones(n, dtype=bool)
+
+    closed = n > 1 and np.array_equal(ring[0], ring[-1])
+    m = n - 1 if closed else n
+    if m <= 3:
+        return keep
+
+    points = ring[:m]
+    mask = _simplify_open_ring(points, tolerance)
+
+    if max_vertices and mask.sum() > max_vertices:
+        max_vertices = max(3, int(max_vertices))
+
+        # Naikkan toleransi bertahap sampai jumlah vertex masuk batas
+        extent = np.ptp(points, axis=0).max()
+        tol = tolerance if tolerance > 0 else extent * 1e-4
+        for _ in range(32):
+            tol *= 2
+            candidate = _simplify_open_ring(points, tol)
+            # Toleransi terlalu besar (ring runtuh), pakai mask terakhir yang masih poligon
+            if candidate.sum() < 3:
+                break
+            mask = candidate
+            if mask.sum() <= max_vertices:
+                break
+
+        # Fallback: sampling merata dari vertex yang tersisa
+        if mask.sum() > max_vertices:
+            kept = np.flatnonzero(mask)
+            picked = kept[np.linspace(0, len(kept) - 1, max_vertices).round().astype(np.int64)]
+            mask = np.zeros(m, dtype=bool)
+            mask[picked] = True
+
+    # Poligon minimal 3 vertex: tambah vertex terjauh dari garis dua vertex yang tersisa
+    if mask.sum() < 3:
+        kept = np.flatnonzero(mask)
+        a, b = points[kept[0]], points[kept[-1]]
+        offsets = points - a
+        direction = b - a
+        distances = np.abs(offsets[:, 0] * direction[1] - offsets[:, 1] * direction[0])
+        distances[kept] = -1
+        mask[int(np.argmax(distances))] = True
+
+    keep[:m] = mask
+    return keep
+
+
+def simplify_packed(coords, starts, counts, tolerance, max_vertices=None):
+    """
+    Simplifikasi banyak ring (hasil pack_rings) sekaligus.
+    max_vertices: None, angka, atau array batas per ring
+    Returns: (coords, starts, counts) baru
+    """
+    if not coords.size:
+        return coords, starts, counts
+
+    if max_vertices is None or np.isscalar(max_vertices):
+        max_vertices = [max_vertices] * len(counts)
+
+    keep = np.ones(len(coords), dtype=bool)
+    for start, count, cap in zip(starts, counts, max_vertices):
+        keep[start:start + count] = simplify_ring_mask(coords[start:start + count], tolerance, cap)
+
+    new_counts = _segment_sums(keep.astype(np.float64), starts, counts).astype(np.int64)
+    new_starts = np.zeros(len(new_counts), dtype=np.int64)
+    if len(new_counts) > 1:
+        new_starts[1:] = np.cumsum(new_counts)[:-1]
+
+    return coords[keep], new_starts, new_counts
+
+
+def simplify_geo_ring(ring, tolerance_m, max_vertices=None):
+    """Simplifikasi ring geografis [[lng, lat], ...] dengan toleransi dalam meter"""
+    ring = np.asarray(ring, dtype=np.float64).reshape(-1, 2)
+    if not ring.size:
+        return ring
+    return ring[simplify_ring_mask(project_local_meters(ring), tolerance_m, max_vertices)]
+
+
+def valid_polygon(ring):
+    """Ring -> Polygon shapely yang valid (bagian terbesar jika perbaikan memecah poligon)"""
+    polygon = shapely.Polygon(np.asarray(ring, dtype=np.float64).reshape(-1, 2))
+    if polygon.is_valid:
+        return polygon
+    fixed = polygon.buffer(0)
+    parts = list(getattr(fixed, "geoms", [fixed]))
+    return max(parts, key=lambda part: part.area) if parts else polygon
+
+
+def polygons_iou(polygons_a, polygons_b):
+    """IoU eksak berpasangan (luas irisan / luas gabungan) untuk array Polygon shapely"""
+    inter = shapely.area(shapely.intersection(polygons_a, polygons_b))
+    union = shapely.area(shapely.union(polygons_a, polygons_b))
+    return np.divide(inter, union, out=np.zeros_like(inter, dtype=np.float64), where=union > 0)
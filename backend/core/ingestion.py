@@ -0,0 +1,214 @@
+import csv
+import io
+import os
+import pandas as pd
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+# Batas upload file analisis (byte & jumlah baris data)
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", 50 * 1024 * 1024))
+UPLOAD_MAX_ROWS = int(os.getenv("UPLOAD_MAX_ROWS", 200000))
+# Engine CSV: auto (polars jika terpasang) | polars | pandas
+UPLOAD_CSV_ENGINE = os.getenv("UPLOAD_CSV_ENGINE", "auto")
+
+# Sampel awal untuk deteksi separator & header
+SNIFF_BYTES = 64 * 1024
+CSV_DELIMITERS = [',', ';', '\t', '|']
+# Ukuran chunk parsing pandas (baris)
+CSV_CHUNK_ROWS = 50000
+
+
+class IngestionError(ValueError):
+    """File upload tidak bisa diproses; status = HTTP status untuk response"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _too_many_rows():
+    return IngestionError(f"File melebihi batas {UPLOAD_MAX_ROWS} baris data", status=413)
+
+
+def sniff_csv(sample):
+    """Deteksi separator & ada/tidaknya header dari potongan awal file. Returns: (sep, has_header)"""
+    text = sample.decode('utf-8-sig', errors='ignore')
+    # Baris terakhir sampel bisa terpotong
+    lines = text.splitlines()[:-1] if len(sample) >= SNIFF_BYTES else text.splitlines()
+    lines = [line for line in lines if line.strip()]
+    text = '\n'.join(lines)
+    if not text:
+        return ',', True
+
+    sniffer = csv.Sniffer()
+    try:
+        sep = sniffer.sniff(text, delimiters=''.join(CSV_DELIMITERS)).delimiter
+    except csv.Error:
+        # Fallback: separator yang paling konsisten jumlahnya per baris
+        counts = {d: [line.count(d) for line in lines[:50]] for d in CSV_DELIMITERS}
+        sep = max(CSV_DELIMITERS, key=lambda d: (min(counts[d] or [0]), sum(counts[d])))
+
+    # Baris pertama dianggap header (seperti header=0 sebelumnya), kecuali jelas baris data:
+    # semua selnya angka dan Sniffer juga menilai file tanpa header. Header berisi kolom tahun
+    # ("Provinsi,2019,2020") tetap header.
+    first_row = next(csv.reader([lines[0]], delimiter=sep), [])
+    cells = [cell for cell in first_row if cell.strip()]
+    has_header = True
+    if cells and all(_is_number(cell) for cell in cells):
+        try:
+            has_header = sniffer.has_header(text)
+        except csv.Error:
+            pass
+    return sep, has_header
+
+
+def _is_number(value):
+    try:
+        float(str(value).strip().replace(',', '.'))
+        return True
+    except ValueError:
+        return False
+
+
+def _default_columns(count):
+    return [f"KOLOM_{i + 1}" for i in range(count)]
+
+
+def _cast_column(series):
+    """
+    Kolom teks -> Int64/Float64 jika semua nilai terisi berupa angka, selain itu tetap teks
+    (seperti pandas: nilai non-angka tidak pernah diubah jadi null diam-diam)
+    """
+    values = series.str.strip_chars()
+    for dtype in (pl.Int64, pl.Float64):
+        try:
+            return values.cast(dtype, strict=True)
+        except pl.exceptions.InvalidOperationError:
+            continue
+    return series
+
+
+def _read_csv_polars(file, sep, has_header):
+    source = file.temporary_file_path() if hasattr(file, 'temporary_file_path') else io.BytesIO(file.read())
+    # Semua kolom dibaca sebagai teks lalu di-cast eksplisit per kolom
+    frame = pl.read_csv(
+        source,
+        separator=sep,
+        has_header=has_header,
+        n_rows=UPLOAD_MAX_ROWS + 1,
+        encoding='utf8-lossy',
+        infer_schema=False,
+        truncate_ragged_lines=True
+    )
+    if frame.height > UPLOAD_MAX_ROWS:
+        raise _too_many_rows()
+    # Konversi kolom per kolom (tanpa pyarrow)
+    df = pd.DataFrame({name: _cast_column(series).to_numpy() for name, series in zip(frame.columns, frame.get_columns())})
+    if not has_header:
+        df.columns = _default_columns(len(df.columns))
+    return df
+
+
+def _read_csv_pandas(file, sep, has_header):
+    chunks = []
+    total = 0
+    reader = pd.read_csv(
+        file,
+        sep=sep,
+        header=0 if has_header else None,
+        encoding='utf-8-sig',
+        encoding_errors='replace',
+        chunksize=CSV_CHUNK_ROWS
+    )
+    with reader:
+        for chunk in reader:
+            total += len(chunk)
+            if total > UPLOAD_MAX_ROWS:
+                raise _too_many_rows()
+            chunks.append(chunk)
+    if not chunks:
+        return pd.DataFrame()
+    df = pd.concat(chunks, ignore_index=True)
+    if not has_header:
+        df.columns = _default_columns(len(df.columns))
+    return df
+
+
+def read_csv_upload(file):
+    """CSV upload -> DataFrame: sniff dari 64 KB pertama, parse sekali (polars atau pandas per chunk)"""
+    sample = file.read(SNIFF_BYTES)
+    file.seek(0)
+    sep, has_header = sniff_csv(sample)
+
+    engine = UPLOAD_CSV_ENGINE
+    if engine == "auto":
+        engine = "polars" if pl is not None else "pandas"
+    if engine == "polars" and pl is not None:
+        df = _read_csv_polars(file, sep, has_header)
+    else:
+        df = _read_csv_pandas(file, sep, has_header)
+
+    print(f"Ingestion CSV ({engine}, sep={sep!r}, header={has_header}): {len(df)} baris")
+    return df
+
+
+def read_xlsx_upload(file):
+    """XLSX upload -> DataFrame lewat openpyxl read-only (baris di-stream, bukan seluruh workbook)"""
+    if openpyxl is None:
+        raise IngestionError("openpyxl belum terpasang, file XLSX tidak bisa dibaca", status=500)
+
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = None
+        records = []
+        for row in rows:
+            if header is None:
+                # Baris kosong di atas tabel dilewati, baris pertama berisi = header
+                if any(cell is not None and str(cell).strip() for cell in row):
+                    header = [str(cell).strip() if cell is not None else f"KOLOM_{i + 1}" for i, cell in enumerate(row)]
+                continue
+            if not any(cell is not None for cell in row):
+                continue
+            records.append(row)
+            if len(records) > UPLOAD_MAX_ROWS:
+                raise _too_many_rows()
+    finally:
+        workbook.close()
+
+    if header is None:
+        return pd.DataFrame()
+    width = len(header)
+    df = pd.DataFrame([tuple(r[:width]) + (None,) * (width - len(r)) for r in records], columns=header)
+    print(f"Ingestion XLSX (read-only): {len(df)} baris")
+    return df
+
+
+def read_upload(file):
+    """File upload analisis (CSV/XLSX/XLS) -> DataFrame dengan batas ukuran & baris"""
+    if file.size is not None and file.size > UPLOAD_MAX_BYTES:
+        raise IngestionError(f"File melebihi batas {UPLOAD_MAX_BYTES // (1024 * 1024)} MB", status=413)
+
+    filename = file.name.lower()
+    if filename.endswith('.xlsx'):
+        df = read_xlsx_upload(file)
+    elif filename.endswith('.xls'):
+        # Format lama tidak mendukung mode streaming
+        df = pd.read_excel(file, nrows=UPLOAD_MAX_ROWS + 1)
+        if len(df) > UPLOAD_MAX_ROWS:
+            raise _too_many_rows()
+    elif filename.endswith('.csv'):
+        df = read_csv_upload(file)
+    else:
+        raise IngestionError("Format file tidak didukung. Gunakan CSV atau XLSX")
+
+    df.columns = [str(col).lstrip('\ufeff') for col in df.columns]
+    return df
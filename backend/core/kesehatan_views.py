@@ -1,11 +1,21 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from pymongo import MongoClient
-import requests
 import uuid
-from datetime import datetime
+import json
+import zlib
+import hashlib
+import threading
+from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
+from .boundary_registry import registry as boundary_registry, analysis_params
+from .bps_client import (
+    client as bps_client, dataset_for, parse_domains, parse_flag, merge_datasets, vervar_codes,
+    BPS_NATIONAL_DOMAIN, BPS_CACHE_TTL
+)
+from .bps_datacontent import DataContent
+from .streaming import json_stream_response
 
 load_dotenv()
 
@@ -13,6 +23,12 @@ MONGO_URI = os.getenv("MONGO_URI")
 DB_MONGO_NAME = os.getenv("DB_MONGO_NAME")
 BPS_API_KEY = os.getenv("BPS_WEB_API_KEY")
 
+# Materialisasi indeks kesehatan level provinsi (dihitung ulang saat data BPS berubah)
+HEALTH_INDEX_MATERIALIZE = os.getenv("HEALTH_INDEX_MATERIALIZE", "True") == "True"
+HEALTH_INDEX_COLLECTION = "health_index"
+# Naikkan jika rumus/parse berubah agar materialisasi lama tidak dipakai
+HEALTH_INDEX_ALGORITHM = "ikk-2"
+
 # Koneksi MongoDB
 client = MongoClient(MONGO_URI)
 mongo_db = client[DB_MONGO_NAME]
@@ -21,7 +37,8 @@ mongo_db = client[DB_MONGO_NAME]
 # KONFIGURASI INDIKATOR KESEHATAN - MENGGUNAKAN DATA YANG DISEDIAKAN
 INDIKATOR_KESEHATAN = {
     "AHH": {
-        "url_template": "https://webapi.bps.go.id/v1/api/list/model/data/lang/ind/domain/0000/var/501/th/124/key/{key}/",
+        "var": 501,
+        "th": 124,
         "nama": "Angka Harapan Hidup",
         "satuan": "tahun",
         "threshold_baik": 72,      # > 72 tahun = baik
@@ -31,7 +48,8 @@ INDIKATOR_KESEHATAN = {
         "penjelasan": "Indikator utama kesehatan populasi yang mencerminkan kualitas layanan kesehatan, nutrisi, dan kondisi sanitasi"
     },
     "IMUNISASI": {
-        "url_template": "https://webapi.bps.go.id/v1/api/list/model/data/lang/ind/domain/0000/var/2280/th/124/key/{key}/",
+        "var": 2280,
+        "th": 124,
         "nama": "Cakupan Imunisasi Dasar Lengkap",
         "satuan": "%",
         "threshold_baik": 90,      # > 90% = baik
@@ -41,7 +59,8 @@ INDIKATOR_KESEHATAN = {
         "penjelasan": "Mencerminkan efektivitas program preventif kesehatan, terutama untuk melindungi bayi dan anak dari penyakit menular"
     },
     "SANITASI": {
-        "url_template": "https://webapi.bps.go.id/v1/api/list/model/data/lang/ind/domain/0000/var/847/th/125/key/{key}/",
+        "var": 847,
+        "th": 125,
         "nama": "Akses Sanitasi Layak",
         "satuan": "%",
         "threshold_baik": 85,      # > 85% = baik
@@ -62,34 +81,38 @@ class KesehatanAnalytics:
             "WASPADA": "#f59e0b",    # Kuning - perlu perhatian
             "STABIL": "#10b981"      # Hijau - kondisi baik
         }
+        self.cache_sources = {}
     
-    def fetch_all_data(self):
-        """Fetch semua data sekaligus dari BPS"""
-        all_data = {}
+    def fetch_all_data(self, level='provinsi', domains=None, var_overrides=None, force_refresh=False, offline=False):
+        """
+        Fetch semua indikator sekaligus (paralel, lewat klien & cache BPS bersama).
+        Sumber data per indikator (fresh/stale/network/error) dicatat di self.cache_sources.
+        Level kabupaten: data diambil per domain provinsi lalu digabung. Kode var tabel
+        kabupaten/kota bisa berbeda per domain, override lewat var_overrides {indikator: var}.
+        """
+        var_overrides = var_overrides or {}
+        if level != 'kabupaten':
+            domains = [BPS_NATIONAL_DOMAIN]
+            var_overrides = {}
+        
+        datasets = {
+            (indikator_key, domain): dataset_for(config, domain, var_overrides.get(indikator_key))
+            for indikator_key, config in INDIKATOR_KESEHATAN.items()
+            for domain in domains or []
+        }
+        sources = {}
+        responses = bps_client.fetch_many(datasets, force_refresh=force_refresh, sources=sources, offline=offline)
         
-        for indikator_key, config in INDIKATOR_KESEHATAN.items():
-            try:
-                url = config["url_template"].format(key=BPS_API_KEY)
-                print(f"Fetching {indikator_key}: {url}")
-                
-                response = requests.get(url, timeout=30)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    all_data[indikator_key] = data
-                    print(f"✓ {indikator_key}: Success")
-                else:
-                    print(f"✗ {indikator_key}: HTTP {response.status_code}")
-                    all_data[indikator_key] = None
-                    
-            except Exception as e:
-                print(f"✗ {indikator_key}: Error - {e}")
-                all_data[indikator_key] = None
+        all_data = {}
+        for indikator_key in INDIKATOR_KESEHATAN.keys():
+            parts = [responses[name] for name in datasets if name[0] == indikator_key]
+            all_data[indikator_key] = merge_datasets(parts) if level == 'kabupaten' else parts[0]
+            self.cache_sources[indikator_key] = sorted({sources[name] for name in datasets if name[0] == indikator_key})
         
         return all_data
     
-    def parse_province_data(self, raw_data, indikator_key):
-        """Parse data per provinsi dari response BPS"""
+    def parse_province_data(self, raw_data, indikator_key, level='provinsi'):
+        """Parse data per provinsi (atau kabupaten/kota) dari response BPS"""
         province_values = {}
         province_details = {}  # Menyimpan detail per gender untuk AHH
         
@@ -115,84 +138,15 @@ class KesehatanAnalytics:
             #   ]
             # }
             
-            datacontent = raw_data.get("datacontent", {})
-            vervar_list = raw_data.get("vervar", [])
-            turvar_list = raw_data.get("turvar", [])
-            
-            # Buat mapping kode provinsi ke nama
-            province_code_map = {}
-            for item in vervar_list:
-                code = str(item.get("val", ""))
-                label = item.get("label", "")
-                if code and label and code != "9999":  # Skip INDONESIA
-                    province_code_map[code] = label
-            
-            # Buat mapping turvar (untuk gender di AHH)
-            turvar_map = {}
-            for item in turvar_list:
-                code = str(item.get("val", ""))
-                label = item.get("label", "")
-                turvar_map[code] = label
-            
-            # Temporary storage untuk menampung data per gender
-            temp_data = {}
-            
-            # Parse datacontent
-            # Key format contoh: "15005012121240" 
-            # - 4 digit pertama = kode provinsi (1500)
-            # - sisanya = var + turvar + tahun + 0
+            # datacontent di-decode sekali menjadi tabel kolom (vervar, var, turvar, tahun, value)
+            table = DataContent(raw_data)
             
-            for key, value in datacontent.items():
-                try:
-                    # Ambil 4 digit pertama sebagai kode provinsi
-                    prov_code = key[:4]
-                    
-                    # Skip INDONESIA (9999)
-                    if prov_code == "9999":
-                        continue
-                    
-                    # Cari nama provinsi
-                    provinsi_name = province_code_map.get(prov_code)
-                    
-                    if provinsi_name and value is not None:
-                        provinsi_clean = str(provinsi_name).upper().strip()
-                        value_float = float(value)
-                        
-                        # Untuk AHH yang ada turvar (Laki-laki/Perempuan)
-                        if turvar_map:
-                            # Ada turvar, berarti ada breakdown per gender
-                            # Extract turvar code (digit ke-8)
-                            try:
-                                turvar_code = key[7:8]  # Posisi turvar dalam key
-                                gender_label = turvar_map.get(turvar_code, "Unknown")
-                                
-                                if provinsi_clean not in temp_data:
-                                    temp_data[provinsi_clean] = {}
-                                
-                                temp_data[provinsi_clean][gender_label] = value_float
-                            except:
-                                # Fallback jika parsing turvar gagal
-                                if provinsi_clean in province_values:
-                                    province_values[provinsi_clean] = (province_values[provinsi_clean] + value_float) / 2
-                                else:
-                                    province_values[provinsi_clean] = value_float
-                        else:
-                            # Tidak ada turvar, langsung assign
-                            province_values[provinsi_clean] = value_float
-                        
-                except (ValueError, TypeError, IndexError) as e:
-                    continue
-            
-            # Hitung rata-rata untuk data yang punya breakdown gender
-            if temp_data:
-                for prov, gender_data in temp_data.items():
-                    # Simpan detail per gender
-                    province_details[prov] = gender_data
-                    
-                    # Hitung rata-rata untuk nilai utama
-                    values = list(gender_data.values())
-                    if values:
-                        province_values[prov] = round(sum(values) / len(values), 2)
+            if table.turvar_labels:
+                # Ada turvar (breakdown per gender untuk AHH): nilai utama = rata-rata per turvar
+                province_values, province_details = table.region_breakdown(level)
+            else:
+                # Tidak ada turvar, langsung assign
+                province_values = table.region_values(level)
             
             print(f"  Parsed {len(province_values)} provinces for {indikator_key}")
             if province_details:
@@ -381,105 +335,31 @@ class KesehatanAnalytics:
             })
         
         return recommendations
-
-
-# MAPPING NAMA PROVINSI
-def normalize_province_name(name):
-    """Normalisasi nama provinsi untuk matching"""
-    if not isinstance(name, str):
-        name = str(name)
-    
-    name = name.upper().strip()
-    
-    # Mapping khusus untuk nama yang berbeda antara BPS dan boundary data
-    special_mappings = {
-        'DKI JAKARTA': 'JAKARTA',
-        'DAERAH KHUSUS IBUKOTA JAKARTA': 'JAKARTA',
-        'DKI': 'JAKARTA',
-        'YOGYAKARTA': 'DAERAH ISTIMEWA YOGYAKARTA',
-        'DIY': 'DAERAH ISTIMEWA YOGYAKARTA',
-        'D.I. YOGYAKARTA': 'DAERAH ISTIMEWA YOGYAKARTA',
-        'BANGKA BELITUNG': 'KEPULAUAN BANGKA BELITUNG',
-        'KEP. BANGKA BELITUNG': 'KEPULAUAN BANGKA BELITUNG',
-        'KEPULAUAN RIAU': 'KEPULAUAN RIAU',
-        'KEP. RIAU': 'KEPULAUAN RIAU',
-    }
-    
-    # Cek mapping khusus terlebih dahulu
-    for key, value in special_mappings.items():
-        if key in name:
-            return value
-    
-    # Singkatan umum
-    abbreviations = {
-        'KEP.': 'KEPULAUAN',
-        'KEP ': 'KEPULAUAN ',
-        'NTB': 'NUSA TENGGARA BARAT',
-        'NTT': 'NUSA TENGGARA TIMUR',
-    }
-    
-    for abbr, full in abbreviations.items():
-        if abbr in name:
-            name = name.replace(abbr, full)
-    
-    # Hapus prefix
-    prefixes = ['PROVINSI ', 'PROV. ', 'PROV ', 'DAERAH KHUSUS IBUKOTA ']
-    for prefix in prefixes:
-        if name.startswith(prefix):
-            name = name[len(prefix):]
-    
-    return name.strip()
-
-
-@api_view(['POST'])
-def analyze_health_bps(request):
-    """Analisis data kesehatan menggunakan BPS Web API dengan 3 indikator"""
-    
-    if not BPS_API_KEY:
-        return Response({
-            "error": "BPS Web API Key belum dikonfigurasi",
-            "message": "Silakan tambahkan BPS_WEB_API_KEY di file .env"
-        }, status=500)
     
-    try:
-        # Inisialisasi analytics
-        analytics = KesehatanAnalytics()
-        
-        print("=== Mulai fetch data dari BPS ===")
-        # Fetch semua data sekaligus
-        raw_data = analytics.fetch_all_data()
-        
-        # Parse data per provinsi untuk setiap indikator
-        print("\n=== Parse data per provinsi ===")
+    def parse_indicators(self, raw_data, level='provinsi'):
+        """
+        Parse beberapa indikator sekaligus.
+        Returns: (nilai per indikator, breakdown per indikator, nama wilayah -> kode vervar BPS)
+        """
         parsed_data = {}
         parsed_details = {}  # Untuk menyimpan breakdown per gender
-        for indikator_key in INDIKATOR_KESEHATAN.keys():
-            values, details = analytics.parse_province_data(
-                raw_data[indikator_key], 
-                indikator_key
-            )
+        region_codes = {}
+        for indikator_key, indikator_raw in raw_data.items():
+            values, details = self.parse_province_data(indikator_raw, indikator_key, level)
             parsed_data[indikator_key] = values
             if details:
                 parsed_details[indikator_key] = details
-        
-        # Ambil data batas provinsi dari MongoDB
-        print("\n=== Load boundary data ===")
-        cursor = mongo_db["batas_provinsi"].find({}, {'_id': 0})
-        boundary_features = list(cursor)
-        
-        # Buat mapping nama provinsi ke boundary
-        province_map = {}
-        for feature in boundary_features:
-            props = feature.get('properties', {})
-            for field in ['NAMOBJ', 'name', 'WADMPR', 'Provinsi']:
-                if field in props and props[field]:
-                    official_name = str(props[field]).upper().strip()
-                    normalized = normalize_province_name(official_name)
-                    province_map[normalized] = feature
-                    # Simpan juga versi asli untuk partial matching
-                    province_map[official_name] = feature
-        
-        print(f"Loaded {len(province_map)} province boundaries")
+            region_codes.update(vervar_codes(indikator_raw, level))
+        return parsed_data, parsed_details, region_codes
+    
+    def analyze_regions(self, parsed_data, region_codes, boundary_layer, level='provinsi', previous=None):
+        """
+        Indeks, kategori, insight & rekomendasi per wilayah (tanpa geometri).
+        previous: {nama wilayah: (key fitur, analisis)} hasil sebelumnya, dipakai ulang
+        untuk wilayah yang datanya tidak berubah.
+        """
+        wilayah = 'kabupaten/kota' if level == 'kabupaten' else 'provinsi'
+        previous = previous or {}
         
         # Kumpulkan semua nama provinsi unik dari data BPS
         all_provinces = set()
@@ -488,84 +368,73 @@ def analyze_health_bps(request):
         
         print(f"\n=== Processing {len(all_provinces)} provinces ===")
         
-        # Proses analisis per provinsi
-        matched_features = []
+        # Proses analisis per provinsi: hasil (key fitur, analisis), geometri ditempel saat response
+        matched_results = []
         analysis_summary = []
         kategori_counts = {"KRITIS": 0, "WASPADA": 0, "STABIL": 0}
+        reused = 0
         
         for prov_name in sorted(all_provinces):
             # Kumpulkan data kesehatan untuk provinsi ini
             data_kesehatan = {}
             for indikator_key in INDIKATOR_KESEHATAN.keys():
-                value = parsed_data[indikator_key].get(prov_name)
+                value = parsed_data.get(indikator_key, {}).get(prov_name)
                 data_kesehatan[indikator_key] = value
             
             # Skip jika tidak ada data sama sekali
             if not any(v is not None for v in data_kesehatan.values()):
                 continue
             
-            # Cari matching boundary
-            normalized_prov = normalize_province_name(prov_name)
-            matched_feature = None
-            
-            # Exact match
-            if normalized_prov in province_map:
-                matched_feature = province_map[normalized_prov]
-            elif prov_name in province_map:
-                matched_feature = province_map[prov_name]
+            previous_result = previous.get(prov_name)
+            if previous_result is not None and previous_result[1]['data_kesehatan'] == data_kesehatan:
+                # Data wilayah tidak berubah: pakai hasil sebelumnya
+                feature_key, analysis = previous_result
+                reused += 1
             else:
-                # Partial match
-                for map_name, feature in province_map.items():
-                    if normalized_prov in map_name or map_name in normalized_prov:
-                        matched_feature = feature
-                        break
-            
-            if not matched_feature:
-                print(f"  ✗ {prov_name}: No boundary match")
-                continue
-            
-            # Hitung indeks kesehatan
-            health_index = analytics.calculate_health_index(data_kesehatan)
-            kategori, _ = analytics.categorize_province(health_index)
-            warna = analytics.colors[kategori]
-            
-            # Generate insights & recommendations
-            insights = analytics.generate_insights(prov_name, data_kesehatan, kategori, health_index)
-            recommendations = analytics.generate_recommendations(kategori, data_kesehatan)
+                # Cari matching boundary (nama exact, kode vervar, fuzzy)
+                match = boundary_layer.match(prov_name, region_codes.get(prov_name))
+                
+                if match is None:
+                    print(f"  ✗ {prov_name}: No boundary match")
+                    continue
+                
+                # Hitung indeks kesehatan
+                health_index = self.calculate_health_index(data_kesehatan)
+                kategori, _ = self.categorize_province(health_index)
+                
+                # Hasil analisis per wilayah (nama_provinsi dipertahankan untuk frontend, juga di level kabupaten)
+                feature_key = match.key
+                analysis = {
+                    'nama_provinsi': prov_name,
+                    'nama_resmi': match.name,
+                    'match_confidence': match.confidence,
+                    'kategori': kategori,
+                    'warna': self.colors[kategori],
+                    'health_index': health_index,
+                    'insights': self.generate_insights(prov_name, data_kesehatan, kategori, health_index),
+                    'rekomendasi': self.generate_recommendations(kategori, data_kesehatan),
+                    'data_kesehatan': data_kesehatan
+                }
+                print(f"  ✓ {prov_name}: {kategori} (Index: {health_index})")
             
             # Update counts
-            kategori_counts[kategori] += 1
-            
-            # Tambahkan ke feature
-            feature_copy = matched_feature.copy()
-            props = feature_copy.get('properties', {})
-            
-            props['health_analysis'] = {
-                'nama_provinsi': prov_name,
-                'kategori': kategori,
-                'warna': warna,
-                'health_index': health_index,
-                'insights': insights,
-                'rekomendasi': recommendations,
-                'data_kesehatan': data_kesehatan
-            }
-            
-            feature_copy['properties'] = props
-            matched_features.append(feature_copy)
+            kategori_counts[analysis['kategori']] += 1
+            matched_results.append((feature_key, analysis))
             
             # Tambahkan ke summary
             analysis_summary.append({
                 'provinsi': prov_name,
-                'kategori': kategori,
-                'warna': warna,
-                'health_index': health_index,
+                'kategori': analysis['kategori'],
+                'warna': analysis['warna'],
+                'health_index': analysis['health_index'],
                 'ahh': data_kesehatan.get('AHH'),
                 'imunisasi': data_kesehatan.get('IMUNISASI'),
                 'sanitasi': data_kesehatan.get('SANITASI'),
                 'matched': True
             })
-            
-            print(f"  ✓ {prov_name}: {kategori} (Index: {health_index})")
+        
+        if reused:
+            print(f"  {reused} {wilayah} tidak berubah, hasil sebelumnya dipakai ulang")
         
         # Generate rekomendasi nasional
         national_recommendations = []
@@ -573,8 +442,8 @@ def analyze_health_bps(request):
         if kategori_counts['KRITIS'] > 0:
             national_recommendations.append({
                 'priority': 'Darurat',
-                'title': 'Fokus Provinsi Kritis',
-                'content': f'Terdapat {kategori_counts["KRITIS"]} provinsi dalam kondisi KRITIS yang memerlukan intervensi segera.',
+                'title': 'Fokus Provinsi Kritis' if level == 'provinsi' else 'Fokus Kabupaten/Kota Kritis',
+                'content': f'Terdapat {kategori_counts["KRITIS"]} {wilayah} dalam kondisi KRITIS yang memerlukan intervensi segera.',
                 'actions': [
                     'Alokasi dana darurat kesehatan untuk provinsi kritis',
                     'Task force kesehatan nasional',
@@ -585,8 +454,8 @@ def analyze_health_bps(request):
         if kategori_counts['WASPADA'] > 0:
             national_recommendations.append({
                 'priority': 'Tinggi',
-                'title': 'Penguatan Provinsi Waspada',
-                'content': f'Terdapat {kategori_counts["WASPADA"]} provinsi dalam kondisi WASPADA.',
+                'title': 'Penguatan Provinsi Waspada' if level == 'provinsi' else 'Penguatan Kabupaten/Kota Waspada',
+                'content': f'Terdapat {kategori_counts["WASPADA"]} {wilayah} dalam kondisi WASPADA.',
                 'actions': [
                     'Program preventif kesehatan masyarakat',
                     'Monitoring dan evaluasi berkala',
@@ -600,6 +469,287 @@ def analyze_health_bps(request):
             key=lambda x: x['health_index']
         )[:5]  # Top 5 terburuk
         
+        return {
+            'total_provinces': len(all_provinces),
+            'matched_results': matched_results,
+            'analysis_summary': analysis_summary,
+            'kategori_counts': kategori_counts,
+            'national_recommendations': national_recommendations,
+            'worst_provinces': sorted_by_index
+        }
+
+
+def _dataset_digest(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+class HealthIndexMaterializer:
+    """
+    Hasil analisis kesehatan level provinsi yang dihitung sekali saat data BPS baru masuk
+    (listener BPSClient), disimpan berversi di MongoDB tanpa geometri. Endpoint analisis cukup
+    membaca dokumen ini. Hanya indikator yang sumbernya berubah (sha256 response) yang di-parse
+    ulang, dan wilayah yang datanya tidak berubah memakai hasil versi sebelumnya.
+    """
+
+    level = 'provinsi'
+
+    def __init__(self, collection, enabled=HEALTH_INDEX_MATERIALIZE):
+        self.collection = collection
+        self.enabled = enabled
+        self._current = None
+        self._pending = {}
+        self._worker = None
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+
+    def load(self):
+        """Dokumen materialisasi terbaru (di-cache per proses, dibaca ulang hanya jika versi berubah)"""
+        try:
+            head = self.collection.find_one({'_id': self.level}, {'payload': 0})
+            if not head:
+                return self._current
+            current = self._current
+            if current is not None and current['version'] == head['version']:
+                current['checked_at'] = head['checked_at']
+                return current
+            document = self.collection.find_one({'_id': self.level})
+        except Exception as e:
+            print(f"⚠ Materialisasi indeks kesehatan tidak bisa dibaca: {str(e)}")
+            return self._current
+        if not document:
+            return self._current
+
+        document.update(json.loads(zlib.decompress(document.pop('payload')).decode('utf-8')))
+        self._current = document
+        return document
+
+    def current(self, boundary_layer):
+        """Dokumen yang masih valid untuk algoritma & layer batas wilayah saat ini, atau None"""
+        document = self.load()
+        if (document is None or document['algorithm'] != HEALTH_INDEX_ALGORITHM
+                or document['boundary'] != boundary_layer.fingerprint()):
+            return None
+        return document
+
+    def is_stale(self, document):
+        """Sumber belum dicek ulang melewati TTL cache BPS"""
+        return datetime.utcnow() - document['checked_at'] > timedelta(seconds=BPS_CACHE_TTL)
+
+    def _save(self, document):
+        self._current = document
+        payload = {k: document[k] for k in ('parsed_data', 'parsed_details', 'region_codes', 'analysis')}
+        stored = {k: v for k, v in document.items() if k not in payload}
+        stored['payload'] = zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'), 6)
+        try:
+            self.collection.replace_one({'_id': self.level}, stored, upsert=True)
+        except Exception as e:
+            print(f"⚠ Materialisasi indeks kesehatan tidak tersimpan: {str(e)}")
+
+    def _touch(self, document, now):
+        document['checked_at'] = now
+        try:
+            self.collection.update_one({'_id': self.level}, {'$set': {'checked_at': now}})
+        except Exception as e:
+            print(f"⚠ Materialisasi indeks kesehatan tidak tersimpan: {str(e)}")
+
+    def update(self, raw_data, boundary_layer=None):
+        """
+        Terapkan data BPS baru {indikator: response}. Indikator yang belum pernah ada diambil
+        lewat klien BPS. Returns: dokumen materialisasi terbaru, atau None jika ada indikator
+        yang gagal diambil (dokumen lama & checked_at tidak diubah agar request berikutnya mencoba lagi)
+        """
+        with self._update_lock:
+            boundary_layer = boundary_layer or boundary_registry.layer(self.level)
+            fingerprint = boundary_layer.fingerprint()
+            previous = self.load()
+            reusable = previous is not None and previous['algorithm'] == HEALTH_INDEX_ALGORITHM
+            indicators = dict(previous['indicators']) if reusable else {}
+
+            raw_data = dict(raw_data)
+            missing = {
+                key: dataset_for(config) for key, config in INDIKATOR_KESEHATAN.items()
+                if key not in indicators and key not in raw_data
+            }
+            if missing:
+                raw_data.update(bps_client.fetch_many(missing))
+
+            failed = [
+                key for key in INDIKATOR_KESEHATAN
+                if (key in raw_data and raw_data[key] is None) or (key not in raw_data and key not in indicators)
+            ]
+            if failed:
+                print(f"⚠ Indeks kesehatan tidak dimaterialisasi, data BPS belum tersedia: {', '.join(failed)}")
+                return None
+
+            now = datetime.utcnow()
+            changed = {}
+            for key, data in raw_data.items():
+                if data is None or key not in INDIKATOR_KESEHATAN:
+                    continue
+                digest = _dataset_digest(data)
+                if indicators.get(key, {}).get('sha256') != digest:
+                    dataset = dataset_for(INDIKATOR_KESEHATAN[key])
+                    indicators[key] = {'sha256': digest, 'updated_at': now, 'var': dataset.var, 'th': dataset.th}
+                    changed[key] = data
+
+            if reusable and not changed and previous['boundary'] == fingerprint:
+                self._touch(previous, now)
+                return previous
+
+            analytics = KesehatanAnalytics()
+            parsed_data = dict(previous['parsed_data']) if reusable else {}
+            parsed_details = {k: v for k, v in previous['parsed_details'].items() if k not in changed} if reusable else {}
+            region_codes = dict(previous['region_codes']) if reusable else {}
+
+            print(f"\n=== Materialisasi indeks kesehatan: {', '.join(changed) or 'layer batas wilayah berubah'} ===")
+            new_data, new_details, new_codes = analytics.parse_indicators(changed, self.level)
+            parsed_data.update(new_data)
+            parsed_details.update(new_details)
+            region_codes.update(new_codes)
+
+            previous_results = None
+            if reusable and previous['boundary'] == fingerprint:
+                previous_results = {
+                    analysis['nama_provinsi']: (feature_key, analysis)
+                    for feature_key, analysis in previous['analysis']['matched_results']
+                }
+            analysis = analytics.analyze_regions(parsed_data, region_codes, boundary_layer, self.level, previous_results)
+
+            document = {
+                '_id': self.level,
+                'version': previous['version'] + 1 if previous else 1,
+                'algorithm': HEALTH_INDEX_ALGORITHM,
+                'boundary': fingerprint,
+                'computed_at': now,
+                'checked_at': now,
+                'indicators': indicators,
+                'parsed_data': parsed_data,
+                'parsed_details': parsed_details,
+                'region_codes': region_codes,
+                'analysis': analysis
+            }
+            self._save(document)
+            print(f"✓ Indeks kesehatan v{document['version']} dimaterialisasi ({len(analysis['matched_results'])} provinsi)")
+            return document
+
+    def schedule(self, key, data):
+        """Antre data indikator baru, diterapkan di thread background (beberapa indikator digabung)"""
+        with self._lock:
+            self._pending[key] = data
+            if self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._drain, name="health-index", daemon=True)
+            self._worker.start()
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                if not pending:
+                    self._worker = None
+                    return
+            try:
+                self.update(pending)
+            except Exception as e:
+                print(f"✗ Materialisasi indeks kesehatan gagal: {str(e)}")
+
+    def refresh_in_background(self):
+        """Cek ulang sumber BPS (lewat cache) lalu terapkan jika ada yang berubah"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.update(KesehatanAnalytics().fetch_all_data(self.level))
+            except Exception as e:
+                print(f"✗ Materialisasi indeks kesehatan gagal: {str(e)}")
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name="health-index-refresh", daemon=True).start()
+
+
+health_index = HealthIndexMaterializer(mongo_db[HEALTH_INDEX_COLLECTION])
+
+
+def _on_bps_dataset(dataset, data):
+    """Listener BPSClient: dataset nasional indikator kesehatan baru -> materialisasi ulang"""
+    for indikator_key, config in INDIKATOR_KESEHATAN.items():
+        if dataset == dataset_for(config):
+            health_index.schedule(indikator_key, data)
+
+
+if health_index.enabled:
+    bps_client.add_listener(_on_bps_dataset)
+
+
+@api_view(['POST'])
+def analyze_health_bps(request):
+    """Analisis data kesehatan menggunakan BPS Web API dengan 3 indikator"""
+    
+    # source=snapshot (atau BPS_OFFLINE_MODE): data hanya dari snapshot lokal, tanpa API key & jaringan
+    offline_only = bps_client.offline or request.data.get('source') == 'snapshot'
+    if not BPS_API_KEY and not offline_only:
+        return Response({
+            "error": "BPS Web API Key belum dikonfigurasi",
+            "message": "Silakan tambahkan BPS_WEB_API_KEY di file .env"
+        }, status=500)
+    
+    try:
+        # Level analisis: provinsi (default) atau kabupaten/kota per domain provinsi BPS
+        try:
+            level, band = analysis_params(request.data, request.query_params)
+            domains = parse_domains(request.data.get('domain')) if level == 'kabupaten' else None
+            var_overrides = request.data.get('vars') or {}
+            if not isinstance(var_overrides, dict):
+                raise ValueError("vars harus berupa object {indikator: var}")
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        wilayah = 'kabupaten/kota' if level == 'kabupaten' else 'provinsi'
+        force_refresh = parse_flag(request.data.get('force_refresh'))
+        
+        # Inisialisasi analytics
+        analytics = KesehatanAnalytics()
+        
+        # Ambil data batas wilayah dari registry (cache per proses)
+        print("\n=== Load boundary data ===")
+        boundary_layer = boundary_registry.layer(level)
+        
+        print(f"Loaded {len(boundary_layer.features)} {wilayah} boundaries")
+        
+        # Level provinsi standar: baca hasil materialisasi, dihitung ulang hanya saat data BPS berubah
+        materialized = None
+        raw_data = None
+        if health_index.enabled and level == 'provinsi' and not var_overrides and not force_refresh and not offline_only:
+            materialized = health_index.current(boundary_layer)
+            if materialized is None:
+                print("=== Materialisasi indeks kesehatan belum ada, fetch data dari BPS ===")
+                raw_data = analytics.fetch_all_data(level)
+                materialized = health_index.update(raw_data, boundary_layer)
+            elif health_index.is_stale(materialized):
+                health_index.refresh_in_background()
+        
+        if materialized is not None:
+            analysis = materialized['analysis']
+            parsed_data = materialized['parsed_data']
+            parsed_details = materialized['parsed_details']
+        else:
+            # Fetch semua data sekaligus (dipakai ulang jika sudah diambil untuk materialisasi)
+            if raw_data is None:
+                print(f"=== Mulai fetch data dari BPS (level {level}) ===")
+                raw_data = analytics.fetch_all_data(level, domains, var_overrides, force_refresh, offline_only)
+            
+            # Parse data per provinsi untuk setiap indikator
+            print("\n=== Parse data per provinsi ===")
+            parsed_data, parsed_details, region_codes = analytics.parse_indicators(raw_data, level)
+            analysis = analytics.analyze_regions(parsed_data, region_codes, boundary_layer, level)
+        
+        matched_results = analysis['matched_results']
+        kategori_counts = analysis['kategori_counts']
+        
         # Dokumentasi metodologi
         metodologi = {
             "judul": "Metodologi Perhitungan Indeks Kesehatan Komposit (IKK)",
@@ -675,23 +825,35 @@ def analyze_health_bps(request):
         }
         
         print(f"\n=== Analysis Complete ===")
-        print(f"Total matched: {len(matched_features)} provinces")
+        print(f"Total matched: {len(matched_results)} {wilayah}")
         print(f"Distribution: KRITIS={kategori_counts['KRITIS']}, WASPADA={kategori_counts['WASPADA']}, STABIL={kategori_counts['STABIL']}")
         
-        return Response({
+        features = boundary_layer.annotated_features(matched_results, 'health_analysis', band)
+        result = {
             'status': 'success',
             'source': 'BPS Web API - Direct Endpoints',
-            'total_provinces': len(all_provinces),
-            'total_matched': len(matched_features),
-            'total_success': len(matched_features),  # Untuk kompatibilitas dengan frontend
+            'level': level,
+            'bps_cache': {
+                'sources': analytics.cache_sources,
+                'stats': bps_client.cache.stats() if bps_client.cache else None,
+                'snapshot_version': bps_client.snapshots.current_version() if offline_only else None
+            },
+            'materialized': {
+                'version': materialized['version'],
+                'computed_at': materialized['computed_at'].isoformat() + 'Z',
+                'indicators': {k: v['updated_at'].isoformat() + 'Z' for k, v in materialized['indicators'].items()}
+            } if materialized is not None else None,
+            'total_provinces': analysis['total_provinces'],
+            'total_matched': len(matched_results),
+            'total_success': len(matched_results),  # Untuk kompatibilitas dengan frontend
             'kategori_distribusi': kategori_counts,
             'matched_features': {
                 "type": "FeatureCollection",
-                "features": matched_features
+                "features": features if level == 'kabupaten' else list(features)
             },
-            'analysis_summary': analysis_summary,
-            'national_recommendations': national_recommendations,
-            'worst_provinces': sorted_by_index,
+            'analysis_summary': analysis['analysis_summary'],
+            'national_recommendations': analysis['national_recommendations'],
+            'worst_provinces': analysis['worst_provinces'],
             'colors': analytics.colors,
             'indikator_info': {k: {
                 'nama': v['nama'],
@@ -712,7 +874,12 @@ def analyze_health_bps(request):
                 'IMUNISASI': parsed_data.get('IMUNISASI', {}),
                 'SANITASI': parsed_data.get('SANITASI', {})
             }
-        })
+        }
+        
+        # Level kabupaten (±514 wilayah): FeatureCollection di-stream per fitur
+        if level == 'kabupaten':
+            return json_stream_response(result)
+        return Response(result)
         
     except Exception as e:
         print(f"ERROR: {str(e)}")
@@ -0,0 +1,94 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bps_client import client as bps_client, dataset_for, parse_domains, BPS_NATIONAL_DOMAIN
+from core.kesehatan_views import INDIKATOR_KESEHATAN
+from core.pangan_views import INDIKATOR_PANGAN
+
+
+class Command(BaseCommand):
+    help = "Ambil dataset BPS yang dipakai analisis kesehatan & pangan lalu simpan sebagai snapshot berversi"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--domain", action="append", default=[],
+                            help="Domain BPS tambahan (mis. 3200 untuk kabupaten/kota Jawa Barat), bisa berulang")
+        parser.add_argument("--kabupaten", action="store_true",
+                            help="Sertakan semua domain provinsi (data kabupaten/kota)")
+        parser.add_argument("--keep", type=int, default=0,
+                            help="Sisakan N snapshot terbaru, sisanya dihapus (0 = tidak dihapus)")
+        parser.add_argument("--no-activate", action="store_true",
+                            help="Tulis snapshot tanpa menjadikannya versi aktif")
+        parser.add_argument("--allow-partial", action="store_true",
+                            help="Tetap aktifkan snapshot walau ada dataset yang gagal diambil "
+                                 "dan tidak ada di snapshot aktif sebelumnya")
+        parser.add_argument("--list", action="store_true", help="Tampilkan snapshot yang ada")
+
+    def handle(self, *args, **options):
+        store = bps_client.snapshots
+
+        if options["list"]:
+            current = store.current_version()
+            for version in store.versions():
+                manifest = store.manifest(version) or {}
+                marker = "*" if version == current else " "
+                self.stdout.write(f"{marker} {version}  {len(manifest.get('datasets', []))} dataset")
+            return
+
+        domains = [BPS_NATIONAL_DOMAIN]
+        if options["kabupaten"]:
+            domains += parse_domains(None)
+        elif options["domain"]:
+            domains += parse_domains(options["domain"])
+
+        configs = {**INDIKATOR_KESEHATAN, **INDIKATOR_PANGAN}
+        datasets = {
+            f"{name}@{domain}": dataset_for(config, domain)
+            for domain in dict.fromkeys(domains)
+            for name, config in configs.items()
+        }
+        if not bps_client.api_key:
+            raise CommandError("BPS_WEB_API_KEY belum di-set")
+
+        self.stdout.write(f"Mengambil {len(datasets)} dataset BPS...")
+        # Deadline diperlebar: satu dataset per domain provinsi
+        responses = bps_client.fetch_many(
+            datasets, deadline=bps_client.deadline * max(1, len(domains) // 4), force_refresh=True
+        )
+
+        fetched = [(datasets[name], data) for name, data in responses.items() if data is not None]
+        failed = sorted(name for name, data in responses.items() if data is None)
+        if not fetched:
+            raise CommandError("Tidak ada dataset yang berhasil diambil, snapshot tidak dibuat")
+
+        # Dataset yang gagal diambil dibawa dari snapshot aktif supaya snapshot baru tetap lengkap
+        previous = store.current_version()
+        carried, missing = {}, []
+        for name in failed:
+            data = store.read(datasets[name], previous) if previous else None
+            if data is None:
+                missing.append(name)
+                continue
+            fetched.append((datasets[name], data))
+            carried[datasets[name]] = previous
+            self.stderr.write(f"⚠ {name}: gagal diambil, dipakai dari snapshot {previous}")
+        for name in missing:
+            self.stderr.write(f"✗ {name}: gagal diambil, tidak ada di snapshot sebelumnya")
+
+        # Snapshot tidak lengkap tidak menggantikan versi aktif kecuali diminta eksplisit
+        activate = not options["no_activate"] and (not missing or options["allow_partial"])
+        manifest = store.write(
+            fetched, activate=activate, carried=carried, missing=[datasets[name] for name in missing]
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Snapshot {manifest['version']}: {len(fetched) - len(carried)}/{len(datasets)} dataset baru"
+            + (f", {len(carried)} dari {previous}" if carried else "")
+            + (" (aktif)" if activate else "")
+        ))
+        if missing and not activate and not options["no_activate"]:
+            raise CommandError(
+                f"Snapshot {manifest['version']} tidak lengkap ({len(missing)} dataset hilang) dan tidak diaktifkan. "
+                f"Jalankan ulang, atau aktifkan dengan --allow-partial"
+            )
+
+        if options["keep"] > 0:
+            for version in store.prune(options["keep"]):
+                self.stdout.write(f"Snapshot lama dihapus: {version}")
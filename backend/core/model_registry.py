@@ -0,0 +1,78 @@
+import os
+import threading
+import time
+from datetime import datetime
+from PIL import Image
+
+# Lokasi bobot model YOLO
+MODEL_PATH = os.path.join(os.path.dirname(__file__), 'ai_models', 'best.pt')
+
+# Warm-up otomatis saat worker start (khusus worker deteksi)
+YOLO_WARMUP = os.getenv("YOLO_WARMUP") == "True"
+
+# Satu instance model per proses
+_model = None
+_lock = threading.Lock()
+_status = {
+    "loaded": False,
+    "model_path": MODEL_PATH,
+    "load_seconds": None,
+    "warmup_seconds": None,
+    "loaded_at": None
+}
+
+
+def _load_model():
+    """Load bobot YOLO dan jalankan inferensi dummy untuk pre-warm"""
+    # Import ultralytics (dan torch) hanya ketika model benar-benar dibutuhkan
+    from ultralytics import YOLO
+    from .detection import DETECTION_SIZE
+
+    started = time.perf_counter()
+    model = YOLO(MODEL_PATH)
+    load_seconds = time.perf_counter() - started
+
+    # Inferensi dummy agar request pertama tidak menanggung inisialisasi
+    started = time.perf_counter()
+    dummy = Image.new('RGB', (DETECTION_SIZE, DETECTION_SIZE))
+    model.predict(source=dummy, save=False, verbose=False)
+    warmup_seconds = time.perf_counter() - started
+
+    _status.update({
+        "loaded": True,
+        "load_seconds": round(load_seconds, 3),
+        "warmup_seconds": round(warmup_seconds, 3),
+        "loaded_at": datetime.now().isoformat()
+    })
+    print(f"✓ Model YOLO dimuat dalam {load_seconds:.2f}s (warm-up {warmup_seconds:.2f}s)")
+
+    return model
+
+
+def get_model():
+    """Ambil model YOLO bersama, load saat pertama kali dipakai"""
+    global _model
+
+    if _model is None:
+        with _lock:
+            if _model is None:
+                _model = _load_model()
+    return _model
+
+
+def warm_up():
+    """Hook warm-up eksplisit, return status model"""
+    get_model()
+    return model_status()
+
+
+def warm_up_in_background():
+    """Warm-up di thread terpisah agar boot worker tidak tertahan"""
+    thread = threading.Thread(target=warm_up, name="yolo-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+def model_status():
+    """Status model untuk monitoring (load time, waktu warm-up)"""
+    return dict(_status)
@@ -0,0 +1,67 @@
+import os
+import threading
+from pymongo import MongoClient, ASCENDING, DESCENDING, GEOSPHERE
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+DB_MONGO_NAME = os.getenv("DB_MONGO_NAME")
+
+# Buat index otomatis saat aplikasi start
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "True") == "True"
+
+client = MongoClient(MONGO_URI)
+mongo_db = client[DB_MONGO_NAME]
+
+# Daftar index per koleksi: (keys, opsi)
+INDEXES = {
+    "ai_features": [
+        ([("feature_id", ASCENDING)], {"name": "feature_id_unique", "unique": True}),
+        # Keyset pagination feature_list
+        ([("created_at", DESCENDING), ("feature_id", DESCENDING)], {"name": "created_at_feature_id"}),
+        ([("kategori", ASCENDING), ("created_at", DESCENDING), ("feature_id", DESCENDING)], {"name": "kategori_created_at"}),
+        ([("user_id", ASCENDING), ("created_at", DESCENDING), ("feature_id", DESCENDING)], {"name": "user_id_created_at"}),
+        ([("confidence_score", ASCENDING)], {"name": "confidence_score"}),
+        # Sinkronisasi index deduplikasi antar proses
+        ([("updated_at", ASCENDING)], {"name": "updated_at"}),
+        ([("location", GEOSPHERE)], {"name": "location_2dsphere"}),
+    ],
+    "detection_jobs": [
+        ([("job_id", ASCENDING)], {"name": "job_id_unique", "unique": True}),
+        # Pembersihan job yatim (queued/running tanpa heartbeat baru)
+        ([("status", ASCENDING), ("heartbeat_at", ASCENDING)], {"name": "status_heartbeat_at"}),
+    ],
+    # Hasil job deteksi per tile, polling ?since=N
+    "detection_job_results": [
+        ([("job_id", ASCENDING), ("tile_index", ASCENDING)], {"name": "job_id_tile_index_unique", "unique": True}),
+    ],
+    # Cache hasil analisis: dokumen dihapus otomatis saat expires_at lewat
+    "analysis_cache": [
+        ([("expires_at", ASCENDING)], {"name": "expires_at_ttl", "expireAfterSeconds": 0}),
+    ],
+    # Cache dataset BPS: dihapus setelah batas stale maksimum
+    "bps_cache": [
+        ([("expires_at", ASCENDING)], {"name": "expires_at_ttl", "expireAfterSeconds": 0}),
+    ],
+}
+
+
+def ensure_indexes():
+    """Buat index yang dibutuhkan (idempotent, index yang sudah ada dilewati)"""
+    for collection_name, indexes in INDEXES.items():
+        collection = mongo_db[collection_name]
+        for keys, options in indexes:
+            try:
+                collection.create_index(keys, **options)
+            except Exception as e:
+                # Satu index gagal (mis. data lama tidak valid) tidak menghentikan yang lain
+                print(f"⚠ Gagal membuat index {collection_name}.{options.get('name')}: {str(e)}")
+    print("✓ Index MongoDB siap")
+
+
+def ensure_indexes_in_background():
+    """Jalankan ensure_indexes di thread terpisah agar startup tidak tertahan"""
+    thread = threading.Thread(target=ensure_indexes, name="mongo-indexes", daemon=True)
+    thread.start()
+    return thread
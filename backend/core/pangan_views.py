@@ -1,11 +1,16 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from pymongo import MongoClient
-import requests
 import uuid
 from datetime import datetime
 import os
 from dotenv import load_dotenv
+from .boundary_registry import registry as boundary_registry, analysis_params
+from .bps_client import (
+    client as bps_client, dataset_for, parse_domains, parse_flag, merge_datasets, vervar_codes
+)
+from .bps_datacontent import DataContent
+from .streaming import json_stream_response
 
 load_dotenv()
 
@@ -21,7 +26,8 @@ mongo_db = client[DB_MONGO_NAME]
 # KONFIGURASI INDIKATOR KETAHANAN PANGAN
 INDIKATOR_PANGAN = {
     "PREVALENSI_KETIDAKCUKUPAN": {
-        "url_template": "https://webapi.bps.go.id/v1/api/list/model/data/lang/ind/domain/0000/var/1473/th/125/key/{key}/",
+        "var": 1473,
+        "th": 125,
         "nama": "Prevalensi Ketidakcukupan Konsumsi Pangan",
         "satuan": "%",
         "penjelasan": "Persentase penduduk yang konsumsi pangannya di bawah kebutuhan minimum energi (2100 kkal/kapita/hari). Semakin tinggi nilai, semakin rentan ketahanan pangannya."
@@ -42,6 +48,7 @@ class PanganAnalytics:
             "TAHAN": "#10b981",             # Hijau - cukup baik
             "SANGAT TAHAN": "#059669"       # Hijau gelap - sangat baik
         }
+        self.cache_sources = []
         
         # Threshold berdasarkan standar FAO dan penelitian ketahanan pangan Indonesia
         # Prevalensi ketidakcukupan konsumsi pangan (lower is better)
@@ -53,30 +60,28 @@ class PanganAnalytics:
             # > 20% = sangat rentan (krisis pangan)
         }
     
-    def fetch_data_from_bps(self):
-        """Fetch data prevalensi ketidakcukupan konsumsi pangan dari BPS"""
+    def fetch_data_from_bps(self, level='provinsi', domains=None, var=None, force_refresh=False, offline=False):
+        """
+        Fetch data prevalensi ketidakcukupan konsumsi pangan dari BPS (klien & cache BPS bersama).
+        Level kabupaten: per domain provinsi secara paralel lalu digabung (var bisa di-override per request).
+        """
         config = INDIKATOR_PANGAN["PREVALENSI_KETIDAKCUKUPAN"]
         
-        try:
-            url = config["url_template"].format(key=BPS_API_KEY)
-            print(f"Fetching data: {url}")
-            
-            response = requests.get(url, timeout=30)
-            
-            if response.status_code == 200:
-                data = response.json()
-                print("✓ Data fetched successfully")
-                return data
-            else:
-                print(f"✗ HTTP {response.status_code}")
-                return None
-                
-        except Exception as e:
-            print(f"✗ Error: {e}")
-            return None
+        if level != 'kabupaten':
+            data, source = bps_client.get(dataset_for(config), force_refresh=force_refresh, offline=offline)
+            self.cache_sources = [source]
+            return data
+        
+        sources = {}
+        responses = bps_client.fetch_many(
+            {domain: dataset_for(config, domain, var) for domain in domains or []},
+            force_refresh=force_refresh, sources=sources, offline=offline
+        )
+        self.cache_sources = sorted(set(sources.values()))
+        return merge_datasets(list(responses.values()))
     
-    def parse_province_data(self, raw_data):
-        """Parse data per provinsi dari response BPS"""
+    def parse_province_data(self, raw_data, level='provinsi'):
+        """Parse data per provinsi (atau kabupaten/kota) dari response BPS"""
         province_values = {}
         
         if not raw_data:
@@ -84,37 +89,8 @@ class PanganAnalytics:
         
         try:
             # Format response BPS serupa dengan API lainnya
-            datacontent = raw_data.get("datacontent", {})
-            vervar_list = raw_data.get("vervar", [])
-            
-            # Buat mapping kode provinsi ke nama
-            province_code_map = {}
-            for item in vervar_list:
-                code = str(item.get("val", ""))
-                label = item.get("label", "")
-                if code and label and code != "9999":  # Skip INDONESIA
-                    province_code_map[code] = label
-            
-            # Parse datacontent
-            for key, value in datacontent.items():
-                try:
-                    # Ambil 4 digit pertama sebagai kode provinsi
-                    prov_code = key[:4]
-                    
-                    # Skip INDONESIA (9999)
-                    if prov_code == "9999":
-                        continue
-                    
-                    # Cari nama provinsi
-                    provinsi_name = province_code_map.get(prov_code)
-                    
-                    if provinsi_name and value is not None:
-                        provinsi_clean = str(provinsi_name).upper().strip()
-                        value_float = float(value)
-                        province_values[provinsi_clean] = value_float
-                        
-                except (ValueError, TypeError, IndexError) as e:
-                    continue
+            # datacontent di-decode sekali menjadi tabel kolom, baris INDONESIA & (level kabupaten) xx00 dibuang
+            province_values = DataContent(raw_data).region_values(level)
             
             print(f"  Parsed {len(province_values)} provinces")
             
@@ -327,70 +303,35 @@ class PanganAnalytics:
         return recommendations
 
 
-# MAPPING NAMA PROVINSI (sama seperti kesehatan_views.py)
-def normalize_province_name(name):
-    """Normalisasi nama provinsi untuk matching"""
-    if not isinstance(name, str):
-        name = str(name)
-    
-    name = name.upper().strip()
-    
-    # Mapping khusus
-    special_mappings = {
-        'DKI JAKARTA': 'JAKARTA',
-        'DAERAH KHUSUS IBUKOTA JAKARTA': 'JAKARTA',
-        'DKI': 'JAKARTA',
-        'YOGYAKARTA': 'DAERAH ISTIMEWA YOGYAKARTA',
-        'DIY': 'DAERAH ISTIMEWA YOGYAKARTA',
-        'D.I. YOGYAKARTA': 'DAERAH ISTIMEWA YOGYAKARTA',
-        'BANGKA BELITUNG': 'KEPULAUAN BANGKA BELITUNG',
-        'KEP. BANGKA BELITUNG': 'KEPULAUAN BANGKA BELITUNG',
-        'KEPULAUAN RIAU': 'KEPULAUAN RIAU',
-        'KEP. RIAU': 'KEPULAUAN RIAU',
-    }
-    
-    for key, value in special_mappings.items():
-        if key in name:
-            return value
-    
-    # Singkatan umum
-    abbreviations = {
-        'KEP.': 'KEPULAUAN',
-        'KEP ': 'KEPULAUAN ',
-        'NTB': 'NUSA TENGGARA BARAT',
-        'NTT': 'NUSA TENGGARA TIMUR',
-    }
-    
-    for abbr, full in abbreviations.items():
-        if abbr in name:
-            name = name.replace(abbr, full)
-    
-    # Hapus prefix
-    prefixes = ['PROVINSI ', 'PROV. ', 'PROV ', 'DAERAH KHUSUS IBUKOTA ']
-    for prefix in prefixes:
-        if name.startswith(prefix):
-            name = name[len(prefix):]
-    
-    return name.strip()
-
-
 @api_view(['POST'])
 def analyze_food_security_bps(request):
     """Analisis ketahanan pangan menggunakan BPS Web API"""
     
-    if not BPS_API_KEY:
+    # source=snapshot (atau BPS_OFFLINE_MODE): data hanya dari snapshot lokal, tanpa API key & jaringan
+    offline_only = bps_client.offline or request.data.get('source') == 'snapshot'
+    if not BPS_API_KEY and not offline_only:
         return Response({
             "error": "BPS Web API Key belum dikonfigurasi",
             "message": "Silakan tambahkan BPS_WEB_API_KEY di file .env"
         }, status=500)
     
     try:
+        # Level analisis: provinsi (default) atau kabupaten/kota per domain provinsi BPS
+        try:
+            level, band = analysis_params(request.data, request.query_params)
+            domains = parse_domains(request.data.get('domain')) if level == 'kabupaten' else None
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        wilayah = 'kabupaten/kota' if level == 'kabupaten' else 'provinsi'
+        
         # Inisialisasi analytics
         analytics = PanganAnalytics()
         
-        print("=== Mulai fetch data dari BPS ===")
+        print(f"=== Mulai fetch data dari BPS (level {level}) ===")
         # Fetch data
-        raw_data = analytics.fetch_data_from_bps()
+        raw_data = analytics.fetch_data_from_bps(
+            level, domains, request.data.get('var'), parse_flag(request.data.get('force_refresh')), offline_only
+        )
         
         if not raw_data:
             return Response({
@@ -400,7 +341,8 @@ def analyze_food_security_bps(request):
         
         # Parse data per provinsi
         print("\n=== Parse data per provinsi ===")
-        parsed_data = analytics.parse_province_data(raw_data)
+        parsed_data = analytics.parse_province_data(raw_data, level)
+        region_codes = vervar_codes(raw_data, level)
         
         if not parsed_data:
             return Response({
@@ -408,28 +350,16 @@ def analyze_food_security_bps(request):
                 "message": "Tidak ada data provinsi yang berhasil di-parse"
             }, status=500)
         
-        # Ambil data batas provinsi dari MongoDB
+        # Ambil data batas wilayah dari registry (cache per proses)
         print("\n=== Load boundary data ===")
-        cursor = mongo_db["batas_provinsi"].find({}, {'_id': 0})
-        boundary_features = list(cursor)
-        
-        # Buat mapping nama provinsi ke boundary
-        province_map = {}
-        for feature in boundary_features:
-            props = feature.get('properties', {})
-            for field in ['NAMOBJ', 'name', 'WADMPR', 'Provinsi']:
-                if field in props and props[field]:
-                    official_name = str(props[field]).upper().strip()
-                    normalized = normalize_province_name(official_name)
-                    province_map[normalized] = feature
-                    province_map[official_name] = feature
-        
-        print(f"Loaded {len(province_map)} province boundaries")
+        boundary_layer = boundary_registry.layer(level)
+        
+        print(f"Loaded {len(boundary_layer.features)} {wilayah} boundaries")
         
         # Proses analisis per provinsi
         print(f"\n=== Processing {len(parsed_data)} provinces ===")
         
-        matched_features = []
+        matched_results = []  # (key fitur, analisis), geometri ditempel saat response
         analysis_summary = []
         kategori_counts = {
             "SANGAT RENTAN": 0,
@@ -444,23 +374,10 @@ def analyze_food_security_bps(request):
             if prevalensi is None:
                 continue
             
-            # Cari matching boundary
-            normalized_prov = normalize_province_name(prov_name)
-            matched_feature = None
+            # Cari matching boundary (nama exact, kode vervar, fuzzy)
+            match = boundary_layer.match(prov_name, region_codes.get(prov_name))
             
-            # Exact match
-            if normalized_prov in province_map:
-                matched_feature = province_map[normalized_prov]
-            elif prov_name in province_map:
-                matched_feature = province_map[prov_name]
-            else:
-                # Partial match
-                for map_name, feature in province_map.items():
-                    if normalized_prov in map_name or map_name in normalized_prov:
-                        matched_feature = feature
-                        break
-            
-            if not matched_feature:
+            if match is None:
                 print(f"  ✗ {prov_name}: No boundary match")
                 continue
             
@@ -475,22 +392,18 @@ def analyze_food_security_bps(request):
             # Update counts
             kategori_counts[kategori] += 1
             
-            # Tambahkan ke feature
-            feature_copy = matched_feature.copy()
-            props = feature_copy.get('properties', {})
-            
-            props['food_security_analysis'] = {
+            # Hasil analisis per wilayah (nama_provinsi dipertahankan untuk frontend, juga di level kabupaten)
+            matched_results.append((match.key, {
                 'nama_provinsi': prov_name,
+                'nama_resmi': match.name,
+                'match_confidence': match.confidence,
                 'kategori': kategori,
                 'warna': warna,
                 'food_security_index': ikp,
                 'prevalensi_ketidakcukupan': prevalensi,
                 'insights': insights,
                 'rekomendasi': recommendations
-            }
-            
-            feature_copy['properties'] = props
-            matched_features.append(feature_copy)
+            }))
             
             # Tambahkan ke summary
             analysis_summary.append({
@@ -512,7 +425,7 @@ def analyze_food_security_bps(request):
             national_recommendations.append({
                 'priority': 'NASIONAL - DARURAT',
                 'title': 'Program Darurat Ketahanan Pangan Nasional',
-                'content': f'Terdapat {total_rentan} provinsi dalam kondisi rentan/sangat rentan yang memerlukan intervensi segera.',
+                'content': f'Terdapat {total_rentan} {wilayah} dalam kondisi rentan/sangat rentan yang memerlukan intervensi segera.',
                 'actions': [
                     'Mobilisasi cadangan beras pemerintah (CBP) dan stok strategis',
                     'Operasi pasar murah skala nasional',
@@ -526,7 +439,7 @@ def analyze_food_security_bps(request):
             national_recommendations.append({
                 'priority': 'NASIONAL - PREVENTIF',
                 'title': 'Pencegahan Krisis Pangan',
-                'content': f'Terdapat {kategori_counts["AGAK TAHAN"]} provinsi dalam kondisi agak tahan.',
+                'content': f'Terdapat {kategori_counts["AGAK TAHAN"]} {wilayah} dalam kondisi agak tahan.',
                 'actions': [
                     'Monitoring harga pangan dan early warning system',
                     'Penguatan sistem distribusi antar wilayah',
@@ -612,19 +525,26 @@ def analyze_food_security_bps(request):
         }
         
         print(f"\n=== Analysis Complete ===")
-        print(f"Total matched: {len(matched_features)} provinces")
+        print(f"Total matched: {len(matched_results)} {wilayah}")
         print(f"Distribution: SANGAT RENTAN={kategori_counts['SANGAT RENTAN']}, RENTAN={kategori_counts['RENTAN']}, AGAK TAHAN={kategori_counts['AGAK TAHAN']}, TAHAN={kategori_counts['TAHAN']}, SANGAT TAHAN={kategori_counts['SANGAT TAHAN']}")
         
-        return Response({
+        features = boundary_layer.annotated_features(matched_results, 'food_security_analysis', band)
+        result = {
             'status': 'success',
             'source': 'BPS Web API - Prevalensi Ketidakcukupan Konsumsi Pangan',
+            'level': level,
+            'bps_cache': {
+                'sources': analytics.cache_sources,
+                'stats': bps_client.cache.stats() if bps_client.cache else None,
+                'snapshot_version': bps_client.snapshots.current_version() if offline_only else None
+            },
             'total_provinces': len(parsed_data),
-            'total_matched': len(matched_features),
-            'total_success': len(matched_features),
+            'total_matched': len(matched_results),
+            'total_success': len(matched_results),
             'kategori_distribusi': kategori_counts,
             'matched_features': {
                 "type": "FeatureCollection",
-                "features": matched_features
+                "features": features if level == 'kabupaten' else list(features)
             },
             'analysis_summary': analysis_summary,
             'national_recommendations': national_recommendations,
@@ -638,7 +558,12 @@ def analyze_food_security_bps(request):
             },
             'metodologi': metodologi,
             'raw_dataset': parsed_data
-        })
+        }
+        
+        # Level kabupaten (±514 wilayah): FeatureCollection di-stream per fitur
+        if level == 'kabupaten':
+            return json_stream_response(result)
+        return Response(result)
         
     except Exception as e:
         print(f"ERROR: {str(e)}")
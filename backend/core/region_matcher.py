@@ -0,0 +1,237 @@
+import re
+import difflib
+from collections import defaultdict, namedtuple
+
+# Hasil pencocokan nama wilayah
+RegionMatch = namedtuple("RegionMatch", ["key", "name", "confidence", "method"])
+
+# Batas minimal confidence pencocokan fuzzy
+MATCH_MIN_CONFIDENCE = 0.82
+# Jumlah maksimal hasil pencocokan yang di-cache per matcher
+MATCH_CACHE_SIZE = 10000
+# Selisih minimal skor kandidat terbaik vs kedua (hindari tebakan ambigu)
+MATCH_MIN_MARGIN = 0.03
+
+# Ekspansi singkatan per token
+TOKEN_EXPANSIONS = {
+    "KEP": "KEPULAUAN",
+    "KEPL": "KEPULAUAN",
+    "PROV": "PROVINSI",
+    "KAB": "KABUPATEN",
+    "KOTAMADYA": "KOTA",
+    "ADM": "ADMINISTRASI",
+    "UTR": "UTARA",
+    "SEL": "SELATAN",
+    "TENG": "TENGAH",
+    "BRT": "BARAT",
+    "TIM": "TIMUR",
+}
+
+# Grup alias provinsi: semua nama di satu grup dianggap wilayah yang sama
+PROVINCE_ALIASES = [
+    ["ACEH", "NANGGROE ACEH DARUSSALAM", "NAD", "DI ACEH", "DAERAH ISTIMEWA ACEH"],
+    ["SUMATERA UTARA", "SUMATRA UTARA", "SUMUT"],
+    ["SUMATERA BARAT", "SUMATRA BARAT", "SUMBAR"],
+    ["SUMATERA SELATAN", "SUMATRA SELATAN", "SUMSEL"],
+    ["KEPULAUAN BANGKA BELITUNG", "BANGKA BELITUNG", "BABEL"],
+    ["KEPULAUAN RIAU", "KEPRI"],
+    ["DKI JAKARTA", "JAKARTA", "DKI", "DAERAH KHUSUS IBUKOTA JAKARTA", "DAERAH KHUSUS JAKARTA", "JAKARTA RAYA"],
+    ["JAWA BARAT", "JABAR"],
+    ["JAWA TENGAH", "JATENG"],
+    ["JAWA TIMUR", "JATIM"],
+    ["DI YOGYAKARTA", "D I YOGYAKARTA", "YOGYAKARTA", "DIY", "DAERAH ISTIMEWA YOGYAKARTA"],
+    ["NUSA TENGGARA BARAT", "NTB"],
+    ["NUSA TENGGARA TIMUR", "NTT"],
+    ["KALIMANTAN BARAT", "KALBAR"],
+    ["KALIMANTAN TENGAH", "KALTENG"],
+    ["KALIMANTAN SELATAN", "KALSEL"],
+    ["KALIMANTAN TIMUR", "KALTIM"],
+    ["KALIMANTAN UTARA", "KALTARA"],
+    ["SULAWESI UTARA", "SULUT"],
+    ["SULAWESI TENGAH", "SULTENG"],
+    ["SULAWESI SELATAN", "SULSEL"],
+    ["SULAWESI TENGGARA", "SULTRA"],
+    ["SULAWESI BARAT", "SULBAR"],
+    ["PAPUA BARAT", "IRIAN JAYA BARAT", "IRJABAR"],
+    ["PAPUA", "IRIAN JAYA"],
+]
+
+# Awalan jenis wilayah yang dibuang dari nama provinsi
+PROVINCE_PREFIXES = [("PROVINSI",)]
+
+# Awalan jenis wilayah kabupaten/kota -> tipe
+REGENCY_PREFIXES = [
+    (("KABUPATEN", "ADMINISTRASI"), "KABUPATEN"),
+    (("KABUPATEN",), "KABUPATEN"),
+    (("KOTA", "ADMINISTRASI"), "KOTA"),
+    (("KOTA",), "KOTA"),
+]
+
+
+def _tokens(name):
+    tokens = re.findall(r"[A-Z0-9]+", str(name).upper())
+    return [TOKEN_EXPANSIONS.get(t, t) for t in tokens]
+
+
+def _build_alias_lookup():
+    lookup = {}
+    for group in PROVINCE_ALIASES:
+        canonical = " ".join(_tokens(group[0]))
+        for alias in group:
+            lookup[" ".join(_tokens(alias))] = canonical
+    return lookup
+
+
+_PROVINCE_ALIAS_LOOKUP = _build_alias_lookup()
+
+
+def _regency_parts(name):
+    """(tipe KABUPATEN/KOTA atau None bila tanpa awalan, nama tanpa awalan)"""
+    tokens = _tokens(name)
+    for prefix, prefix_type in REGENCY_PREFIXES:
+        if tuple(tokens[:len(prefix)]) == prefix:
+            return prefix_type, " ".join(tokens[len(prefix):])
+    return None, " ".join(tokens)
+
+
+def normalize_region(name, level="provinsi"):
+    """
+    Nama wilayah -> key ternormalisasi.
+    Provinsi: alias diseragamkan ("DIY" -> "DI YOGYAKARTA").
+    Kabupaten: tipe dipertahankan ("KOTA BANDUNG" != "KABUPATEN BANDUNG"),
+    nama tanpa awalan dianggap kabupaten.
+    """
+    if level == "kabupaten":
+        region_type, rest = _regency_parts(name)
+        return f"{region_type or 'KABUPATEN'} {rest}".strip()
+
+    tokens = _tokens(name)
+    for prefix in PROVINCE_PREFIXES:
+        if tuple(tokens[:len(prefix)]) == prefix:
+            tokens = tokens[len(prefix):]
+    key = " ".join(tokens)
+    return _PROVINCE_ALIAS_LOOKUP.get(key, key)
+
+
+def normalize_region_code(code, level="provinsi"):
+    """
+    Kode wilayah (BPS/Kemendagri) -> key digit: provinsi 2 digit ("1500", "15" -> "15"),
+    kabupaten 4 digit ("32.04", "3204" -> "3204"). None jika tidak valid.
+    """
+    if code is None:
+        return None
+    digits = re.sub(r"\D", "", str(code))
+    length = 4 if level == "kabupaten" else 2
+    if len(digits) < length:
+        return None
+    return digits[:length]
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class RegionMatcher:
+    """
+    Pencocokan nama wilayah ke key fitur batas:
+    1. hash exact nama ternormalisasi (+ alias),
+    2. fallback fuzzy lewat index trigram lalu diverifikasi dengan difflib.
+    Dibangun sekali per layer batas, hasil pencocokan di-cache.
+    """
+
+    def __init__(self, entries, level="provinsi", min_confidence=MATCH_MIN_CONFIDENCE):
+        """entries: iterable (key, nama resmi)"""
+        self.level = level
+        self.min_confidence = min_confidence
+        self._exact = {}
+        self._names = {}
+        self._postings = defaultdict(set)
+        self._trigram_counts = {}
+        # Fuzzy dinilai pada nama tanpa awalan tipe, hanya antar wilayah bertipe sama
+        self._types = {}
+        self._texts = {}
+        self._cache = {}
+
+        for key, name in entries:
+            normalized = normalize_region(name, level)
+            if not normalized or normalized in self._exact:
+                continue
+            self._exact[normalized] = key
+            self._names[normalized] = str(name)
+            self._types[normalized], self._texts[normalized] = self._split(normalized)
+            grams = _trigrams(self._texts[normalized])
+            self._trigram_counts[normalized] = len(grams)
+            for gram in grams:
+                self._postings[gram].add(normalized)
+
+    def __len__(self):
+        return len(self._exact)
+
+    def _split(self, normalized):
+        """Key ternormalisasi -> (tipe KABUPATEN/KOTA, nama tanpa awalan); provinsi tanpa tipe"""
+        if self.level == "kabupaten":
+            return _regency_parts(normalized)
+        return None, normalized
+
+    def _fuzzy(self, text, region_type=None):
+        grams = _trigrams(text)
+        overlap = defaultdict(int)
+        for gram in grams:
+            for candidate in self._postings.get(gram, ()):
+                if self._types[candidate] == region_type:
+                    overlap[candidate] += 1
+        if not overlap:
+            return None
+
+        # Kandidat teratas menurut koefisien Dice trigram, lalu verifikasi edit distance
+        ranked = sorted(
+            overlap,
+            key=lambda c: 2 * overlap[c] / (len(grams) + self._trigram_counts[c]),
+            reverse=True
+        )[:5]
+        scored = sorted(
+            ((difflib.SequenceMatcher(None, text, self._texts[c]).ratio(), c) for c in ranked),
+            reverse=True
+        )
+
+        best_score, best = scored[0]
+        if best_score < self.min_confidence:
+            return None
+        if len(scored) > 1 and best_score - scored[1][0] < MATCH_MIN_MARGIN:
+            return None
+        return best, best_score
+
+    def match(self, name):
+        """Returns: RegionMatch atau None jika tidak ada kandidat yang cukup yakin"""
+        if name is None:
+            return None
+        normalized = cache_key = normalize_region(name, self.level)
+        if self.level == "kabupaten":
+            # "BATU" dan "KABUPATEN BATU" sama-sama dinormalisasi ke "KABUPATEN BATU", tapi hanya
+            # nama tanpa awalan yang boleh jatuh ke kota, jadi key cache memakai awalan aslinya
+            region_type, rest = _regency_parts(name)
+            cache_key = (region_type, rest)
+        if cache_key in self._cache:
+            return self._cache[cache_key]
+
+        result = None
+        if normalized not in self._exact and self.level == "kabupaten":
+            # Nama tanpa awalan yang tidak ada sebagai kabupaten: coba sebagai kota
+            if region_type is None and f"KOTA {rest}" in self._exact:
+                normalized = f"KOTA {rest}"
+
+        if normalized in self._exact:
+            result = RegionMatch(self._exact[normalized], self._names[normalized], 1.0, "exact")
+        elif normalized:
+            candidate_type, text = self._split(normalized)
+            fuzzy = self._fuzzy(text, candidate_type)
+            if fuzzy is None and self.level == "kabupaten" and region_type is None:
+                fuzzy = self._fuzzy(rest, "KOTA")
+            if fuzzy:
+                candidate, score = fuzzy
+                result = RegionMatch(self._exact[candidate], self._names[candidate], round(score, 3), "fuzzy")
+
+        if len(self._cache) < MATCH_CACHE_SIZE:
+            self._cache[cache_key] = result
+        return result
@@ -0,0 +1,94 @@
+import os
+import json
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+DB_MONGO_NAME = os.getenv("DB_MONGO_NAME")
+
+# Cache hasil analisis: jumlah entri in-memory per proses & umur entri di MongoDB (detik)
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", 64))
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", 7 * 24 * 3600))
+ANALYSIS_CACHE_COLLECTION = "analysis_cache"
+
+client = MongoClient(MONGO_URI)
+mongo_db = client[DB_MONGO_NAME]
+
+
+def file_digest(file, chunk_size=1024 * 1024):
+    """SHA-256 isi file upload (dibaca per chunk), posisi file dikembalikan ke awal"""
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks(chunk_size) if hasattr(file, 'chunks') else iter(lambda: file.read(chunk_size), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Cache hasil analisis dua tingkat: LRU in-memory per proses di depan koleksi MongoDB
+    (payload JSON terkompresi zlib, kedaluwarsa lewat TTL index pada expires_at, UTC).
+    """
+
+    def __init__(self, collection, max_entries=ANALYSIS_CACHE_SIZE, ttl=ANALYSIS_CACHE_TTL):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256("|".join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Returns: (nilai, 'memory'|'mongo') atau (None, None) jika miss"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                return value, "memory"
+
+        try:
+            document = self.collection.find_one({'_id': key, 'expires_at': {'$gt': datetime.utcnow()}})
+        except Exception as e:
+            print(f"⚠ Cache analisis tidak bisa dibaca: {str(e)}")
+            return None, None
+        if not document:
+            return None, None
+
+        value = json.loads(zlib.decompress(document['payload']).decode('utf-8'))
+        self._remember(key, value)
+        return value, "mongo"
+
+    def set(self, key, value):
+        self._remember(key, value)
+        payload = zlib.compress(json.dumps(value, separators=(',', ':'), default=str).encode('utf-8'), 6)
+        now = datetime.utcnow()
+        try:
+            self.collection.replace_one(
+                {'_id': key},
+                {'_id': key, 'payload': payload, 'created_at': now, 'expires_at': now + timedelta(seconds=self.ttl)},
+                upsert=True
+            )
+        except Exception as e:
+            # Gagal persist (mis. dokumen > 16 MB) tidak menggagalkan analisis
+            print(f"⚠ Cache analisis tidak tersimpan: {str(e)}")
+
+
+analysis_cache = ResultCache(mongo_db[ANALYSIS_CACHE_COLLECTION])
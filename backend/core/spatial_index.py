@@ -0,0 +1,257 @@
+import os
+import threading
+import numpy as np
+import shapely
+from pymongo import MongoClient
+from dotenv import load_dotenv
+from .geometry import valid_polygon, polygons_iou
+
+load_dotenv()
+
+MONGO_URI = os.getenv("MONGO_URI")
+DB_MONGO_NAME = os.getenv("DB_MONGO_NAME")
+
+# Konfigurasi deduplikasi deteksi
+DEDUP_IOU_THRESHOLD = float(os.getenv("DEDUP_IOU_THRESHOLD", 0.5))
+DEDUP_POLICIES = ['drop', 'merge', 'off']
+
+# Baris baru masuk STRtree kecil terpisah; tree utama dibangun ulang jika baris baru
+# melebihi FRESH_ROWS_MIN atau FRESH_ROWS_RATIO dari isi tree utama
+FRESH_ROWS_MIN = 4096
+FRESH_ROWS_RATIO = 0.1
+
+client = MongoClient(MONGO_URI)
+mongo_db = client[DB_MONGO_NAME]
+mongo_collection = mongo_db["ai_features"]
+
+
+def ring_envelope(ring):
+    """Envelope (min_lng, min_lat, max_lng, max_lat) dari ring"""
+    ring = np.asarray(ring, dtype=np.float64).reshape(-1, 2)
+    return np.concatenate((ring.min(axis=0), ring.max(axis=0)))
+
+
+class EnvelopeIndex:
+    """
+    Index envelope poligon per kategori di atas shapely.STRtree.
+    STRtree tidak bisa diubah setelah dibangun, jadi baris baru ditampung di tree kecil
+    (dibangun ulang saat berubah) sampai tree utama dibangun ulang.
+    Hanya menyimpan bbox, geometri lengkap diambil saat dibutuhkan.
+    """
+
+    def __init__(self):
+        self._boxes = np.empty((1024, 4), dtype=np.float64)
+        self._active = np.zeros(1024, dtype=bool)
+        self._codes = np.zeros(1024, dtype=np.int64)
+        self._ids = []
+        self._row_by_id = {}
+        self._code_by_kategori = {}
+        self._main = (None, 0)
+        self._fresh = (None, 0)
+
+    def __len__(self):
+        return len(self._row_by_id)
+
+    def _code(self, kategori):
+        return self._code_by_kategori.setdefault(kategori, len(self._code_by_kategori))
+
+    def _grow(self, size):
+        capacity = len(self._active)
+        while capacity < size:
+            capacity *= 2
+        if capacity == len(self._active):
+            return
+        for name in ("_boxes", "_active", "_codes"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def insert(self, feature_id, kategori, box):
+        self.insert_many([feature_id], [kategori], [box])
+
+    def insert_many(self, feature_ids, kategoris, boxes):
+        """Tambah (atau ganti) envelope, baris lama fitur yang sama dinonaktifkan"""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        first = len(self._ids)
+        self._grow(first + len(boxes))
+        rows = np.arange(first, first + len(boxes))
+        self._boxes[rows] = boxes
+        self._active[rows] = True
+        self._codes[rows] = [self._code(kategori) for kategori in kategoris]
+        self._ids.extend(feature_ids)
+        for row, fid in zip(rows.tolist(), feature_ids):
+            old = self._row_by_id.get(fid)
+            if old is not None:
+                self._active[old] = False
+            self._row_by_id[fid] = row
+
+    def remove(self, feature_id):
+        # Baris hanya dinonaktifkan, disaring lewat _active saat query
+        row = self._row_by_id.pop(feature_id, None)
+        if row is not None:
+            self._active[row] = False
+
+    def update_kategori(self, feature_id, kategori):
+        row = self._row_by_id.get(feature_id)
+        if row is not None:
+            self._codes[row] = self._code(kategori)
+
+    def _tree(self, start, stop):
+        boxes = self._boxes[start:stop]
+        return shapely.STRtree(shapely.box(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]))
+
+    def _trees(self):
+        """(tree, baris awal) yang menutupi semua baris; bangun ulang tree yang basi"""
+        total = len(self._ids)
+        main, main_stop = self._main
+        if total - main_stop > max(FRESH_ROWS_MIN, main_stop * FRESH_ROWS_RATIO):
+            self._main = main, main_stop = self._tree(0, total), total
+            self._fresh = (None, total)
+        fresh, fresh_stop = self._fresh
+        if fresh_stop != total:
+            self._fresh = fresh, fresh_stop = (self._tree(main_stop, total) if total > main_stop else None), total
+        return [(tree, start) for tree, start in ((main, 0), (fresh, main_stop)) if tree is not None]
+
+    def query_many(self, kategoris, boxes):
+        """Per box: feature_id dengan kategori sama yang envelope-nya beririsan"""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        results = [[] for _ in range(len(boxes))]
+        if not len(boxes) or not self._row_by_id:
+            return results
+
+        queries = shapely.box(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3])
+        codes = np.array([self._code_by_kategori.get(kategori, -1) for kategori in kategoris], dtype=np.int64)
+        for tree, start in self._trees():
+            query_idx, rows = tree.query(queries, predicate="intersects")
+            rows = rows + start
+            hit = self._active[rows] & (self._codes[rows] == codes[query_idx])
+            for q, row in zip(query_idx[hit].tolist(), rows[hit].tolist()):
+                results[q].append(self._ids[row])
+        return results
+
+    def query(self, kategori, box):
+        """feature_id dengan kategori sama yang envelope-nya beririsan dengan box"""
+        return self.query_many([kategori], [box])[0]
+
+
+class FeatureDeduplicator:
+    """Index bersama untuk koleksi ai_features, dibangun sekali lalu di-update inkremental"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.index = EnvelopeIndex()
+        self._lock = threading.Lock()
+        self._loaded = False
+        # Waktu perubahan terakhir yang sudah masuk index (updated_at, fitur lama: created_at)
+        self._last_updated_at = ""
+
+    def _add_documents(self, cursor):
+        ids, kategoris, boxes = [], [], []
+        for doc in cursor:
+            try:
+                box = ring_envelope(doc["location"]["coordinates"][0])
+            except (KeyError, IndexError, TypeError, ValueError):
+                continue
+            ids.append(doc["feature_id"])
+            kategoris.append(doc.get("kategori"))
+            boxes.append(box)
+            self._last_updated_at = max(self._last_updated_at, doc.get("updated_at") or doc.get("created_at") or "")
+        if ids:
+            self.index.insert_many(ids, kategoris, boxes)
+
+    def _sync(self):
+        """
+        Load awal, lalu ambil fitur yang ditambah atau diubah (merge geometri, ganti kategori)
+        oleh proses lain. Envelope fitur yang sudah ada diganti lewat insert_many.
+        """
+        projection = {"_id": 0, "feature_id": 1, "kategori": 1, "location.coordinates": 1,
+                      "created_at": 1, "updated_at": 1}
+        if not self._loaded:
+            self._add_documents(self.collection.find({}, projection).batch_size(5000))
+            self._loaded = True
+            print(f"✓ Index spasial deduplikasi dimuat: {len(self.index)} fitur")
+        else:
+            self._add_documents(self.collection.find({"$or": [
+                {"updated_at": {"$gt": self._last_updated_at}},
+                # Fitur lama yang belum punya updated_at
+                {"updated_at": {"$exists": False}, "created_at": {"$gt": self._last_updated_at}},
+            ]}, projection))
+
+    def find_duplicates(self, features, threshold=DEDUP_IOU_THRESHOLD):
+        """
+        Deduplikasi satu batch simpan. features: list (feature_id, kategori, ring) urut request.
+        Tiap fitur dibandingkan dengan fitur tersimpan dan fitur sebelumnya di batch yang bukan
+        duplikat; yang bukan duplikat langsung masuk index. Index disinkronkan sekali dan geometri
+        kandidat tersimpan diambil dengan satu query $in untuk seluruh batch.
+        Returns: list (feature_id duplikat, iou) per fitur, (None, 0.0) jika bukan duplikat
+        """
+        results = [(None, 0.0)] * len(features)
+        positions = [pos for pos, (_, _, ring) in enumerate(features) if len(ring) >= 3]
+        if not positions:
+            return results
+
+        ids = [features[pos][0] for pos in positions]
+        kategoris = [features[pos][1] for pos in positions]
+        boxes = np.array([ring_envelope(features[pos][2]) for pos in positions])
+        polygons = np.array([valid_polygon(features[pos][2]) for pos in positions], dtype=object)
+
+        with self._lock:
+            self._sync()
+            stored = self.index.query_many(kategoris, boxes)
+
+        candidate_ids = list({fid for fids in stored for fid in fids})
+        stored_polygons = {}
+        if candidate_ids:
+            cursor = self.collection.find(
+                {"feature_id": {"$in": candidate_ids}},
+                {"_id": 0, "feature_id": 1, "location.coordinates": 1}
+            )
+            for doc in cursor:
+                stored_polygons[doc["feature_id"]] = valid_polygon(doc["location"]["coordinates"][0])
+            # Fitur yang sudah dihapus proses lain dikeluarkan dari index
+            with self._lock:
+                for fid in candidate_ids:
+                    if fid not in stored_polygons:
+                        self.index.remove(fid)
+
+        # Pasangan di dalam batch: fitur sebelumnya dengan kategori sama & envelope beririsan
+        envelopes = shapely.box(boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3])
+        earlier = {}
+        for k, j in zip(*shapely.STRtree(envelopes).query(envelopes, predicate="intersects").tolist()):
+            if j < k and kategoris[j] == kategoris[k]:
+                earlier.setdefault(k, []).append(j)
+
+        accepted = []
+        accepted_set = set()
+        for k, pos in enumerate(positions):
+            candidates = [(fid, stored_polygons[fid]) for fid in stored[k] if fid in stored_polygons]
+            candidates += [(ids[j], polygons[j]) for j in earlier.get(k, []) if j in accepted_set]
+            if candidates:
+                ious = polygons_iou(polygons[k], np.array([polygon for _, polygon in candidates], dtype=object))
+                best = int(np.argmax(ious))
+                if ious[best] > threshold:
+                    results[pos] = (candidates[best][0], float(ious[best]))
+                    continue
+            accepted.append(k)
+            accepted_set.add(k)
+
+        if accepted:
+            with self._lock:
+                self.index.insert_many([ids[k] for k in accepted], [kategoris[k] for k in accepted], boxes[accepted])
+        return results
+
+    def add(self, feature_id, kategori, ring):
+        with self._lock:
+            self.index.insert(feature_id, kategori, ring_envelope(ring))
+
+    def remove(self, feature_id):
+        with self._lock:
+            self.index.remove(feature_id)
+
+    def update_kategori(self, feature_id, kategori):
+        with self._lock:
+            self.index.update_kategori(feature_id, kategori)
+
+
+deduplicator = FeatureDeduplicator(mongo_collection)
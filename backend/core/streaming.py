@@ -0,0 +1,35 @@
+import json
+from types import GeneratorType
+from django.http import StreamingHttpResponse
+
+
+def iter_json_array(items):
+    """Stream iterable sebagai JSON array tanpa menampung semua item di memori"""
+    yield '['
+    first = True
+    for item in items:
+        yield ('' if first else ',') + json.dumps(item, default=str)
+        first = False
+    yield ']'
+
+
+def iter_json(value):
+    """
+    Serialisasi JSON bertahap: dict ditelusuri per key, generator di-stream sebagai array
+    (satu item per chunk), nilai lain di-dump sekaligus.
+    """
+    if isinstance(value, GeneratorType):
+        yield from iter_json_array(value)
+    elif isinstance(value, dict):
+        yield '{'
+        for index, (key, item) in enumerate(value.items()):
+            yield (',' if index else '') + json.dumps(str(key)) + ':'
+            yield from iter_json(item)
+        yield '}'
+    else:
+        yield json.dumps(value, default=str)
+
+
+def json_stream_response(document, status=200):
+    """StreamingHttpResponse JSON untuk dokumen besar (mis. FeatureCollection hasil analisis)"""
+    return StreamingHttpResponse(iter_json(document), content_type='application/json', status=status)
@@ -1,3 +1,1625 @@
-from django.test import TestCase
+import copy
+import io
+import json
+import os
+import queue
+import random
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+import numpy as np
+import shapely
+from django.test import SimpleTestCase
+from pymongo.errors import BulkWriteError
+from rest_framework.test import APIRequestFactory
+from . import bps_client, bps_snapshots, detection_jobs, ingestion, kesehatan_views, spatial_index, views
+from .bps_client import BPSCache, BPSClient, BPSDataset, is_regency_code
+from .bps_datacontent import DataContent
+from .boundary_registry import ANALYSIS_BANDS, analysis_params, request_band
+from .bps_snapshots import SnapshotStore
+from .detection import run_batch
+from .geometry import (
+    EARTH_RADIUS, geo_ring_areas, geo_ring_centroids, geo_ring_perimeters, lnglat_to_pixel, meters_per_pixel,
+    pixel_ring_areas, pixel_ring_areas_m2, pixel_to_lnglat, simplify_geo_ring, simplify_packed, simplify_ring_mask,
+)
+from .tile_source import open_tile_source
+from .spatial_index import EnvelopeIndex, FeatureDeduplicator, ring_envelope
+from .result_cache import ResultCache, file_digest
+from .region_matcher import PROVINCE_ALIASES, RegionMatcher
+from .topojson import build_topology
+from .vector_tiles import MVT_BUFFER, MVT_EXTENT, MVT_LAYER_NAME, build_feature_tile, encode_layer, tile_rings
 
-# Create your tests here.
+try:
+    import mapbox_vector_tile
+except ImportError:
+    mapbox_vector_tile = None
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+
+def _tile_of(lng, lat, z):
+    """Tile z/x/y yang memuat titik lng/lat"""
+    x, y = lnglat_to_pixel([[lng, lat]], z, tile_size=1)[0]
+    return int(x), int(y)
+
+
+def _square(center, half):
+    """Ring GeoJSON persegi (tertutup) di sekitar titik lng/lat"""
+    lng, lat = center
+    return [[lng - half, lat + half], [lng + half, lat + half], [lng + half, lat - half], [lng - half, lat - half], [lng - half, lat + half]]
+
+
+def _projected_polygon(coordinates, z, x, y):
+    """Polygon GeoJSON -> polygon shapely di koordinat tile (tanpa simplifikasi/clip)"""
+    origin = np.array([x * MVT_EXTENT, y * MVT_EXTENT])
+    rings = [lnglat_to_pixel(ring, z, tile_size=MVT_EXTENT) - origin for ring in coordinates]
+    return shapely.Polygon(rings[0], rings[1:])
+
+
+@skipUnless(mapbox_vector_tile, "mapbox_vector_tile belum terpasang")
+class VectorTileTests(SimpleTestCase):
+    """Tile MVT hasil encoder sendiri di-decode ulang dengan mapbox_vector_tile"""
+
+    z = 18
+    x, y = _tile_of(106.8005, -6.2005, z)
+    center = pixel_to_lnglat([[x + 0.5, y + 0.5]], z, tile_size=1)[0].tolist()
+
+    def decode(self, data):
+        layer = mapbox_vector_tile.decode(data, default_options={"y_coord_down": True})[MVT_LAYER_NAME]
+        self.assertEqual(layer["extent"], MVT_EXTENT)
+        return layer["features"]
+
+    def test_polygon_with_hole_round_trip(self):
+        x, y = self.x, self.y
+        coordinates = [_square(self.center, 0.0005), _square(self.center, 0.0002)[::-1]]
+        properties = {"feature_id": "f1", "kategori": "bangunan", "jumlah": -3, "aktif": True, "kosong": None}
+
+        rings = tile_rings(coordinates, self.z, x, y, tolerance=0)
+        features = self.decode(encode_layer([(rings, properties)]))
+
+        self.assertEqual(len(features), 1)
+        self.assertEqual(features[0]["properties"], {"feature_id": "f1", "kategori": "bangunan", "jumlah": -3, "aktif": True})
+        decoded = features[0]["geometry"]["coordinates"]
+        self.assertEqual(features[0]["geometry"]["type"], "Polygon")
+        for ring, expected in zip(decoded, rings):
+            self.assertEqual(ring[:-1], expected.tolist())
+
+        # Luas hasil decode = luas poligon input di koordinat tile (selisih hanya pembulatan integer)
+        polygon = shapely.Polygon(decoded[0], decoded[1:])
+        self.assertTrue(polygon.is_valid)
+        expected = _projected_polygon(coordinates, self.z, x, y)
+        self.assertAlmostEqual(polygon.area, expected.area, delta=expected.length)
+
+    def test_clipped_polygon_matches_buffered_tile(self):
+        x, y = self.x, self.y
+        # Poligon jauh lebih besar dari tile -> di-clip ke tile + buffer
+        coordinates = [_square(self.center, 0.01)]
+
+        features = self.decode(encode_layer([(tile_rings(coordinates, self.z, x, y, tolerance=0), {})]))
+
+        polygon = shapely.Polygon(features[0]["geometry"]["coordinates"][0])
+        box = shapely.box(-MVT_BUFFER, -MVT_BUFFER, MVT_EXTENT + MVT_BUFFER, MVT_EXTENT + MVT_BUFFER)
+        expected = _projected_polygon(coordinates, self.z, x, y).intersection(box)
+        self.assertAlmostEqual(polygon.area, expected.area, delta=expected.length)
+
+    def test_feature_tile_from_documents(self):
+        ring = _square(self.center, 0.0005)
+        documents = [
+            {"feature_id": "a", "kategori": "bangunan", "confidence_score": 0.91,
+             "metadata": {"luas_estimasi": 120.5}, "location": {"type": "Polygon", "coordinates": [ring]}},
+            # Titik & poligon di luar tile dilewati
+            {"feature_id": "b", "location": {"type": "Point", "coordinates": [106.8005, -6.2005]}},
+            {"feature_id": "c", "location": {"type": "Polygon", "coordinates": [[[p[0] + 1, p[1]] for p in ring]]}},
+        ]
+
+        features = self.decode(build_feature_tile(documents, self.z, self.x, self.y))
+
+        self.assertEqual([f["properties"]["feature_id"] for f in features], ["a"])
+        self.assertEqual(features[0]["properties"]["confidence_score"], 0.91)
+        self.assertEqual(features[0]["properties"]["luas_estimasi"], 120.5)
+
+    def test_empty_tile(self):
+        self.assertEqual(build_feature_tile([], self.z, 0, 0), b"")
+
+
+def _decode_topology(topology):
+    """Topology -> list geometry GeoJSON (arc di-delta-decode & dikembalikan ke lng/lat)"""
+    scale = np.array(topology["transform"]["scale"])
+    translate = np.array(topology["transform"]["translate"])
+    arcs = [np.cumsum(np.array(arc), axis=0) * scale + translate for arc in topology["arcs"]]
+
+    def ring(refs):
+        parts = [arcs[ref] if ref >= 0 else arcs[~ref][::-1] for ref in refs]
+        return np.vstack([parts[0]] + [part[1:] for part in parts[1:]])
+
+    geometries = []
+    for geometry in topology["objects"]["boundaries"]["geometries"]:
+        polygons = [geometry["arcs"]] if geometry["type"] == "Polygon" else geometry["arcs"]
+        geometries.append(shapely.MultiPolygon([
+            shapely.Polygon(ring(rings[0]), [ring(refs) for refs in rings[1:]]) for rings in polygons
+        ]))
+    return geometries
+
+
+class TopoJSONTests(SimpleTestCase):
+    """Topology di-decode ulang lalu dibandingkan dengan GeoJSON input"""
+
+    features = [
+        {"type": "Feature", "properties": {"nama": "A"}, "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[106.0, -6.0], [107.0, -6.0], [107.0, -7.0], [106.0, -7.0], [106.0, -6.0]]]
+        }},
+        # Berbagi sisi 107,-6 .. 107,-7 dengan A
+        {"type": "Feature", "properties": {"nama": "B"}, "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[107.0, -6.0], [108.5, -6.0], [108.5, -7.0], [107.0, -7.0], [107.0, -6.0]]]
+        }},
+        # MultiPolygon dengan hole, terpisah dari A & B
+        {"type": "Feature", "properties": {"nama": "C"}, "geometry": {
+            "type": "MultiPolygon",
+            "coordinates": [
+                [[[110.0, -8.0], [112.0, -8.0], [112.0, -9.5], [110.0, -9.5], [110.0, -8.0]],
+                 [[110.5, -8.5], [110.5, -9.0], [111.0, -9.0], [111.0, -8.5], [110.5, -8.5]]],
+                [[[113.0, -8.0], [113.7, -8.2], [113.1, -8.9], [113.0, -8.0]]]
+            ]
+        }},
+    ]
+
+    def test_round_trip_areas(self):
+        topology = build_topology(self.features, quantization=1e4)
+
+        decoded = _decode_topology(topology)
+        self.assertEqual(len(decoded), len(self.features))
+        for feature, geometry, properties in zip(
+            self.features, decoded, topology["objects"]["boundaries"]["geometries"]
+        ):
+            original = shapely.geometry.shape(feature["geometry"])
+            self.assertEqual(properties["properties"], feature["properties"])
+            self.assertTrue(geometry.is_valid)
+            # Selisih hanya dari kuantisasi (maksimal setengah sel grid per titik)
+            cell = max(topology["transform"]["scale"])
+            self.assertAlmostEqual(geometry.area, original.area, delta=original.length * cell)
+            self.assertLess(geometry.symmetric_difference(original).area, original.length * cell)
+
+    def test_shared_edge_stored_once(self):
+        topology = build_topology(self.features[:2])
+
+        a, b = [g["arcs"][0] for g in topology["objects"]["boundaries"]["geometries"]]
+        # Sisi bersama: satu arc, dipakai A searah dan B terbalik
+        shared = set(a) & {~ref for ref in b}
+        self.assertEqual(len(shared), 1)
+        self.assertEqual(len(topology["arcs"]), 3)
+
+    def test_simplified_arcs_stay_shared(self):
+        # Sisi bersama bergerigi, disimplifikasi sekali untuk kedua wilayah
+        edge = [[107.0 + (0.001 if i % 2 else 0.0), -6.0 - i * 0.01] for i in range(101)]
+        left = {"properties": {}, "geometry": {"type": "Polygon", "coordinates": [
+            [[106.0, -6.0]] + edge + [[106.0, -7.0], [106.0, -6.0]]
+        ]}}
+        right = {"properties": {}, "geometry": {"type": "Polygon", "coordinates": [
+            [[108.0, -6.0], [108.0, -7.0]] + edge[::-1] + [[108.0, -6.0]]
+        ]}}
+
+        topology = build_topology([left, right], tolerance_m=500)
+        a, b = _decode_topology(topology)
+
+        self.assertLess(sum(len(arc) for arc in topology["arcs"]), len(edge))
+        self.assertTrue(a.is_valid and b.is_valid)
+        self.assertAlmostEqual(a.intersection(b).area, 0, places=9)
+        self.assertAlmostEqual(a.union(b).area, 2.0, places=3)
+
+    def test_empty_geometry(self):
+        topology = build_topology([{"properties": {"nama": "X"}, "geometry": None}])
+        self.assertEqual(topology["objects"]["boundaries"]["geometries"], [{"properties": {"nama": "X"}, "type": None}])
+        self.assertEqual(topology["arcs"], [])
+
+
+def _parse_per_key(raw_data, level="provinsi"):
+    """
+    Parser acuan: decode key datacontent satu per satu (vervar = prefix kode terpanjang yang cocok).
+    Returns: (wilayah -> nilai, wilayah -> {label turvar: nilai})
+    """
+    labels = {str(item["val"]): str(item.get("label") or "").upper().strip() for item in raw_data["vervar"]}
+    turvar_labels = {str(item["val"]): item.get("label", "") for item in raw_data.get("turvar") or []}
+    turvar_widths = {len(code) for code in turvar_labels}
+    turvar_width = turvar_widths.pop() if len(turvar_widths) == 1 else 1
+    codes = sorted(labels, key=len, reverse=True)
+
+    values, details = {}, {}
+    for key, value in raw_data["datacontent"].items():
+        stop = len(key) - 4 - turvar_width
+        if not key.isdigit() or stop <= 0:
+            continue
+        vervar = next((code for code in codes if len(code) < stop and key.startswith(code)), None)
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            continue
+        if vervar is None or vervar == "9999" or not labels[vervar] or value != value:
+            continue
+        if level == "kabupaten" and not is_regency_code(vervar):
+            continue
+        turvar = str(int(key[stop:stop + turvar_width]))
+        values[labels[vervar]] = value
+        details.setdefault(labels[vervar], {})[turvar_labels.get(turvar, "Unknown")] = value
+    return values, details
+
+
+def _datacontent(seed, turvar, vervar_codes, vars=(501, 2280, 84)):
+    """Response BPS acak: vervar & var beda lebar, nilai None/teks, key sampah, key duplikat per wilayah"""
+    rng = random.Random(seed)
+    turvar_codes = [1, 2] if turvar else [0]
+    datacontent = {}
+    for vervar in vervar_codes:
+        for tahun in (123, 124):
+            for code in turvar_codes:
+                choice = rng.random()
+                value = None if choice < 0.05 else ("x" if choice < 0.1 else (str(choice) if choice < 0.2 else choice * 100))
+                datacontent[f"{vervar}{rng.choice(vars)}{code}{tahun}0"] = value
+    datacontent.update({"abc": 1, "12": 2, "11a0501012400": 3})
+    keys = list(datacontent)
+    rng.shuffle(keys)
+    return {
+        "vervar": [{"val": code, "label": f"Wilayah {code % 13}"} for code in vervar_codes],
+        "turvar": [{"val": 1, "label": "Laki-laki"}, {"val": 2, "label": "Perempuan"}] if turvar else [],
+        "tahun": [{"val": 123, "label": "2023"}, {"val": 124, "label": "2024"}],
+        "datacontent": {key: datacontent[key] for key in keys},
+    }
+
+
+class DataContentTests(SimpleTestCase):
+    """DataContent (decode kolom numpy) harus sama dengan parser per key"""
+
+    # Lebar vervar campuran: agregat nasional, provinsi/kabupaten 4 digit, kode 2 & 6 digit
+    vervar_codes = [9999, 1100, 1101, 1171, 3200, 3201, 3273, 11, 32, 110101, 327301]
+
+    def test_matches_per_key_parser(self):
+        for seed in range(5):
+            for turvar in (False, True):
+                raw_data = _datacontent(seed, turvar, self.vervar_codes)
+                table = DataContent(raw_data)
+                for level in ("provinsi", "kabupaten"):
+                    with self.subTest(seed=seed, turvar=turvar, level=level):
+                        values, details = _parse_per_key(raw_data, level)
+                        self.assertEqual(table.region_values(level), values)
+                        breakdown_values, breakdown_details = table.region_breakdown(level)
+                        self.assertEqual(breakdown_details, details)
+                        self.assertEqual(breakdown_values, {
+                            wilayah: round(sum(v.values()) / len(v), 2) for wilayah, v in details.items()
+                        })
+
+    def test_uniform_width_columns(self):
+        raw_data = {
+            "vervar": [{"val": 1500, "label": "Jambi"}, {"val": 9999, "label": "INDONESIA"}],
+            "turvar": [{"val": 1, "label": "Laki-laki"}, {"val": 2, "label": "Perempuan"}],
+            "datacontent": {"150050111240": 70.09, "150050121240": "74.09", "999950111240": 70.0},
+        }
+        table = DataContent(raw_data)
+
+        self.assertEqual(table.columns["vervar"].tolist(), [1500, 1500, 9999])
+        self.assertEqual(table.columns["var"].tolist(), [501, 501, 501])
+        self.assertEqual(table.columns["turvar"].tolist(), [1, 2, 1])
+        self.assertEqual(table.columns["tahun"].tolist(), [124, 124, 124])
+        self.assertEqual(table.region_breakdown(), ({"JAMBI": 72.09}, {"JAMBI": {"Laki-laki": 70.09, "Perempuan": 74.09}}))
+
+    def test_empty_response(self):
+        self.assertEqual(DataContent(None).region_values(), {})
+        self.assertEqual(DataContent({"datacontent": {}, "vervar": []}).region_breakdown(), ({}, {}))
+
+
+class RegionMatcherTests(SimpleTestCase):
+    """Nama wilayah BPS -> fitur batas: exact, alias, fuzzy, dan near-miss yang harus ditolak"""
+
+    provinces = [(group[0], group[0]) for group in PROVINCE_ALIASES]
+    regencies = [
+        (name, name) for name in [
+            "KABUPATEN BANDUNG", "KABUPATEN BANDUNG BARAT", "KOTA BANDUNG", "KOTA BATU",
+            "KABUPATEN BOGOR", "KOTA BOGOR", "KABUPATEN MALANG", "KOTA MALANG", "KOTA ADMINISTRASI JAKARTA PUSAT",
+        ]
+    ]
+
+    def assertMatch(self, matcher, name, key, method=None):
+        match = matcher.match(name)
+        self.assertIsNotNone(match, name)
+        self.assertEqual(match.key, key, name)
+        if method:
+            self.assertEqual(match.method, method, name)
+
+    def test_province_exact_and_alias(self):
+        matcher = RegionMatcher(self.provinces)
+        self.assertMatch(matcher, "Papua", "PAPUA", "exact")
+        self.assertMatch(matcher, "PAPUA BARAT", "PAPUA BARAT", "exact")
+        self.assertMatch(matcher, "Irian Jaya Barat", "PAPUA BARAT", "exact")
+        self.assertMatch(matcher, "Prov. DIY", "DI YOGYAKARTA", "exact")
+        self.assertMatch(matcher, "Kep. Riau", "KEPULAUAN RIAU", "exact")
+
+    def test_province_fuzzy(self):
+        matcher = RegionMatcher(self.provinces)
+        self.assertMatch(matcher, "Sulawesi Tengahh", "SULAWESI TENGAH", "fuzzy")
+        self.assertMatch(matcher, "Jawa Barar", "JAWA BARAT", "fuzzy")
+
+    def test_new_provinces_not_matched(self):
+        # Provinsi pemekaran yang belum ada di layer batas tidak boleh jatuh ke PAPUA/PAPUA BARAT
+        matcher = RegionMatcher(self.provinces)
+        for name in ["Papua Selatan", "Papua Tengah", "Papua Pegunungan", "Papua Barat Daya"]:
+            self.assertIsNone(matcher.match(name), name)
+        self.assertIsNone(matcher.match("Kalimantan"))
+
+    def test_regency_type_kept(self):
+        matcher = RegionMatcher(self.regencies, level="kabupaten")
+        self.assertMatch(matcher, "Kab. Bandung", "KABUPATEN BANDUNG", "exact")
+        self.assertMatch(matcher, "Kota Bandung", "KOTA BANDUNG", "exact")
+        self.assertMatch(matcher, "Bandung", "KABUPATEN BANDUNG", "exact")
+        # Nama tanpa awalan yang hanya ada sebagai kota
+        self.assertMatch(matcher, "Batu", "KOTA BATU", "exact")
+        self.assertMatch(matcher, "Jakarta Pusat", "KOTA ADMINISTRASI JAKARTA PUSAT", "exact")
+
+    def test_regency_near_misses(self):
+        matcher = RegionMatcher(self.regencies, level="kabupaten")
+        # Awalan tipe tidak ikut dinilai: KABUPATEN BATU bukan KABUPATEN BANDUNG
+        self.assertIsNone(matcher.match("Kabupaten Batu"))
+        self.assertIsNone(matcher.match("Kota Bandung Barat"))
+        self.assertIsNone(matcher.match("Kabupaten Bekasi"))
+        self.assertMatch(matcher, "Kota Bandungg", "KOTA BANDUNG", "fuzzy")
+        self.assertMatch(matcher, "Kab Bogr", "KABUPATEN BOGOR", "fuzzy")
+        self.assertMatch(matcher, "Batuu", "KOTA BATU", "fuzzy")
+
+    def test_cache_keeps_prefix(self):
+        matcher = RegionMatcher(self.regencies, level="kabupaten")
+        self.assertIsNone(matcher.match("Kabupaten Batu"))
+        self.assertMatch(matcher, "Batu", "KOTA BATU")
+        self.assertIsNone(matcher.match("Kabupaten Batu"))
+
+
+def _ellipse(count, a=2.0, b=1.0):
+    """Ring ellips tertutup dengan count vertex"""
+    t = np.linspace(0, 2 * np.pi, count, endpoint=False)
+    ring = np.column_stack((a * np.cos(t), b * np.sin(t)))
+    return np.vstack((ring, ring[:1]))
+
+
+class GeometryMetricsTests(SimpleTestCase):
+    """Luas, keliling & centroid banyak ring sekaligus"""
+
+    def test_pixel_areas(self):
+        closed = [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]
+        rng = np.random.default_rng(4)
+        angles = np.sort(rng.uniform(0, 2 * np.pi, 30))
+        star = np.column_stack((np.cos(angles), np.sin(angles))) * rng.uniform(50, 100, (30, 1)) + 500
+        rings = [closed, closed[:-1], closed[::-1], [[0, 0], [5, 5]], [], star]
+
+        areas = pixel_ring_areas(rings)
+        np.testing.assert_allclose(areas[:5], [100, 100, 100, 0, 0])
+        self.assertAlmostEqual(areas[5], shapely.Polygon(star).area, places=6)
+
+        m2 = pixel_ring_areas_m2([closed], lat=-6.2, zoom=19)
+        self.assertAlmostEqual(m2[0], 100 * float(meters_per_pixel(-6.2, 19)) ** 2)
+
+    def test_geo_areas_and_perimeters(self):
+        d = 0.01
+        rings = [_square((106.8, lat), d / 2) for lat in (0.0, -6.2, 60.0)]
+        areas = geo_ring_areas(rings)
+        perimeters = geo_ring_perimeters(rings)
+
+        for (lng, lat), area, perimeter in zip([(106.8, 0.0), (106.8, -6.2), (106.8, 60.0)], areas, perimeters):
+            south, north = np.radians(lat - d / 2), np.radians(lat + d / 2)
+            side = EARTH_RADIUS * np.radians(d)
+            # Persegi lng/lat pada bola: luas & keliling analitik
+            self.assertAlmostEqual(area, EARTH_RADIUS * side * (np.sin(north) - np.sin(south)), delta=area * 1e-9)
+            expected = 2 * side + side * (np.cos(south) + np.cos(north))
+            self.assertAlmostEqual(perimeter, expected, delta=1e-3)
+        # Sisi penutup ring terbuka ikut dihitung
+        np.testing.assert_allclose(geo_ring_perimeters([rings[1][:-1]]), perimeters[1:2])
+
+    def test_geo_centroids(self):
+        square = _square((106.8, -6.2), 0.005)
+        triangle = [[106.0, -6.0], [106.03, -6.0], [106.0, -6.03]]
+        centroids = geo_ring_centroids([square, square[2:-1] + square[:2], triangle, [[1, -1], [3, 1]], []])
+
+        np.testing.assert_allclose(centroids[0], [106.8, -6.2], atol=1e-6)
+        np.testing.assert_allclose(centroids[1], centroids[0], atol=1e-9)
+        np.testing.assert_allclose(centroids[2], [106.01, -6.01], atol=1e-4)
+        # Ring tanpa luas: rata-rata vertex; ring kosong: NaN
+        np.testing.assert_allclose(centroids[3], [2, 0], atol=1e-9)
+        self.assertTrue(np.isnan(centroids[4]).all())
+
+
+class SimplifyTests(SimpleTestCase):
+    """Douglas–Peucker + batas vertex: ring tetap tertutup, tidak pernah kembali ke ring asli"""
+
+    def test_tolerance_keeps_closed_ring(self):
+        ring = _ellipse(200)
+        mask = simplify_ring_mask(ring, 0.01)
+        self.assertTrue(mask[0] and mask[-1])
+        self.assertLess(mask.sum(), len(ring))
+        simplified = shapely.Polygon(ring[mask])
+        self.assertTrue(simplified.is_valid)
+        self.assertAlmostEqual(simplified.area, shapely.Polygon(ring).area, delta=0.05)
+
+    def test_vertex_cap(self):
+        ring = _ellipse(200)
+        for cap in (3, 4, 10, 50):
+            with self.subTest(cap=cap):
+                mask = simplify_ring_mask(ring, 0.001, max_vertices=cap)
+                # Vertex tanpa titik penutup tidak melebihi cap, ring tetap tertutup
+                self.assertLessEqual(mask[:-1].sum(), cap)
+                self.assertGreaterEqual(mask[:-1].sum(), 3)
+                self.assertTrue(mask[0] and mask[-1])
+                self.assertGreater(shapely.Polygon(ring[mask]).area, 0)
+
+    def test_cap_without_tolerance(self):
+        mask = simplify_ring_mask(_ellipse(200), 0, max_vertices=8)
+        self.assertLessEqual(mask[:-1].sum(), 8)
+
+    def test_large_tolerance_keeps_triangle(self):
+        ring = _ellipse(200)
+        mask = simplify_ring_mask(ring, 100)
+        self.assertEqual(mask[:-1].sum(), 3)
+        self.assertGreater(shapely.Polygon(ring[mask]).area, 0)
+
+    def test_small_ring_untouched(self):
+        square = [[0, 0], [1, 0], [1, 1], [0, 0]]
+        self.assertTrue(simplify_ring_mask(square, 10).all())
+
+    def test_packed_rings(self):
+        rings = [_ellipse(100), _ellipse(60, 1, 1)]
+        coords = np.vstack(rings)
+        counts = np.array([len(r) for r in rings])
+        starts = np.array([0, counts[0]])
+
+        new_coords, new_starts, new_counts = simplify_packed(coords, starts, counts, 0.001, max_vertices=[5, 20])
+
+        self.assertEqual(len(new_coords), new_counts.sum())
+        self.assertEqual(new_starts.tolist(), [0, new_counts[0]])
+        self.assertLessEqual(new_counts[0] - 1, 5)
+        self.assertLessEqual(new_counts[1] - 1, 20)
+
+    def test_geo_ring_tolerance_in_meters(self):
+        ring = _ellipse(200, 0.001, 0.0005) + [106.8, -6.2]
+        self.assertEqual(len(simplify_geo_ring(ring, 0)), len(ring))
+        self.assertLess(len(simplify_geo_ring(ring, 2.0)), len(ring))
+        self.assertLessEqual(len(simplify_geo_ring(ring, 0.01, max_vertices=12)), 13)
+
+
+class _TrackedImage(io.BytesIO):
+    """File upload PNG yang mencatat kapan pertama kali dibaca (di-decode)"""
+
+    def __init__(self, data, opened):
+        super().__init__(data)
+        self.opened = opened
+
+    def read(self, *args):
+        if self not in self.opened:
+            self.opened.append(self)
+        return super().read(*args)
+
+
+class _FakeModel:
+    """Model YOLO tiruan: satu bounding box per gambar, mencatat ukuran mini-batch"""
+
+    def __init__(self, opened):
+        self.opened = opened
+        self.calls = []
+
+    def predict(self, source, **kwargs):
+        self.calls.append((len(source), len(self.opened)))
+        boxes = SimpleNamespace(cls=np.array([0]), conf=np.array([0.9]), xyxy=np.array([[0, 0, 64, 64]]))
+        return [SimpleNamespace(names={0: "bangunan"}, boxes=boxes, masks=None) for _ in source]
+
+
+class RunBatchTests(SimpleTestCase):
+    """Deteksi multi-tile: gambar di-decode per mini-batch, tile rusak tidak menggagalkan batch"""
+
+    def test_images_decoded_per_mini_batch(self):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new("RGB", (640, 640)).save(buffer, format="PNG")
+
+        opened = []
+        files = [_TrackedImage(buffer.getvalue(), opened) for _ in range(7)]
+        files[3] = _TrackedImage(b"bukan gambar", opened)
+        tiles = [{"index": i, "lat": -6.2, "lng": 106.8, "capture_size": 640} for i in range(7)]
+        model = _FakeModel(opened)
+
+        results, stats = run_batch(model, files, tiles, ["bangunan"], batch_size=3, simplify_tolerance_m=0)
+
+        # Saat tiap predict berjalan, hanya gambar sampai mini-batch tersebut yang sudah dibaca
+        self.assertEqual(model.calls, [(3, 3), (2, 6), (1, 7)])
+        self.assertEqual(sorted(r["index"] for r in results), list(range(7)))
+        failed = [r for r in results if r["status"] == "error"]
+        self.assertEqual([r["index"] for r in failed], [3])
+        self.assertEqual(stats["total_tiles"], 7)
+        self.assertEqual(stats["total_batches"], 3)
+        detected = next(r for r in results if r["index"] == 0)
+        self.assertEqual(detected["results"][0]["kategori"], "bangunan")
+
+
+class _StubBPSServer:
+    """
+    Stub WebAPI BPS lokal (http.server di thread). Respons per var: list (status, body, delay)
+    dipakai berurutan, item terakhir diulang. Jumlah request per var dicatat di hits.
+    """
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.hits = {}
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                var = self.path.split("/var/")[1].split("/")[0]
+                with stub._lock:
+                    count = stub.hits[var] = stub.hits.get(var, 0) + 1
+                script = stub.responses[var]
+                status, body, delay = script[min(count, len(script)) - 1]
+                time.sleep(delay)
+                payload = json.dumps(body).encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client sudah menyerah (timeout/deadline)
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1/api"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _dataset(var):
+    return BPSDataset(str(var), "124", "0000")
+
+
+_BPS_OK = {"data-availability": "available", "datacontent": {"150050101240": 72.1}}
+
+
+class BPSClientTests(SimpleTestCase):
+    """BPSClient terhadap stub server lokal: retry + jitter, deadline, single-flight, fetch_many parsial"""
+
+    def make_client(self, responses, **kwargs):
+        stub = _StubBPSServer(responses)
+        self.addCleanup(stub.close)
+        options = {"api_key": "test", "timeout": 2, "deadline": 5, "max_retries": 3, "max_workers": 4}
+        options.update(kwargs)
+        return stub, BPSClient(base_url=stub.url, **options)
+
+    def test_retry_with_jitter_on_5xx(self):
+        stub, client = self.make_client({"1": [(503, {}, 0), (502, {}, 0), (200, _BPS_OK, 0)]})
+        delays = []
+
+        def jitter(low, high):
+            delays.append((low, high))
+            return 0.0
+
+        with mock.patch.object(bps_client.random, "uniform", side_effect=jitter):
+            self.assertEqual(client.fetch(_dataset(1)), _BPS_OK)
+
+        self.assertEqual(stub.hits["1"], 3)
+        # Full jitter: uniform(0, base * 2^attempt)
+        self.assertEqual(delays, [(0, bps_client.BPS_BACKOFF_BASE), (0, bps_client.BPS_BACKOFF_BASE * 2)])
+
+    def test_retry_exhausted_and_client_error_not_retried(self):
+        stub, client = self.make_client({"1": [(500, {}, 0)], "2": [(404, {}, 0)]}, max_retries=2)
+        with mock.patch.object(bps_client.random, "uniform", return_value=0.0):
+            self.assertIsNone(client.fetch(_dataset(1)))
+            self.assertIsNone(client.fetch(_dataset(2)))
+        self.assertEqual(stub.hits, {"1": 3, "2": 1})
+
+    def test_unavailable_data(self):
+        _, client = self.make_client({"1": [(200, {"data-availability": "list-not-available"}, 0)]})
+        self.assertIsNone(client.fetch(_dataset(1)))
+
+    def test_deadline(self):
+        _, client = self.make_client({"1": [(200, _BPS_OK, 1.0)]}, deadline=0.3)
+        started = time.monotonic()
+        self.assertIsNone(client.fetch(_dataset(1)))
+        self.assertLess(time.monotonic() - started, 0.9)
+
+    def test_single_flight(self):
+        stub, client = self.make_client({"1": [(200, _BPS_OK, 0.3)]})
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(client.get(_dataset(1)))) for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(stub.hits["1"], 1)
+        self.assertEqual(results, [(_BPS_OK, "network")] * 5)
+
+    def test_fetch_many_partial_failure(self):
+        stub, client = self.make_client(
+            {"1": [(200, _BPS_OK, 0)], "2": [(500, {}, 0)], "3": [(200, _BPS_OK, 2.0)]}, max_retries=1
+        )
+        sources = {}
+        with mock.patch.object(bps_client.random, "uniform", return_value=0.0):
+            results = client.fetch_many(
+                {"ok": _dataset(1), "gagal": _dataset(2), "lambat": _dataset(3)}, deadline=0.5, sources=sources
+            )
+
+        self.assertEqual(results, {"ok": _BPS_OK, "gagal": None, "lambat": None})
+        self.assertEqual(sources, {"ok": "network", "gagal": "error", "lambat": "error"})
+        self.assertEqual(stub.hits["2"], 2)
+
+    def test_listener_notified_once_per_fetch(self):
+        _, client = self.make_client({"1": [(200, _BPS_OK, 0)], "2": [(500, {}, 0)]}, max_retries=0)
+        seen = []
+        client.add_listener(lambda dataset, data: seen.append(dataset.var))
+        client.fetch_many({"a": _dataset(1), "b": _dataset(2)})
+        self.assertEqual(seen, ["1"])
+
+
+# ============ KOLEKSI MONGODB IN-MEMORY ============
+
+_MISSING = object()
+
+
+def _field(document, path):
+    for part in path.split("."):
+        if not isinstance(document, dict) or part not in document:
+            return _MISSING
+        document = document[part]
+    return document
+
+
+def _matches_value(value, condition):
+    if not (isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition)):
+        return value == condition
+    for op, arg in condition.items():
+        present = value is not _MISSING and value is not None
+        if op == "$in" and (value is _MISSING or value not in arg):
+            return False
+        if op == "$nin" and value in arg:
+            return False
+        if op == "$ne" and value == arg:
+            return False
+        if op == "$exists" and (value is not _MISSING) != bool(arg):
+            return False
+        if op in ("$gt", "$gte", "$lt", "$lte"):
+            if not present:
+                return False
+            compare = {"$gt": value > arg if present else False, "$gte": value >= arg if present else False,
+                       "$lt": value < arg if present else False, "$lte": value <= arg if present else False}
+            if not compare[op]:
+                return False
+    return True
+
+
+def _matches(document, query):
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(_matches(document, q) for q in condition):
+                return False
+        elif key == "$and":
+            if not all(_matches(document, q) for q in condition):
+                return False
+        elif not _matches_value(_field(document, key), condition):
+            return False
+    return True
+
+
+def _project(document, projection):
+    document = copy.deepcopy(document)
+    if not projection:
+        return document
+    included = [k for k, v in projection.items() if v and k != "_id"]
+    if not included:
+        for key, value in projection.items():
+            if not value:
+                document.pop(key, None)
+        return document
+    result = {} if not projection.get("_id", 1) else {"_id": document.get("_id")}
+    for path in included:
+        value = _field(document, path)
+        if value is _MISSING:
+            continue
+        target = result
+        parts = path.split(".")
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return result
+
+
+class _MemoryCursor:
+    def __init__(self, documents, projection):
+        self.documents = documents
+        self.projection = projection
+
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            self.documents.sort(key=lambda d: _field(d, field), reverse=order == -1)
+        return self
+
+    def limit(self, count):
+        if count:
+            self.documents = self.documents[:count]
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __iter__(self):
+        return iter([_project(d, self.projection) for d in self.documents])
+
+
+class _MemoryCollection:
+    """Pengganti koleksi pymongo untuk test (query/operator yang dipakai modul core saja)"""
+
+    def __init__(self):
+        self.documents = []
+        self.calls = {}
+
+    def _count(self, name):
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def _insert(self, document):
+        document.setdefault("_id", len(self.documents) + 1)
+        self.documents.append(copy.deepcopy(document))
+
+    def insert_one(self, document):
+        self._count("insert_one")
+        self._insert(document)
+
+    def insert_many(self, documents, ordered=True):
+        self._count("insert_many")
+        for document in documents:
+            self._insert(document)
+
+    def find_one(self, query=None, projection=None):
+        self._count("find_one")
+        return next((_project(d, projection) for d in self.documents if _matches(d, query)), None)
+
+    def find(self, query=None, projection=None):
+        self._count("find")
+        return _MemoryCursor([d for d in self.documents if _matches(d, query)], projection)
+
+    def distinct(self, key, query=None):
+        values = []
+        for document in self.documents:
+            value = _field(document, key)
+            if _matches(document, query) and value is not _MISSING and value not in values:
+                values.append(value)
+        return values
+
+    def _apply(self, document, update):
+        for op, fields in update.items():
+            for key, value in fields.items():
+                if op == "$set":
+                    document[key] = copy.deepcopy(value)
+                elif op == "$inc":
+                    document[key] = document.get(key, 0) + value
+                elif op == "$unset":
+                    document.pop(key, None)
+
+    def update_one(self, query, update, upsert=False):
+        self._count("update_one")
+        for document in self.documents:
+            if _matches(document, query):
+                self._apply(document, update)
+                return SimpleNamespace(matched_count=1, modified_count=1)
+        return SimpleNamespace(matched_count=0, modified_count=0)
+
+    def update_many(self, query, update):
+        self._count("update_many")
+        matched = [d for d in self.documents if _matches(d, query)]
+        for document in matched:
+            self._apply(document, update)
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched))
+
+    def bulk_write(self, requests, ordered=True):
+        # requests: (query, update) dari UpdateOne yang di-patch di modul yang diuji
+        self._count("bulk_write")
+        for query, update in requests:
+            self.update_one(query, update)
+
+    def replace_one(self, query, replacement, upsert=False):
+        self._count("replace_one")
+        for i, document in enumerate(self.documents):
+            if _matches(document, query):
+                self.documents[i] = copy.deepcopy(replacement)
+                return SimpleNamespace(matched_count=1, modified_count=1)
+        if upsert:
+            self.documents.append(copy.deepcopy(replacement))
+        return SimpleNamespace(matched_count=0, modified_count=0)
+
+
+# ============ JOB DETEKSI ============
+
+def _job_tiles(count, size=10, bad=()):
+    return [
+        {"index": i, "lat": -6.2, "lng": 106.8, "capture_size": 640,
+         "image_bytes": b"rusak" if i in bad else b"x" * size}
+        for i in range(count)
+    ]
+
+
+def _fake_prepare_image(file):
+    data = file.read()
+    if data == b"rusak":
+        raise ValueError("gambar rusak")
+    return data
+
+
+def _fake_detect_tiles(model, images, tiles, *args):
+    return [{"index": tile["index"], "status": "success", "results": []} for tile in tiles]
+
+
+class DetectionJobTests(SimpleTestCase):
+    """Antrian job deteksi: batas jumlah & bytes, hasil per dokumen, job yatim"""
+
+    def setUp(self):
+        self.jobs = _MemoryCollection()
+        self.results = _MemoryCollection()
+        patches = [
+            mock.patch.object(detection_jobs, "jobs_collection", self.jobs),
+            mock.patch.object(detection_jobs, "results_collection", self.results),
+            mock.patch.object(detection_jobs, "_job_queue", queue.Queue(maxsize=2)),
+            mock.patch.object(detection_jobs, "_queued_bytes", 0),
+            mock.patch.object(detection_jobs, "DETECTION_JOB_QUEUE_MAX_BYTES", 1000),
+            mock.patch.object(detection_jobs, "_owner", f"{socket.gethostname()}:{os.getpid()}:test"),
+            # Worker tidak dijalankan, job diproses langsung lewat run_next()
+            mock.patch.object(detection_jobs, "_ensure_workers", lambda: None),
+            mock.patch.object(detection_jobs, "get_model", lambda: None),
+            mock.patch.object(detection_jobs, "prepare_image", _fake_prepare_image),
+            mock.patch.object(detection_jobs, "detect_tiles", _fake_detect_tiles),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def run_next(self):
+        job_id, tiles, categories, batch_size, tolerance = detection_jobs._job_queue.get_nowait()
+        try:
+            detection_jobs._run_job(job_id, tiles, categories, batch_size, tolerance)
+        finally:
+            detection_jobs._drop_images(tiles)
+        return job_id
+
+    def status(self, job_id):
+        return self.jobs.find_one({"job_id": job_id})["status"]
+
+    def test_byte_and_count_bounds(self):
+        first = detection_jobs.submit_job(_job_tiles(6, 100), [])
+        self.assertEqual(detection_jobs.queue_status()["queued_bytes"], 600)
+
+        # Bytes: 600 + 500 > 1000
+        with self.assertRaises(detection_jobs.QueueFullError):
+            detection_jobs.submit_job(_job_tiles(5, 100), [])
+        rejected = [d for d in self.jobs.documents if d["status"] == "rejected"]
+        self.assertEqual(len(rejected), 1)
+
+        detection_jobs.submit_job(_job_tiles(3, 100), [])
+        # Jumlah: antrian maksimal 2 job
+        with self.assertRaises(detection_jobs.QueueFullError):
+            detection_jobs.submit_job(_job_tiles(1, 10), [])
+
+        # Job lebih besar dari seluruh kuota / terlalu banyak tile ditolak langsung
+        with self.assertRaises(ValueError):
+            detection_jobs.submit_job(_job_tiles(1, 1001), [])
+        with self.assertRaises(ValueError):
+            detection_jobs.submit_job(_job_tiles(detection_jobs.DETECTION_MAX_TILES + 1, 0), [])
+
+        # Bytes dilepas setelah job selesai diproses
+        self.assertEqual(self.run_next(), first)
+        self.assertEqual(detection_jobs.queue_status()["queued_bytes"], 300)
+        detection_jobs.submit_job(_job_tiles(5, 100), [])
+
+    def test_results_stored_per_tile(self):
+        job_id = detection_jobs.submit_job(_job_tiles(7, bad={3}), ["bangunan"], batch_size=3)
+        self.run_next()
+
+        self.assertEqual(self.status(job_id), "done")
+        self.assertEqual(sorted(d["tile_index"] for d in self.results.documents), list(range(7)))
+        # Satu insert per mini-batch, bukan satu dokumen job yang terus membesar
+        self.assertEqual(self.results.calls["insert_many"], 3)
+
+        job = detection_jobs.get_job(job_id)
+        self.assertEqual(job["processed_tiles"], 7)
+        self.assertEqual([r["index"] for r in job["results"]], list(range(7)))
+        self.assertEqual(job["results"][3]["status"], "error")
+        self.assertNotIn("heartbeat_at", job)
+        self.assertEqual([r["index"] for r in detection_jobs.get_job(job_id, since=5)["results"]], [5, 6])
+        self.assertEqual(detection_jobs.queue_status()["queued_bytes"], 0)
+
+    def test_orphaned_jobs(self):
+        now = datetime.now(timezone.utc)
+        host = socket.gethostname()
+        stale = now - timedelta(seconds=detection_jobs.DETECTION_JOB_ORPHAN_AFTER + 1)
+        for job_id, owner, heartbeat_at, status in [
+            ("basi", "lain:1:a", stale, "running"),
+            ("hidup-remote", "lain:1:a", now, "queued"),
+            ("proses-mati", f"{host}:999999999:a", now, "running"),
+            ("proses-lama", f"{host}:{os.getpid()}:lama", now, "running"),
+            ("milik-sendiri", detection_jobs._owner, now, "running"),
+            ("selesai", "lain:1:a", stale, "done"),
+        ]:
+            self.jobs.insert_one({"job_id": job_id, "owner": owner, "heartbeat_at": heartbeat_at, "status": status})
+        self.jobs.insert_one({"job_id": "tanpa-heartbeat", "status": "queued"})
+
+        self.assertEqual(detection_jobs.fail_orphaned_jobs(), 4)
+        self.assertEqual({d["job_id"]: d["status"] for d in self.jobs.documents}, {
+            "basi": "failed", "hidup-remote": "queued", "proses-mati": "failed", "proses-lama": "failed",
+            "milik-sendiri": "running", "selesai": "done", "tanpa-heartbeat": "failed",
+        })
+
+        # Polling job yang heartbeat-nya kedaluwarsa langsung mengembalikan failed
+        self.jobs.update_one({"job_id": "hidup-remote"}, {"$set": {"heartbeat_at": stale}})
+        self.assertEqual(detection_jobs.get_job("hidup-remote")["status"], "failed")
+
+
+# ============ DEDUPLIKASI ============
+
+def _feature_doc(feature_id, kategori, center, half=0.0001, created_at="2026-01-01T00:00:00", **extra):
+    return {"feature_id": feature_id, "kategori": kategori, "created_at": created_at,
+            "location": {"type": "Polygon", "coordinates": [_square(center, half)]}, **extra}
+
+
+class EnvelopeIndexTests(SimpleTestCase):
+    """Query envelope per kategori sama dengan brute force, termasuk setelah tree dibangun ulang"""
+
+    def test_query_matches_brute_force(self):
+        rng = np.random.default_rng(8)
+        index = EnvelopeIndex()
+        expected = {}
+        with mock.patch.object(spatial_index, "FRESH_ROWS_MIN", 50):
+            for step in range(6):
+                lower = rng.uniform(0, 1, (100, 2))
+                boxes = np.hstack((lower, lower + rng.uniform(0.001, 0.05, (100, 2))))
+                ids = [f"f{step}-{i}" for i in range(100)]
+                kategoris = rng.choice(["bangunan", "jalan"], 100).tolist()
+                index.insert_many(ids, kategoris, boxes)
+                expected.update((fid, (k, box)) for fid, k, box in zip(ids, kategoris, boxes))
+                # Sebagian dihapus, diganti envelope-nya, atau diganti kategorinya
+                fid = ids[0]
+                index.remove(fid)
+                del expected[fid]
+                fid, box = ids[1], np.array([0.5, 0.5, 0.6, 0.6])
+                index.insert(fid, "bangunan", box)
+                expected[fid] = ("bangunan", box)
+                fid = ids[2]
+                index.update_kategori(fid, "jalan")
+                expected[fid] = ("jalan", expected[fid][1])
+
+                queries = np.hstack((rng.uniform(0, 1, (40, 2)), np.zeros((40, 2))))
+                queries[:, 2:] = queries[:, :2] + 0.1
+                query_kategoris = rng.choice(["bangunan", "jalan", "sungai"], 40).tolist()
+                for kategori, query, found in zip(query_kategoris, queries,
+                                                  index.query_many(query_kategoris, queries)):
+                    brute = {fid for fid, (k, box) in expected.items() if k == kategori
+                             and box[0] <= query[2] and query[0] <= box[2] and box[1] <= query[3] and query[1] <= box[3]}
+                    self.assertEqual(set(found), brute)
+                    self.assertEqual(len(found), len(brute))
+        self.assertEqual(len(index), len(expected))
+
+
+class FeatureDeduplicatorTests(SimpleTestCase):
+    """Duplikat terhadap fitur tersimpan, di dalam batch, dan perubahan dari proses lain"""
+
+    def setUp(self):
+        self.collection = _MemoryCollection()
+        self.collection.insert_one(_feature_doc("lama", "bangunan", (106.8, -6.2)))
+        self.deduplicator = FeatureDeduplicator(self.collection)
+
+    def feature(self, feature_id, center, kategori="bangunan", shift=0.0):
+        return feature_id, kategori, _square((center[0] + shift, center[1]), 0.0001)
+
+    def test_stored_and_in_batch_duplicates(self):
+        results = self.deduplicator.find_duplicates([
+            self.feature("a", (106.8, -6.2), shift=0.00002),
+            self.feature("b", (106.8, -6.2), kategori="jalan"),
+            self.feature("c", (106.9, -6.2)),
+            self.feature("d", (106.9, -6.2), shift=0.00002),
+            self.feature("e", (106.9, -6.2), shift=0.00019),
+            ("f", "bangunan", [[106.8, -6.2]]),
+        ])
+        self.assertEqual([fid for fid, _ in results], ["lama", None, None, "c", None, None])
+        self.assertAlmostEqual(results[0][1], 0.9 / 1.1, places=6)
+
+        # Fitur yang diterima langsung masuk index untuk batch berikutnya (setelah disimpan)
+        self.collection.insert_one(_feature_doc("b", "jalan", (106.8, -6.2)))
+        self.assertEqual(self.deduplicator.find_duplicates([self.feature("g", (106.8, -6.2), kategori="jalan")])[0][0], "b")
+
+    def test_sync_picks_up_changes_from_other_processes(self):
+        self.deduplicator.find_duplicates([])
+        self.deduplicator.find_duplicates([self.feature("x", (100.0, 0.0))])
+
+        # Proses lain: fitur baru, merge geometri fitur lama, ganti kategori, hapus
+        moved = _feature_doc("lama", "bangunan", (107.0, -6.0), updated_at="2026-02-01T00:00:00")
+        self.collection.replace_one({"feature_id": "lama"}, moved)
+        self.collection.insert_one(_feature_doc("baru", "bangunan", (108.0, -6.0),
+                                                created_at="2026-02-01T00:00:00", updated_at="2026-02-01T00:00:00"))
+        self.collection.insert_one(_feature_doc("kategori", "jalan", (109.0, -6.0),
+                                                created_at="2026-02-01T00:00:00", updated_at="2026-02-01T00:00:00"))
+        self.collection.insert_one(_feature_doc("hapus", "bangunan", (110.0, -6.0), created_at="2026-02-01T00:00:00"))
+        self.deduplicator.find_duplicates([self.feature("y", (100.0, 1.0))])
+        self.collection.update_one({"feature_id": "kategori"},
+                                   {"$set": {"kategori": "bangunan", "updated_at": "2026-03-01T00:00:00"}})
+        self.collection.documents = [d for d in self.collection.documents if d["feature_id"] != "hapus"]
+
+        results = self.deduplicator.find_duplicates([
+            self.feature("p", (107.0, -6.0)),
+            self.feature("q", (108.0, -6.0)),
+            self.feature("r", (109.0, -6.0)),
+            self.feature("s", (106.8, -6.2)),
+            self.feature("t", (110.0, -6.0)),
+        ])
+        self.assertEqual([fid for fid, _ in results], ["lama", "baru", "kategori", None, None])
+        self.assertNotIn("hapus", self.deduplicator.index._row_by_id)
+        # Envelope lama "lama" sudah diganti
+        self.assertEqual(self.deduplicator.index.query("bangunan", ring_envelope(_square((106.8, -6.2), 0.0001))), ["s"])
+
+
+# ============ SIMPAN DETEKSI ============
+
+def _polygon_coords(center, half=0.0001):
+    return ", ".join(f"{lng} {lat}" for lng, lat in _square(center, half)[:-1])
+
+
+class _FailingCollection(_MemoryCollection):
+    """insert_many unordered yang gagal untuk index tertentu di chunk pertama"""
+
+    def __init__(self, failed_index):
+        super().__init__()
+        self.failed_index = failed_index
+
+    def insert_many(self, documents, ordered=True):
+        self._count("insert_many")
+        for i, document in enumerate(documents):
+            if self.calls["insert_many"] == 1 and i == self.failed_index:
+                continue
+            self._insert(document)
+        if self.calls["insert_many"] == 1:
+            raise BulkWriteError({"writeErrors": [{"index": self.failed_index, "errmsg": "duplicate key"}]})
+
+
+class SaveDetectionTests(SimpleTestCase):
+    """save_detection: validasi dulu, insert_many per chunk, status per item, kebijakan dedup"""
+
+    def setUp(self):
+        self.use_collection(_MemoryCollection())
+        for patch in [
+            mock.patch.object(views, "SAVE_DETECTION_CHUNK_SIZE", 2),
+            mock.patch.object(views, "UpdateOne", lambda query, update: (query, update)),
+            mock.patch.object(views, "invalidate_rings", lambda rings: None),
+        ]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def use_collection(self, collection):
+        self.collection = collection
+        self.deduplicator = FeatureDeduplicator(collection)
+        for patch in [mock.patch.object(views, "mongo_collection", collection),
+                      mock.patch.object(views, "deduplicator", self.deduplicator)]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def save(self, features, **options):
+        request = APIRequestFactory().post("/api/save-detection/", {"features": features, **options}, format="json")
+        return views.save_detection(request)
+
+    def feature(self, center, confidence=0.5, kategori="bangunan"):
+        return {"nama": "Deteksi", "kategori": kategori, "confidence_score": confidence,
+                "polygon_coords": _polygon_coords(center), "metadata": {"sumber": "test"}}
+
+    def test_chunked_insert_with_item_status(self):
+        features = [self.feature((106.8 + i * 0.01, -6.2)) for i in range(5)]
+        features.insert(2, {"kategori": "bangunan", "polygon_coords": "106.8 -6.2, 106.9 -6.2"})
+        response = self.save(features, simplify="false")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["inserted"], 5)
+        self.assertEqual(self.collection.calls["insert_many"], 3)
+        self.assertNotIn("insert_one", self.collection.calls)
+        self.assertEqual([item["status"] for item in response.data["items"]],
+                         ["inserted", "inserted", "invalid", "inserted", "inserted", "inserted"])
+        stored = {d["feature_id"]: d for d in self.collection.documents}
+        self.assertEqual(set(stored), {item["feature_id"] for item in response.data["items"] if "feature_id" in item})
+        document = next(iter(stored.values()))
+        self.assertEqual(document["metadata"]["sumber"], "test")
+        self.assertAlmostEqual(document["metadata"]["luas_estimasi"], 22.1 * 22.0, delta=25)
+        self.assertEqual(document["updated_at"], document["created_at"])
+
+        response = self.save([{"polygon_coords": None}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["items"][0]["status"], "invalid")
+
+    def test_partial_bulk_write_error(self):
+        self.use_collection(_FailingCollection(failed_index=1))
+        response = self.save([self.feature((106.8 + i * 0.01, -6.2)) for i in range(3)])
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["inserted"], 2)
+        items = response.data["items"]
+        self.assertEqual([item["status"] for item in items], ["inserted", "error", "inserted"])
+        self.assertEqual(items[1]["error"], "duplicate key")
+        # Fitur yang gagal ditulis tidak tertinggal di index deduplikasi
+        self.assertEqual(len(self.deduplicator.index), 2)
+
+    def test_dedup_policies(self):
+        self.save([self.feature((106.8, -6.2), confidence=0.6)])
+        original = self.collection.documents[0]["feature_id"]
+        self.collection.documents[0]["updated_at"] = "2000-01-01T00:00:00"
+
+        dropped = self.save([self.feature((106.8, -6.2), confidence=0.9)])
+        self.assertEqual(dropped.data["items"][0]["status"], "duplicate")
+        self.assertEqual(dropped.data["items"][0]["duplicate_of"], original)
+        self.assertEqual(dropped.data["deduplication"]["dropped"], 1)
+        self.assertEqual(len(self.collection.documents), 1)
+
+        # Merge hanya mengganti fitur lama jika deteksi baru lebih yakin
+        shifted = self.feature((106.80002, -6.2), confidence=0.9)
+        merged = self.save([self.feature((106.8, -6.2), confidence=0.3), shifted], dedup="merge")
+        self.assertEqual([item["status"] for item in merged.data["items"]], ["duplicate", "merged"])
+        self.assertEqual(merged.data["deduplication"]["merged"], 1)
+        self.assertEqual(len(self.collection.documents), 1)
+        document = self.collection.documents[0]
+        self.assertEqual(document["feature_id"], original)
+        self.assertEqual(document["confidence_score"], 0.9)
+        self.assertEqual(document["location"]["coordinates"][0][0], _square((106.80002, -6.2), 0.0001)[0])
+        self.assertGreater(document["updated_at"], "2000-01-01T00:00:00")
+
+        response = self.save([self.feature((106.8, -6.2))], dedup="off")
+        self.assertEqual(response.data["items"][0]["status"], "inserted")
+        self.assertEqual(self.save([], dedup="semua").status_code, 400)
+
+
+# ============ INGESTION UPLOAD ============
+
+class _Upload(io.BytesIO):
+    """File upload minimal (name & size seperti UploadedFile Django)"""
+
+    def __init__(self, name, content):
+        super().__init__(content)
+        self.name = name
+        self.size = len(content)
+
+
+def _xlsx(rows):
+    workbook = openpyxl.Workbook()
+    for row in rows:
+        workbook.active.append(row)
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+class IngestionTests(SimpleTestCase):
+    """Sniff separator/header, parse CSV (polars & pandas sama), batas ukuran & baris"""
+
+    def read(self, name, content, engine="pandas"):
+        with mock.patch.object(ingestion, "UPLOAD_CSV_ENGINE", engine):
+            return ingestion.read_upload(_Upload(name, content))
+
+    def test_sniff(self):
+        self.assertEqual(ingestion.sniff_csv(b"Provinsi;Nilai\nACEH;1,5\nBALI;2\n"), (";", True))
+        self.assertEqual(ingestion.sniff_csv(b"Provinsi\t2019\t2020\nACEH\t1\t2\n"), ("\t", True))
+        self.assertEqual(ingestion.sniff_csv(b"11,1.5,3\n12,2.5,4\n13,3.5,5\n"), (",", False))
+        self.assertEqual(ingestion.sniff_csv(b""), (",", True))
+
+    def test_engines_agree_without_dropping_values(self):
+        # Nilai teks setelah 10.000 baris angka tidak boleh berubah jadi null
+        rows = [f"W{i};{i};{i}.5;{'' if i % 7 == 0 else i}" for i in range(10050)]
+        rows.append("AKHIR;tidak ada;1.5;3")
+        content = ("\ufeffWilayah;Nilai;Rasio;Kosong\n" + "\n".join(rows) + "\n").encode()
+
+        pandas_df = self.read("data.csv", content)
+        self.assertEqual(list(pandas_df.columns), ["Wilayah", "Nilai", "Rasio", "Kosong"])
+        self.assertEqual(pandas_df["Nilai"].iloc[-1], "tidak ada")
+        if ingestion.pl is None:
+            return
+        polars_df = self.read("data.csv", content, engine="polars")
+        self.assertEqual(list(polars_df.columns), list(pandas_df.columns))
+        self.assertEqual(polars_df["Nilai"].tolist(), pandas_df["Nilai"].tolist())
+        np.testing.assert_array_equal(polars_df["Rasio"].to_numpy(), pandas_df["Rasio"].to_numpy())
+        np.testing.assert_array_equal(polars_df["Kosong"].to_numpy(), pandas_df["Kosong"].to_numpy())
+
+    def test_headerless_csv(self):
+        df = self.read("data.csv", b"11,1.5,3\n12,2.5,4\n13,3.5,5\n")
+        self.assertEqual(list(df.columns), ["KOLOM_1", "KOLOM_2", "KOLOM_3"])
+        self.assertEqual(len(df), 3)
+
+    def test_limits(self):
+        content = b"Wilayah,Nilai\n" + b"".join(b"W%d,%d\n" % (i, i) for i in range(30))
+        with mock.patch.object(ingestion, "UPLOAD_MAX_BYTES", len(content) - 1):
+            with self.assertRaises(ingestion.IngestionError) as error:
+                self.read("data.csv", content)
+        self.assertEqual(error.exception.status, 413)
+
+        with mock.patch.object(ingestion, "UPLOAD_MAX_ROWS", 29), mock.patch.object(ingestion, "CSV_CHUNK_ROWS", 8):
+            for engine in ("pandas", "polars"):
+                with self.assertRaises(ingestion.IngestionError) as error:
+                    self.read("data.csv", content, engine)
+                self.assertEqual(error.exception.status, 413)
+        with mock.patch.object(ingestion, "UPLOAD_MAX_ROWS", 30):
+            self.assertEqual(len(self.read("data.csv", content)), 30)
+
+        with self.assertRaises(ingestion.IngestionError) as error:
+            self.read("data.json", b"[]")
+        self.assertEqual(error.exception.status, 400)
+
+    @skipUnless(openpyxl, "openpyxl belum terpasang")
+    def test_xlsx_streaming(self):
+        content = _xlsx([[None, None], ["Provinsi", "Nilai", None], ["ACEH", 1.5], [None, None], ["BALI", 2, "lebih"]])
+        df = self.read("data.xlsx", content)
+        self.assertEqual(list(df.columns), ["Provinsi", "Nilai", "KOLOM_3"])
+        self.assertEqual(df["Provinsi"].tolist(), ["ACEH", "BALI"])
+        self.assertEqual(df["Nilai"].tolist(), [1.5, 2.0])
+        self.assertTrue(df["KOLOM_3"].isna().iloc[0])
+        self.assertEqual(df["KOLOM_3"].iloc[1], "lebih")
+
+        with mock.patch.object(ingestion, "UPLOAD_MAX_ROWS", 1):
+            with self.assertRaises(ingestion.IngestionError) as error:
+                self.read("data.xlsx", content)
+        self.assertEqual(error.exception.status, 413)
+
+
+# ============ CACHE HASIL ANALISIS ============
+
+class _BrokenCollection:
+    def find_one(self, *args, **kwargs):
+        raise RuntimeError("mongo mati")
+
+    def replace_one(self, *args, **kwargs):
+        raise RuntimeError("dokumen terlalu besar")
+
+
+class ResultCacheTests(SimpleTestCase):
+    """LRU in-memory di depan MongoDB, TTL, key berbasis isi file"""
+
+    def test_memory_then_mongo(self):
+        collection = _MemoryCollection()
+        cache = ResultCache(collection, max_entries=2, ttl=60)
+        key = ResultCache.key("abc", "v1", "provinsi")
+        self.assertEqual(cache.get(key), (None, None))
+
+        analysis = {"summary": {"total": 3}, "rows": [1.5, None, "x"]}
+        cache.set(key, analysis)
+        self.assertEqual(cache.get(key), (analysis, "memory"))
+        document = collection.documents[0]
+        self.assertIsInstance(document["payload"], bytes)
+        self.assertEqual(document["expires_at"] - document["created_at"], timedelta(seconds=60))
+
+        # Proses lain (LRU kosong) membaca dari MongoDB lalu menyimpannya di memori
+        other = ResultCache(collection, max_entries=2, ttl=60)
+        self.assertEqual(other.get(key), (analysis, "mongo"))
+        self.assertEqual(other.get(key), (analysis, "memory"))
+
+        # Entri kedaluwarsa tidak dipakai (TTL index MongoDB bisa terlambat menghapus)
+        document["expires_at"] = datetime.utcnow() - timedelta(seconds=1)
+        self.assertEqual(ResultCache(collection).get(key), (None, None))
+
+    def test_lru_eviction(self):
+        collection = _MemoryCollection()
+        cache = ResultCache(collection, max_entries=2, ttl=60)
+        for name in ("a", "b"):
+            cache.set(name, {"nama": name})
+        cache.get("a")
+        cache.set("c", {"nama": "c"})
+        self.assertEqual(list(cache._entries), ["a", "c"])
+        self.assertEqual(cache.get("b"), ({"nama": "b"}, "mongo"))
+
+    def test_mongo_errors_do_not_fail_analysis(self):
+        cache = ResultCache(_BrokenCollection())
+        cache.set("k", {"nilai": 1})
+        self.assertEqual(cache.get("k"), ({"nilai": 1}, "memory"))
+        self.assertEqual(cache.get("lain"), (None, None))
+
+    def test_keys(self):
+        file = _Upload("data.csv", b"Provinsi,Nilai\nACEH,1\n" * 1000)
+        file.read(10)
+        digest = file_digest(file, chunk_size=100)
+        self.assertEqual(file.tell(), 0)
+        self.assertEqual(digest, file_digest(_Upload("lain.csv", file.getvalue())))
+        self.assertNotEqual(digest, file_digest(_Upload("data.csv", file.getvalue() + b"BALI,2\n")))
+
+        self.assertEqual(ResultCache.key(digest, "v1"), ResultCache.key(digest, "v1"))
+        self.assertNotEqual(ResultCache.key(digest, "v1"), ResultCache.key(digest, "v2"))
+
+
+# ============ CACHE DATASET BPS ============
+
+_BPS_NEW = {"data-availability": "available", "datacontent": {"150050101240": 73.4}}
+
+
+class BPSCacheTests(SimpleTestCase):
+    """Cache BPS: segar / basi (refresh di background) / kedaluwarsa, force_refresh, fallback"""
+
+    def make_client(self, responses, ttl=60, max_stale=600):
+        stub = _StubBPSServer(responses)
+        self.addCleanup(stub.close)
+        self.collection = _MemoryCollection()
+        cache = BPSCache(self.collection, ttl=ttl, max_stale=max_stale, max_entries=8)
+        return stub, BPSClient(base_url=stub.url, api_key="test", timeout=2, deadline=5, max_retries=0, cache=cache)
+
+    def age(self, client, dataset, seconds):
+        """Mundurkan waktu fetch entri cache (memori & MongoDB)"""
+        key = BPSCache.key(dataset)
+        fetched_at, data = client.cache._entries[key]
+        client.cache._entries[key] = (fetched_at - seconds, data)
+        document = self.collection.find_one({"_id": key})
+        self.collection.update_one({"_id": key}, {"$set": {"fetched_at": document["fetched_at"] - timedelta(seconds=seconds)}})
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_fresh_hits(self):
+        stub, client = self.make_client({"1": [(200, _BPS_OK, 0)]})
+        self.assertEqual(client.get(_dataset(1)), (_BPS_OK, "network"))
+        self.assertEqual(client.get(_dataset(1)), (_BPS_OK, "fresh"))
+
+        # Proses lain membaca salinan MongoDB (payload terkompresi)
+        self.assertIsInstance(self.collection.documents[0]["payload"], bytes)
+        other = BPSClient(base_url=stub.url, api_key="test", cache=BPSCache(self.collection))
+        self.assertEqual(other.get(_dataset(1)), (_BPS_OK, "fresh"))
+        self.assertEqual(stub.hits["1"], 1)
+        self.assertEqual(client.cache.stats(), {"miss": 1, "hit_memory": 1, "entries_memory": 1})
+        self.assertEqual(other.cache.stats(), {"hit_mongo": 1, "entries_memory": 1})
+
+    def test_stale_while_revalidate(self):
+        stub, client = self.make_client({"1": [(200, _BPS_OK, 0), (200, _BPS_NEW, 0.2)]})
+        client.get(_dataset(1))
+        self.age(client, _dataset(1), 120)
+
+        started = time.monotonic()
+        self.assertEqual(client.get(_dataset(1)), (_BPS_OK, "stale"))
+        self.assertEqual(client.get(_dataset(1)), (_BPS_OK, "stale"))
+        self.assertLess(time.monotonic() - started, 0.2)
+
+        self.wait_for(lambda: client.cache._entries[BPSCache.key(_dataset(1))][1] == _BPS_NEW)
+        self.assertEqual(client.get(_dataset(1)), (_BPS_NEW, "fresh"))
+        self.assertEqual(stub.hits["1"], 2)
+        self.assertEqual(client.cache.counters["stale"], 2)
+
+    def test_expired_and_force_refresh(self):
+        stub, client = self.make_client({"1": [(200, _BPS_OK, 0), (200, _BPS_NEW, 0)]})
+        client.get(_dataset(1))
+        # Lewat max_stale: tunggu fetch baru
+        self.age(client, _dataset(1), 601)
+        self.assertEqual(client.get(_dataset(1)), (_BPS_NEW, "network"))
+
+        self.assertEqual(client.get(_dataset(1), force_refresh=True), (_BPS_NEW, "network"))
+        self.assertEqual(stub.hits["1"], 3)
+        self.assertEqual(client.cache.counters["refresh"], 1)
+
+    def test_fallback_when_bps_unreachable(self):
+        stub, client = self.make_client({"1": [(200, _BPS_OK, 0), (503, {}, 0)], "2": [(503, {}, 0)]})
+        client.get(_dataset(1))
+        self.age(client, _dataset(1), 601)
+
+        self.assertEqual(client.get(_dataset(1)), (_BPS_OK, "stale"))
+        self.assertEqual(client.get(_dataset(2)), (None, "error"))
+        self.assertEqual(client.cache.counters["fallback"], 1)
+        self.assertEqual(client.cache.counters["error"], 1)
+
+
+# ============ SNAPSHOT BPS ============
+
+class SnapshotStoreTests(SimpleTestCase):
+    """Snapshot berversi: tulis, aktifkan, baca (mode offline), prune"""
+
+    def setUp(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        self.directory = temp.name
+        self.store = SnapshotStore(self.directory)
+        # Semua versi dibuat pada detik yang sama -> akhiran -2, -3, ...
+        clock = mock.patch.object(bps_snapshots, "datetime", SimpleNamespace(utcnow=lambda: datetime(2026, 1, 1)))
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def test_write_activate_read(self):
+        self.assertIsNone(self.store.read(_dataset(1)))
+        first = self.store.write([(_dataset(1), _BPS_OK)], missing=[_dataset(2)])
+        self.assertEqual(first["version"], "20260101T000000Z")
+        self.assertFalse(first["complete"])
+        self.assertEqual(first["missing"], [{"var": "2", "th": "124", "domain": "0000"}])
+        self.assertEqual(self.store.current_version(), first["version"])
+        self.assertEqual(self.store.read(_dataset(1)), _BPS_OK)
+
+        second = self.store.write([(_dataset(1), _BPS_NEW), (_dataset(2), _BPS_OK)], activate=False,
+                                  carried={_dataset(2): first["version"]})
+        self.assertEqual(second["version"], "20260101T000000Z-2")
+        self.assertTrue(second["complete"])
+        self.assertEqual(second["datasets"][1]["carried_from"], first["version"])
+        # Belum aktif: pembaca tetap memakai versi lama
+        self.assertEqual(self.store.read(_dataset(1)), _BPS_OK)
+        self.assertIsNone(self.store.read(_dataset(2)))
+
+        fresh = SnapshotStore(self.directory)
+        fresh.activate(second["version"])
+        self.assertEqual(fresh.read(_dataset(1)), _BPS_NEW)
+        self.assertEqual(SnapshotStore(self.directory, version=first["version"]).read(_dataset(1)), _BPS_OK)
+        with self.assertRaises(ValueError):
+            fresh.activate("tidak-ada")
+
+        # Folder staging yang tertinggal (proses mati di tengah) bukan versi
+        os.mkdir(os.path.join(self.directory, "20260101T000000Z-3" + bps_snapshots.PARTIAL_SUFFIX))
+        self.assertEqual(self.store.versions(), [first["version"], second["version"]])
+        self.assertEqual(self.store.write([])["version"], "20260101T000000Z-4")
+
+    def test_prune_keeps_active(self):
+        versions = [self.store.write([(_dataset(1), _BPS_OK)], activate=False)["version"] for _ in range(4)]
+        self.store.activate(versions[0])
+        self.assertEqual(self.store.prune(keep=2), versions[1:2])
+        self.assertEqual(self.store.versions(), [versions[0]] + versions[2:])
+        self.assertEqual(self.store.read(_dataset(1)), _BPS_OK)
+        self.assertEqual(self.store.prune(keep=0), [])
+
+    def test_offline_client_reads_snapshot_only(self):
+        self.store.write([(_dataset(1), _BPS_OK)])
+        client = BPSClient(base_url="http://127.0.0.1:9/v1/api", api_key="test", snapshots=self.store, offline=True)
+        sources = {}
+        results = client.fetch_many({"ada": _dataset(1), "tidak": _dataset(2)}, sources=sources)
+        self.assertEqual(results, {"ada": _BPS_OK, "tidak": None})
+        self.assertEqual(sources, {"ada": "snapshot", "tidak": "error"})
+
+
+# ============ MATERIALISASI INDEKS KESEHATAN ============
+
+def _health_data(indikator_key, values):
+    """Response BPS nasional satu indikator: {kode vervar provinsi: nilai}"""
+    config = kesehatan_views.INDIKATOR_KESEHATAN[indikator_key]
+    return {
+        "data-availability": "available",
+        "vervar": [{"val": 1100, "label": "ACEH"}, {"val": 5100, "label": "BALI"}, {"val": 9999, "label": "INDONESIA"}],
+        "datacontent": {f"{code}{config['var']}0{config['th']}0": value for code, value in values.items()},
+    }
+
+
+class _FakeBoundaryLayer:
+    def __init__(self, fingerprint="batas-v1"):
+        self._fingerprint = fingerprint
+        self.matched = []
+
+    def fingerprint(self):
+        return self._fingerprint
+
+    def match(self, name, code=None):
+        self.matched.append(name)
+        return SimpleNamespace(key=f"{code}", name=name.title(), confidence=1.0)
+
+
+class HealthIndexMaterializerTests(SimpleTestCase):
+    """Materialisasi indeks kesehatan: hanya indikator/wilayah yang berubah dihitung ulang"""
+
+    def setUp(self):
+        self.collection = _MemoryCollection()
+        self.fetched = []
+        fake_client = SimpleNamespace(fetch_many=lambda datasets: self.fetched.append(sorted(datasets))
+                                      or {name: None for name in datasets})
+        patch = mock.patch.object(kesehatan_views, "bps_client", fake_client)
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.data = {
+            "AHH": _health_data("AHH", {1100: 70.1, 5100: 74.5, 9999: 73.0}),
+            "IMUNISASI": _health_data("IMUNISASI", {1100: 85.0, 5100: 95.0}),
+            "SANITASI": _health_data("SANITASI", {1100: 65.0, 5100: 90.0}),
+        }
+
+    def materializer(self):
+        return kesehatan_views.HealthIndexMaterializer(self.collection, enabled=True)
+
+    def results(self, document):
+        return {analysis["nama_provinsi"]: analysis for _, analysis in document["analysis"]["matched_results"]}
+
+    def test_missing_indicator_is_not_materialized(self):
+        self.assertIsNone(self.materializer().update({"AHH": self.data["AHH"]}, _FakeBoundaryLayer()))
+        self.assertEqual(self.fetched, [["IMUNISASI", "SANITASI"]])
+        self.assertEqual(self.collection.documents, [])
+
+    def test_incremental_updates(self):
+        layer = _FakeBoundaryLayer()
+        first = self.materializer().update(self.data, layer)
+        self.assertEqual(first["version"], 1)
+        self.assertEqual(sorted(layer.matched), ["ACEH", "BALI"])
+        results = self.results(first)
+        self.assertEqual(results["ACEH"]["data_kesehatan"], {"AHH": 70.1, "IMUNISASI": 85.0, "SANITASI": 65.0})
+        self.assertNotIn("INDONESIA", results)
+
+        # Proses lain membaca dokumen tersimpan (payload terkompresi)
+        other = self.materializer()
+        self.assertEqual(other.current(layer)["version"], 1)
+        self.assertEqual(self.results(other.current(layer)), results)
+        self.assertIsNone(other.current(_FakeBoundaryLayer("batas-v2")))
+
+        # Sumber sama: hanya checked_at yang diperbarui
+        layer.matched.clear()
+        same = other.update({"SANITASI": self.data["SANITASI"]}, layer)
+        self.assertEqual(same["version"], 1)
+        self.assertEqual(layer.matched, [])
+        self.assertEqual(self.collection.calls["replace_one"], 1)
+
+        # Satu indikator berubah untuk BALI saja: ACEH dipakai ulang, indikator lain tidak diubah
+        changed = _health_data("SANITASI", {1100: 65.0, 5100: 60.0})
+        second = other.update({"SANITASI": changed}, layer)
+        self.assertEqual(second["version"], 2)
+        self.assertEqual(layer.matched, ["BALI"])
+        self.assertEqual(self.results(second)["ACEH"], results["ACEH"])
+        self.assertEqual(self.results(second)["BALI"]["data_kesehatan"]["SANITASI"], 60.0)
+        self.assertLess(self.results(second)["BALI"]["health_index"], results["BALI"]["health_index"])
+        self.assertEqual(second["indicators"]["AHH"], first["indicators"]["AHH"])
+        self.assertNotEqual(second["indicators"]["SANITASI"]["sha256"], first["indicators"]["SANITASI"]["sha256"])
+        self.assertEqual(self.fetched, [])
+
+        # Layer batas wilayah berubah: semua wilayah dicocokkan ulang
+        layer = _FakeBoundaryLayer("batas-v2")
+        third = self.materializer().update({}, layer)
+        self.assertEqual(third["version"], 3)
+        self.assertEqual(sorted(layer.matched), ["ACEH", "BALI"])
+
+
+# ============ BAND BATAS WILAYAH ============
+
+class BoundaryBandTests(SimpleTestCase):
+    """Endpoint batas & endpoint analisis memilih band yang sama untuk zoom/tolerance yang sama"""
+
+    def test_analysis_params_match_boundary_view(self):
+        payload = mock.patch.object(views.boundary_registry, "payload",
+                                    lambda level, band, fmt: {"identity": (band.encode(), f'"{band}"')})
+        with payload:
+            for zoom in ["4", "5", "5.5", "7.9", "8", "10.25", "11.5", "16"]:
+                band = analysis_params({"zoom": zoom})[1]
+                self.assertEqual(band, request_band(zoom=zoom))
+                response = views.batas_provinsi(APIRequestFactory().get("/api/batas-provinsi/", {"zoom": zoom}))
+                self.assertEqual(response["X-Boundary-Band"], band)
+        self.assertEqual(request_band(zoom="5.5"), "z8")
+        self.assertEqual(request_band(zoom="11.5"), "full")
+        self.assertEqual(analysis_params({"tolerance": "500"}, {"zoom": "4"}), ("provinsi", "z8"))
+
+    def test_defaults_and_errors(self):
+        self.assertEqual(analysis_params({}, {"level": "kabupaten"}), ("kabupaten", ANALYSIS_BANDS["kabupaten"]))
+        self.assertEqual(analysis_params({"zoom": "", "level": ""}), ("provinsi", ANALYSIS_BANDS["provinsi"]))
+        self.assertEqual(request_band(), "full")
+        for params in ({"zoom": "jauh"}, {"tolerance": "x"}, {"level": "desa"}):
+            with self.assertRaises(ValueError):
+                analysis_params(params)
+
+
+# ============ SUMBER TILE ============
+
+class TileSourceTests(SimpleTestCase):
+    """MBTiles dibuka read-only walau nama file berisi karakter khusus URI"""
+
+    def test_mbtiles_path_with_uri_characters(self):
+        temp = tempfile.TemporaryDirectory()
+        self.addCleanup(temp.cleanup)
+        path = os.path.join(temp.name, "peta 50%?v=1#a.mbtiles")
+        with sqlite3.connect(path) as connection:
+            connection.execute("CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)")
+            connection.execute("INSERT INTO tiles VALUES (2, 1, 0, ?)", (b"tile",))
+        connection.close()
+
+        source = open_tile_source(path)
+        self.addCleanup(source.close)
+        # Baris TMS 0 di zoom 2 = baris XYZ 3
+        self.assertEqual(source.read_tile(2, 1, 3), b"tile")
+        self.assertIsNone(source.read_tile(2, 1, 0))
+        with self.assertRaises(sqlite3.OperationalError):
+            source.connection.execute("DELETE FROM tiles")
@@ -0,0 +1,133 @@
+import io
+import os
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+from PIL import Image
+
+# Sumber tile lokal: folder XYZ ({z}/{x}/{y}.png) atau file .mbtiles
+TILE_SOURCE_PATH = os.getenv("TILE_SOURCE_PATH", "")
+TILE_SIZE = 256
+TILE_EXTENSIONS = ['png', 'jpg', 'jpeg', 'webp']
+
+
+class XYZTileSource:
+    """Baca tile dari folder XYZ: {root}/{z}/{x}/{y}.{ext}"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def read_tile(self, z, x, y):
+        for ext in TILE_EXTENSIONS:
+            path = os.path.join(self.root, str(z), str(x), f"{y}.{ext}")
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    return f.read()
+        return None
+
+    def close(self):
+        pass
+
+
+class MBTilesSource:
+    """Baca tile dari file MBTiles (SQLite, skema TMS)"""
+
+    def __init__(self, path):
+        # URI read-only dari path absolut (karakter ?, #, % di nama file di-escape)
+        uri = Path(path).resolve().as_uri() + "?mode=ro"
+        self.connection = sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    def read_tile(self, z, x, y):
+        # MBTiles memakai penomoran baris TMS (y dibalik)
+        tms_y = (2 ** z - 1) - y
+        row = self.connection.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, tms_y)
+        ).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self.connection.close()
+
+
+def open_tile_source(path=None):
+    """Buka sumber tile sesuai konfigurasi (folder XYZ atau .mbtiles)"""
+    path = path or TILE_SOURCE_PATH
+    if not path:
+        raise ValueError("TILE_SOURCE_PATH belum dikonfigurasi")
+
+    if path.lower().endswith('.mbtiles'):
+        if not os.path.isfile(path):
+            raise ValueError(f"File MBTiles tidak ditemukan: {path}")
+        return MBTilesSource(path)
+
+    if not os.path.isdir(path):
+        raise ValueError(f"Folder tile tidak ditemukan: {path}")
+    return XYZTileSource(path)
+
+
+class TileMosaic:
+    """Susun tile 256px menjadi window gambar berukuran bebas (dengan cache tile)"""
+
+    def __init__(self, source, zoom, cache_size=256):
+        self.source = source
+        self.zoom = zoom
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def _tile(self, x, y):
+        key = (x, y)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        tile = None
+        max_index = 2 ** self.zoom
+        if 0 <= x < max_index and 0 <= y < max_index:
+            data = self.source.read_tile(self.zoom, x, y)
+            if data:
+                tile = Image.open(io.BytesIO(data)).convert('RGB')
+
+        self._cache[key] = tile
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return tile
+
+    def render(self, origin_x, origin_y, size):
+        """
+        Render window persegi dengan pojok kiri atas di pixel global (origin_x, origin_y).
+        Returns: (gambar PIL, jumlah tile yang tersedia)
+        """
+        window = Image.new('RGB', (size, size))
+        found = 0
+
+        first_tx, first_ty = origin_x // TILE_SIZE, origin_y // TILE_SIZE
+        last_tx, last_ty = (origin_x + size - 1) // TILE_SIZE, (origin_y + size - 1) // TILE_SIZE
+
+        for tx in range(first_tx, last_tx + 1):
+            for ty in range(first_ty, last_ty + 1):
+                tile = self._tile(tx, ty)
+                if tile is None:
+                    continue
+                window.paste(tile, (tx * TILE_SIZE - origin_x, ty * TILE_SIZE - origin_y))
+                found += 1
+
+        return window, found
+
+
+def window_origins(pixel_bounds, size, overlap):
+    """
+    Hitung pojok kiri atas window yang menutupi area pixel global (min_x, min_y, max_x, max_y)
+    dengan overlap antar window.
+    """
+    min_x, min_y, max_x, max_y = pixel_bounds
+    step = max(1, size - overlap)
+
+    def axis(start, end):
+        positions = list(range(start, max(start + 1, end - size + 1), step))
+        # Window terakhir menempel ke batas area
+        if positions[-1] + size < end:
+            positions.append(end - size)
+        return positions
+
+    return [(x, y) for y in axis(min_y, max_y) for x in axis(min_x, max_x)]
@@ -0,0 +1,146 @@
+import numpy as np
+from .geometry import simplify_line_mask, simplify_ring_mask
+
+# Konversi kasar meter -> derajat untuk toleransi simplifikasi arc
+METERS_PER_DEGREE = 111320.0
+
+
+def _polygons(geometry):
+    """Daftar polygon (list ring) dari geometry Polygon/MultiPolygon"""
+    if not geometry:
+        return []
+    if geometry.get("type") == "Polygon":
+        return [geometry.get("coordinates") or []]
+    if geometry.get("type") == "MultiPolygon":
+        return geometry.get("coordinates") or []
+    return []
+
+
+def _quantize_rings(features, quantization):
+    """
+    Kuantisasi semua ring ke grid integer.
+    Returns: (rings [(feature_idx, polygon_idx, ring_idx, array int64 terbuka)], transform)
+    """
+    raw = []
+    for fi, feature in enumerate(features):
+        for pi, polygon in enumerate(_polygons(feature.get("geometry"))):
+            for ri, ring in enumerate(polygon):
+                points = np.asarray(ring, dtype=np.float64).reshape(-1, 2)
+                if len(points):
+                    raw.append((fi, pi, ri, points))
+
+    if not raw:
+        return [], {"scale": [1, 1], "translate": [0, 0]}
+
+    stacked = np.concatenate([points for *_, points in raw])
+    low, high = stacked.min(axis=0), stacked.max(axis=0)
+    scale = np.where(high > low, (high - low) / (quantization - 1), 1.0)
+
+    rings = []
+    for fi, pi, ri, points in raw:
+        q = np.round((points - low) / scale).astype(np.int64)
+        # Buang titik berurutan yang sama & titik penutup
+        if len(q) > 1:
+            q = q[np.any(q != np.roll(q, 1, axis=0), axis=1)] if np.any(q != q[0]) else q[:1]
+        if len(q) >= 3:
+            rings.append((fi, pi, ri, q))
+
+    return rings, {"scale": scale.tolist(), "translate": low.tolist()}
+
+
+def _junctions(rings, quantization):
+    """Titik pertemuan >2 tetangga unik (ujung sisi bersama antar wilayah)"""
+    if not rings:
+        return np.array([], dtype=np.int64)
+    keys = [r[:, 0] * quantization + r[:, 1] for *_, r in rings]
+    starts = np.concatenate([k for k in keys])
+    ends = np.concatenate([np.roll(k, -1) for k in keys])
+
+    edges = np.unique(np.column_stack((np.minimum(starts, ends), np.maximum(starts, ends))), axis=0)
+    points, degree = np.unique(edges.ravel(), return_counts=True)
+    return points[degree > 2]
+
+
+def _cut_ring(ring, keys, junction_mask):
+    """Potong ring terbuka menjadi arc di titik junction"""
+    positions = np.flatnonzero(junction_mask)
+    if not len(positions):
+        # Ring tanpa junction: satu arc tertutup mulai dari titik terkecil (kanonik)
+        start = int(np.argmin(keys))
+        rotated = np.roll(ring, -start, axis=0)
+        return [np.vstack((rotated, rotated[:1]))]
+
+    rotated = np.roll(ring, -positions[0], axis=0)
+    cuts = (positions - positions[0]).tolist() + [len(ring)]
+    closed = np.vstack((rotated, rotated[:1]))
+    return [closed[a:b + 1] for a, b in zip(cuts[:-1], cuts[1:])]
+
+
+def build_topology(features, quantization=1e6, tolerance_m=0, object_name="boundaries"):
+    """
+    GeoJSON features -> TopoJSON Topology.
+    Sisi bersama antar wilayah disimpan sekali sebagai arc, disimplifikasi per arc
+    (kedua wilayah tetap berbagi garis yang sama), lalu di-delta-encode.
+    """
+    quantization = int(quantization)
+    rings, transform = _quantize_rings(features, quantization)
+    junction_set = _junctions(rings, quantization)
+
+    arcs = []
+    arc_index = {}
+    ring_arcs = {}
+
+    for fi, pi, ri, ring in rings:
+        keys = ring[:, 0] * quantization + ring[:, 1]
+        refs = []
+        for arc in _cut_ring(ring, keys, np.isin(keys, junction_set)):
+            arc_keys = arc[:, 0] * quantization + arc[:, 1]
+            forward = arc_keys.tobytes()
+            if forward in arc_index:
+                refs.append(arc_index[forward])
+                continue
+            backward = arc_keys[::-1].tobytes()
+            if backward in arc_index:
+                refs.append(~arc_index[backward])
+                continue
+            arc_index[forward] = len(arcs)
+            refs.append(len(arcs))
+            arcs.append(arc)
+        ring_arcs[(fi, pi, ri)] = refs
+
+    # Simplifikasi per arc dalam satuan grid kuantisasi
+    tolerance = tolerance_m / METERS_PER_DEGREE / max(min(transform["scale"]), 1e-12) if tolerance_m else 0
+    encoded_arcs = []
+    for arc in arcs:
+        if tolerance > 0:
+            is_closed = len(arc) > 3 and np.array_equal(arc[0], arc[-1])
+            mask = simplify_ring_mask(arc, tolerance) if is_closed else simplify_line_mask(arc, tolerance)
+            arc = arc[mask]
+        deltas = np.diff(arc, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+        encoded_arcs.append(deltas.tolist())
+
+    geometries = []
+    for fi, feature in enumerate(features):
+        polygons = []
+        for pi, polygon in enumerate(_polygons(feature.get("geometry"))):
+            polygon_arcs = [ring_arcs[(fi, pi, ri)] for ri in range(len(polygon)) if (fi, pi, ri) in ring_arcs]
+            if polygon_arcs:
+                polygons.append(polygon_arcs)
+
+        geometry = {"properties": feature.get("properties", {})}
+        if not polygons:
+            geometry["type"] = None
+        elif (feature.get("geometry") or {}).get("type") == "Polygon":
+            geometry.update({"type": "Polygon", "arcs": polygons[0]})
+        else:
+            geometry.update({"type": "MultiPolygon", "arcs": polygons})
+        geometries.append(geometry)
+
+    return {
+        "type": "Topology",
+        "transform": transform,
+        "objects": {
+            object_name: {"type": "GeometryCollection", "geometries": geometries}
+        },
+        "arcs": encoded_arcs
+    }
@@ -7,7 +7,14 @@ from core import pangan_views
 urlpatterns = [
     # ============ AI DETECTION & FEATURES ============
     path('features/', views.feature_list, name='feature-list'),
+    path('features/viewport/', views.features_in_viewport, name='features-viewport'),
+    path('features/tiles/<int:z>/<int:x>/<int:y>.pbf', views.feature_tile, name='feature-tile'),
     path('run-detection/', views.run_detection, name='run-detection'),
+    path('run-detection-batch/', views.run_detection_batch, name='run-detection-batch'),
+    path('detect-area/', views.detect_area, name='detect-area'),
+    path('detection-jobs/', views.submit_detection_job, name='submit-detection-job'),
+    path('detection-jobs/<str:job_id>/', views.detection_job_status, name='detection-job-status'),
+    path('detection-model/', views.detection_model_status, name='detection-model'),
     path('save-detection/', views.save_detection, name='save-detection'),
     path('features/<str:feature_id>/', views.delete_feature, name='delete-feature'),
     
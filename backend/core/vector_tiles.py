@@ -0,0 +1,328 @@
+import os
+import shutil
+import struct
+import tempfile
+import numpy as np
+from .geometry import lnglat_to_pixel, pixel_to_lnglat, simplify_ring_mask
+
+# Konfigurasi Mapbox Vector Tile untuk ai_features
+MVT_EXTENT = 4096
+MVT_BUFFER = int(os.getenv("MVT_BUFFER", 64))
+MVT_MIN_ZOOM = int(os.getenv("MVT_MIN_ZOOM", 10))
+MVT_MAX_ZOOM = int(os.getenv("MVT_MAX_ZOOM", 22))
+MVT_MAX_FEATURES = int(os.getenv("MVT_MAX_FEATURES", 20000))
+MVT_LAYER_NAME = "ai_features"
+# Di atas jumlah ini invalidasi menelusuri isi folder cache, bukan tiap koordinat tile
+MAX_INVALIDATE_TILES = 4096
+FEATURE_TILE_CACHE_DIR = (
+    os.getenv("FEATURE_TILE_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "terraseg_feature_tiles")
+)
+
+# Perintah geometri MVT
+CMD_MOVE_TO = 1
+CMD_LINE_TO = 2
+CMD_CLOSE_PATH = 7
+GEOM_POLYGON = 3
+
+
+# ============ ENCODER PROTOBUF ============
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+
+def _bytes_field(field, payload):
+    return _key(field, 2) + _varint(len(payload)) + payload
+
+
+def _packed_field(field, values):
+    return _bytes_field(field, b"".join(_varint(v) for v in values))
+
+
+def _encode_value(value):
+    """Value message MVT (string, double, sint, bool)"""
+    if isinstance(value, bool):
+        return _key(7, 0) + _varint(int(value))
+    if isinstance(value, int):
+        return _key(6, 0) + _varint(_zigzag(value))
+    if isinstance(value, float):
+        return _key(3, 1) + struct.pack('<d', value)
+    return _bytes_field(1, str(value).encode('utf-8'))
+
+
+def _encode_geometry(rings):
+    """Ring integer (tile coords) -> command stream MVT"""
+    commands = []
+    cursor_x = cursor_y = 0
+    for ring in rings:
+        deltas = np.diff(ring, axis=0, prepend=[[cursor_x, cursor_y]])
+        cursor_x, cursor_y = ring[-1]
+        zigzag = ((deltas << 1) ^ (deltas >> 63)).tolist()
+
+        commands.append((1 << 3) | CMD_MOVE_TO)
+        commands.extend(zigzag[0])
+        commands.append(((len(ring) - 1) << 3) | CMD_LINE_TO)
+        for pair in zigzag[1:]:
+            commands.extend(pair)
+        commands.append((1 << 3) | CMD_CLOSE_PATH)
+    return commands
+
+
+def encode_layer(features, name=MVT_LAYER_NAME, extent=MVT_EXTENT):
+    """
+    Encode satu layer MVT.
+    features: list (rings, properties), rings berupa array integer di koordinat tile
+    """
+    keys, key_index = [], {}
+    values, value_index = [], {}
+    encoded_features = []
+
+    for rings, properties in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            if key not in key_index:
+                key_index[key] = len(keys)
+                keys.append(key)
+            value_key = (type(value).__name__, value)
+            if value_key not in value_index:
+                value_index[value_key] = len(values)
+                values.append(value)
+            tags.extend((key_index[key], value_index[value_key]))
+
+        feature = (
+            _packed_field(2, tags)
+            + _key(3, 0) + _varint(GEOM_POLYGON)
+            + _packed_field(4, _encode_geometry(rings))
+        )
+        encoded_features.append(_bytes_field(2, feature))
+
+    if not encoded_features:
+        return b""
+
+    layer = (
+        _key(15, 0) + _varint(2)
+        + _bytes_field(1, name.encode('utf-8'))
+        + b"".join(encoded_features)
+        + b"".join(_bytes_field(3, k.encode('utf-8')) for k in keys)
+        + b"".join(_bytes_field(4, _encode_value(v)) for v in values)
+        + _key(5, 0) + _varint(extent)
+    )
+    return _bytes_field(3, layer)
+
+
+# ============ GEOMETRI TILE ============
+
+def tile_bounds(z, x, y, buffer=MVT_BUFFER, extent=MVT_EXTENT):
+    """Bbox lng/lat (min_lng, min_lat, max_lng, max_lat) satu tile plus buffer"""
+    pad = buffer / extent
+    corners = pixel_to_lnglat([[x - pad, y + 1 + pad], [x + 1 + pad, y - pad]], z, tile_size=1)
+    min_lng, min_lat = corners[0].tolist()
+    max_lng, max_lat = corners[1].tolist()
+    return max(min_lng, -180.0), max(min_lat, -85.05112878), min(max_lng, 180.0), min(max_lat, 85.05112878)
+
+
+def _clip_axis(points, axis, bound, keep_greater):
+    """Satu tahap Sutherland–Hodgman terhadap garis axis = bound"""
+    if not len(points):
+        return points
+    following = np.roll(points, -1, axis=0)
+    inside = points[:, axis] >= bound if keep_greater else points[:, axis] <= bound
+    inside_next = np.roll(inside, -1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (bound - points[:, axis]) / (following[:, axis] - points[:, axis])
+        crossing = points + (following - points) * t[:, None]
+
+    # Tiap titik menghasilkan maksimal dua output: titik itu sendiri & titik potong
+    candidates = np.stack((points, crossing), axis=1).reshape(-1, 2)
+    mask = np.column_stack((inside, inside != inside_next)).ravel()
+    return candidates[mask]
+
+
+def clip_ring(ring, low, high):
+    """Clip ring terbuka ke kotak [low, high] di kedua sumbu"""
+    for axis in (0, 1):
+        ring = _clip_axis(ring, axis, low, True)
+        ring = _clip_axis(ring, axis, high, False)
+    return ring
+
+
+def _ring_signed_area(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    return float(np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)) / 2.0
+
+
+def tile_rings(coordinates, z, x, y, buffer=MVT_BUFFER, extent=MVT_EXTENT, tolerance=1.0):
+    """
+    Polygon GeoJSON (list ring lng/lat) -> list ring integer di koordinat tile:
+    proyeksi, simplifikasi (satuan tile), clip ke tile+buffer, orientasi sesuai spesifikasi MVT.
+    """
+    origin = np.array([x * extent, y * extent], dtype=np.float64)
+    rings = []
+
+    for ring_index, ring in enumerate(coordinates):
+        points = np.asarray(ring, dtype=np.float64).reshape(-1, 2)
+        if len(points) > 1 and np.array_equal(points[0], points[-1]):
+            points = points[:-1]
+        if len(points) < 3:
+            if ring_index == 0:
+                return []
+            continue
+
+        local = lnglat_to_pixel(points, z, tile_size=extent) - origin
+        if tolerance > 0 and len(local) > 4:
+            local = local[simplify_ring_mask(local, tolerance)]
+
+        local = clip_ring(local, -buffer, extent + buffer)
+        snapped = np.round(local).astype(np.int64).reshape(-1, 2)
+        if len(snapped):
+            changed = np.any(snapped != np.roll(snapped, 1, axis=0), axis=1)
+            snapped = snapped[changed]
+
+        area = _ring_signed_area(snapped) if len(snapped) >= 3 else 0.0
+        if abs(area) < 1:
+            # Ring luar hilang/terlalu kecil di zoom ini, lewati seluruh poligon
+            if ring_index == 0:
+                return []
+            continue
+
+        # Ring luar: luas positif (searah jarum jam dengan sumbu y ke bawah), hole: negatif
+        if (ring_index == 0) != (area > 0):
+            snapped = snapped[::-1]
+        rings.append(snapped)
+
+    return rings
+
+
+def build_feature_tile(documents, z, x, y):
+    """Dokumen ai_features -> bytes MVT untuk tile z/x/y"""
+    # Toleransi simplifikasi lebih besar di zoom rendah
+    tolerance = 0.0 if z >= MVT_MAX_ZOOM else (2.0 if z < 15 else 1.0)
+    features = []
+
+    for doc in documents:
+        location = doc.get("location") or {}
+        if location.get("type") != "Polygon":
+            continue
+        rings = tile_rings(location.get("coordinates") or [], z, x, y, tolerance=tolerance)
+        if not rings:
+            continue
+
+        metadata = doc.get("metadata") or {}
+        confidence = doc.get("confidence_score")
+        luas = metadata.get("luas_estimasi")
+        features.append((rings, {
+            "feature_id": doc.get("feature_id"),
+            "kategori": doc.get("kategori"),
+            "confidence_score": float(confidence) if confidence is not None else None,
+            "luas_estimasi": float(luas) if luas is not None else None
+        }))
+
+    return encode_layer(features)
+
+
+# ============ CACHE DISK ============
+
+def _cache_path(z, x, y):
+    return os.path.join(FEATURE_TILE_CACHE_DIR, str(z), str(x), f"{y}.pbf")
+
+
+def read_cached_tile(z, x, y):
+    try:
+        with open(_cache_path(z, x, y), 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def write_cached_tile(z, x, y, data):
+    path = _cache_path(z, x, y)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Tulis ke file sementara lalu rename (atomik antar proses)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except OSError as e:
+        print(f"⚠ Gagal menulis cache tile {z}/{x}/{y}: {str(e)}")
+
+
+def invalidate_rings(rings):
+    """Hapus tile cache yang bersinggungan dengan ring lng/lat di semua zoom"""
+    boxes = []
+    for ring in rings:
+        points = np.asarray(ring, dtype=np.float64).reshape(-1, 2)
+        if len(points):
+            boxes.append(np.concatenate((points.min(axis=0), points.max(axis=0))))
+    if not boxes:
+        return 0
+
+    boxes = np.array(boxes)
+    # Buffer tile ikut dihitung agar tile tetangga yang memuat potongan poligon juga terhapus
+    pad = MVT_BUFFER / MVT_EXTENT
+    targets = set()
+    removed = 0
+    for z in range(MVT_MIN_ZOOM, MVT_MAX_ZOOM + 1):
+        top_left = lnglat_to_pixel(boxes[:, [0, 3]], z, tile_size=1)
+        bottom_right = lnglat_to_pixel(boxes[:, [2, 1]], z, tile_size=1)
+        first = np.floor(top_left - pad).astype(np.int64)
+        last = np.floor(bottom_right + pad).astype(np.int64)
+        for (x1, y1), (x2, y2) in zip(first.tolist(), last.tolist()):
+            if (x2 - x1 + 1) * (y2 - y1 + 1) > MAX_INVALIDATE_TILES:
+                # Poligon besar di zoom tinggi: telusuri file cache yang ada saja
+                removed += _remove_cached_range(z, x1, y1, x2, y2)
+                continue
+            for tx in range(x1, x2 + 1):
+                for ty in range(y1, y2 + 1):
+                    targets.add((z, tx, ty))
+
+    for z, tx, ty in targets:
+        try:
+            os.remove(_cache_path(z, tx, ty))
+            removed += 1
+        except OSError:
+            pass
+    return removed
+
+
+def _remove_cached_range(z, x1, y1, x2, y2):
+    removed = 0
+    zoom_dir = os.path.join(FEATURE_TILE_CACHE_DIR, str(z))
+    if not os.path.isdir(zoom_dir):
+        return 0
+    for x_name in os.listdir(zoom_dir):
+        if not x_name.isdigit() or not x1 <= int(x_name) <= x2:
+            continue
+        x_dir = os.path.join(zoom_dir, x_name)
+        for file_name in os.listdir(x_dir):
+            y_name = file_name[:-len('.pbf')]
+            if file_name.endswith('.pbf') and y_name.isdigit() and y1 <= int(y_name) <= y2:
+                try:
+                    os.remove(os.path.join(x_dir, file_name))
+                    removed += 1
+                except OSError:
+                    pass
+    return removed
+
+
+def clear_tile_cache():
+    shutil.rmtree(FEATURE_TILE_CACHE_DIR, ignore_errors=True)
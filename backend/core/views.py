@@ -1,89 +1,279 @@
 import os
-from PIL import Image
-from ultralytics import YOLO
+import base64
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
+from django.http import HttpResponse, StreamingHttpResponse
 import json
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
 import uuid
 from dotenv import load_dotenv
 from datetime import datetime
-import math
+from .detection import (
+    DETECTION_SIZE, DETECTION_BATCH_SIZE, DETECTION_MAX_BATCH_SIZE, DETECTION_MAX_TILES,
+    SIMPLIFY_TOLERANCE_M, prepare_image, process_results, tile_metadata, run_batch, vertex_cap
+)
+from .model_registry import get_model, warm_up, model_status
+from . import detection_jobs
+from .geometry import geo_ring_metrics, simplify_geo_ring
+from .area_detection import parse_bbox, run_area_detection
+from .spatial_index import deduplicator, DEDUP_IOU_THRESHOLD, DEDUP_POLICIES
+from .boundary_registry import registry as boundary_registry, request_band, BOUNDARY_FORMATS
+from .streaming import iter_json_array
+from .vector_tiles import (
+    MVT_MIN_ZOOM, MVT_MAX_ZOOM, MVT_MAX_FEATURES, tile_bounds, build_feature_tile,
+    read_cached_tile, write_cached_tile, invalidate_rings
+)
 
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
 DB_MONGO_NAME = os.getenv("DB_MONGO_NAME")
 
-# Load Model
-MODEL_PATH = os.path.join(os.path.dirname(__file__), 'ai_models', 'best.pt')
-model = YOLO(MODEL_PATH)
-
 # Koneksi MongoDB
 client = MongoClient(MONGO_URI)
 mongo_db = client[DB_MONGO_NAME]
 mongo_collection = mongo_db["ai_features"]
 
-def calculate_polygon_area(coords):
+# Jumlah dokumen per insert_many saat menyimpan hasil deteksi
+SAVE_DETECTION_CHUNK_SIZE = int(os.getenv("SAVE_DETECTION_CHUNK_SIZE", 500))
+
+# Pagination feature_list
+FEATURE_PAGE_SIZE = int(os.getenv("FEATURE_PAGE_SIZE", 500))
+FEATURE_MAX_PAGE_SIZE = int(os.getenv("FEATURE_MAX_PAGE_SIZE", 5000))
+FEATURE_SORT = [('created_at', -1), ('feature_id', -1)]
+FEATURE_PROJECTIONS = {
+    "full": {'_id': 0},
+    # Tanpa geometri: cukup untuk tabel/daftar
+    "meta": {'_id': 0, 'location': 0}
+}
+
+
+def _encode_cursor(document):
+    raw = json.dumps([document.get('created_at'), document.get('feature_id')])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    created_at, feature_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    return created_at, feature_id
+
+
+def _bbox_polygon(bbox):
+    """Bbox (min_lng, min_lat, max_lng, max_lat) -> GeoJSON Polygon"""
+    min_lng, min_lat, max_lng, max_lat = bbox
+    return {
+        "type": "Polygon",
+        "coordinates": [[
+            [min_lng, min_lat], [max_lng, min_lat], [max_lng, max_lat], [min_lng, max_lat], [min_lng, min_lat]
+        ]]
+    }
+
+
+def _feature_filters(params):
+    """Susun query MongoDB dari filter kategori, user_id, confidence & bbox"""
+    query = {}
+
+    kategori = params.get('kategori')
+    if kategori:
+        values = [k.strip() for k in kategori.split(',') if k.strip()]
+        query['kategori'] = values[0] if len(values) == 1 else {'$in': values}
+
+    user_id = params.get('user_id')
+    if user_id:
+        query['user_id'] = int(user_id) if user_id.isdigit() else user_id
+
+    confidence = {}
+    if params.get('min_confidence'):
+        confidence['$gte'] = float(params.get('min_confidence'))
+    if params.get('max_confidence'):
+        confidence['$lte'] = float(params.get('max_confidence'))
+    if confidence:
+        query['confidence_score'] = confidence
+
+    if params.get('bbox'):
+        query['location'] = {'$geoIntersects': {'$geometry': _bbox_polygon(parse_bbox(params.get('bbox')))}}
+
+    return query
+
+
+@api_view(['GET'])
+def feature_list(request):
     """
-    Menghitung luas poligon sederhana menggunakan rumus Shoelace.
-    Input: [[lng1, lat1], [lng2, lat2], ...]
-    Output: Luas dalam meter persegi (pendekatan kasar)
+    Daftar fitur AI.
+    Query: limit (default FEATURE_PAGE_SIZE), cursor (keyset), fields=full|meta, kategori, user_id,
+           min_confidence, max_confidence, bbox=minLng,minLat,maxLng,maxLat
+    all=1: seluruh hasil sebagai JSON array (format lama) yang di-stream dari cursor. Hanya
+           untuk client lama/ekspor; peta memakai endpoint viewport & tile.
     """
-    if len(coords) < 3:
-        return 0
-    
-    area = 0
-    for i in range(len(coords) - 1):
-        lon1, lat1 = coords[i]
-        lon2, lat2 = coords[i+1]
-        
-        # Konversi ke meter sederhana
-        x1 = lon1 * 111320 * math.cos(math.radians(lat1))
-        y1 = lat1 * 111320
-        x2 = lon2 * 111320 * math.cos(math.radians(lat2))
-        y2 = lat2 * 111320
-        
-        area += (x1 * y2) - (x2 * y1)
-        
-    return abs(area) / 2
+    try:
+        params = request.query_params
+        fields = params.get('fields', 'full')
+        if fields not in FEATURE_PROJECTIONS:
+            return Response({"error": f"fields harus salah satu dari {list(FEATURE_PROJECTIONS)}"}, status=400)
+
+        try:
+            query = _feature_filters(params)
+        except (ValueError, TypeError) as e:
+            return Response({"error": f"Filter tidak valid: {e}"}, status=400)
+
+        projection = FEATURE_PROJECTIONS[fields]
+
+        if str(params.get('all', '')).lower() in ('1', 'true'):
+            cursor = mongo_collection.find(query, projection).sort(FEATURE_SORT).batch_size(FEATURE_PAGE_SIZE)
+            return StreamingHttpResponse(iter_json_array(cursor), content_type='application/json')
+
+        try:
+            limit = min(max(1, int(params.get('limit', FEATURE_PAGE_SIZE))), FEATURE_MAX_PAGE_SIZE)
+            if params.get('cursor'):
+                created_at, feature_id = _decode_cursor(params.get('cursor'))
+                query = {'$and': [query, {'$or': [
+                    {'created_at': {'$lt': created_at}},
+                    {'created_at': created_at, 'feature_id': {'$lt': feature_id}}
+                ]}]}
+        except (ValueError, TypeError):
+            return Response({"error": "limit atau cursor tidak valid"}, status=400)
+
+        # Ambil satu dokumen ekstra untuk mengetahui ada halaman berikutnya
+        documents = list(mongo_collection.find(query, projection).sort(FEATURE_SORT).limit(limit + 1))
+        has_more = len(documents) > limit
+        documents = documents[:limit]
+
+        return Response({
+            "features": documents,
+            "count": len(documents),
+            "next_cursor": _encode_cursor(documents[-1]) if has_more else None
+        })
+    except Exception as e:
+        return Response({"error": str(e)}, status=500)
+
+# Batas jumlah fitur per viewport berdasarkan zoom peta: [(zoom_min, limit), ...]
+FEATURE_VIEWPORT_LIMITS = [(17, 5000), (15, 2000), (13, 1000), (0, 300)]
+
+
+def _viewport_limit(zoom):
+    for zoom_min, limit in FEATURE_VIEWPORT_LIMITS:
+        if zoom >= zoom_min:
+            return limit
+    return FEATURE_VIEWPORT_LIMITS[-1][1]
 
-def calculate_pixel_polygon_area(segmentation_pixels, lat, lng, capture_size):
+
+def _as_geojson_feature(document):
+    """Dokumen ai_features -> GeoJSON Feature"""
+    geometry = document.pop('location', None)
+    return {"type": "Feature", "geometry": geometry, "properties": document}
+
+
+@api_view(['GET', 'POST'])
+def features_in_viewport(request):
     """
-    Hitung luas dari koordinat pixel segmentasi
-    Returns: Luas dalam m²
+    Fitur AI di dalam viewport peta (index 2dsphere pada `location`).
+    GET  : bbox=minLng,minLat,maxLng,maxLat
+    POST : {"bbox": [...]} atau {"polygon": GeoJSON Polygon}
+    Opsional: zoom (limit otomatis), limit, mode=intersects|within, kategori, min_confidence
     """
-    if len(segmentation_pixels) < 3:
-        return 0
-    
-    # Estimasi meter per pixel berdasarkan latitude dan zoom
-    # Asumsi zoom 18-20 (typical untuk deteksi)
-    avg_zoom = 19
-    meters_per_pixel = (40075016.686 * abs(math.cos(lat * math.pi / 180))) / (256 * pow(2, avg_zoom))
-    
-    # Hitung luas dalam pixel menggunakan Shoelace formula
-    area_pixels = 0
-    for i in range(len(segmentation_pixels) - 1):
-        x1, y1 = segmentation_pixels[i]
-        x2, y2 = segmentation_pixels[i+1]
-        area_pixels += (x1 * y2) - (x2 * y1)
-    
-    area_pixels = abs(area_pixels) / 2
-    
-    # Konversi ke m²
-    area_m2 = area_pixels * (meters_per_pixel ** 2)
-    
-    return round(area_m2, 2)
+    try:
+        params = request.query_params if request.method == 'GET' else request.data
+
+        try:
+            if params.get('polygon'):
+                polygon = params.get('polygon')
+                if isinstance(polygon, str):
+                    polygon = json.loads(polygon)
+                if polygon.get('type') != 'Polygon':
+                    raise ValueError("polygon harus GeoJSON Polygon")
+                geometry = polygon
+            elif params.get('bbox'):
+                geometry = _bbox_polygon(parse_bbox(params.get('bbox')))
+            else:
+                return Response({"error": "bbox atau polygon wajib diisi"}, status=400)
+
+            filter_params = {k: params.get(k) for k in ('kategori', 'user_id', 'min_confidence', 'max_confidence')}
+            query = _feature_filters({k: str(v) for k, v in filter_params.items() if v is not None})
+
+            zoom = int(params.get('zoom')) if params.get('zoom') is not None else None
+            if params.get('limit') is not None:
+                limit = min(max(1, int(params.get('limit'))), FEATURE_MAX_PAGE_SIZE)
+            else:
+                limit = _viewport_limit(zoom) if zoom is not None else FEATURE_MAX_PAGE_SIZE
+        except (ValueError, TypeError, AttributeError) as e:
+            return Response({"error": f"Parameter viewport tidak valid: {e}"}, status=400)
+
+        mode = params.get('mode', 'intersects')
+        if mode not in ('intersects', 'within'):
+            return Response({"error": "mode harus intersects atau within"}, status=400)
+        operator = '$geoIntersects' if mode == 'intersects' else '$geoWithin'
+        query['location'] = {operator: {'$geometry': geometry}}
+
+        projection = {'_id': 0, 'location': 1, 'feature_id': 1, 'nama': 1, 'kategori': 1,
+                      'confidence_score': 1, 'metadata.luas_estimasi': 1, 'created_at': 1}
+
+        # Saat dibatasi dahulukan deteksi paling yakin. Paksa index 2dsphere (bukan index
+        # confidence_score untuk sort yang berujung full scan); jika index belum ada (masih
+        # dibangun saat startup atau gagal dibuat) hint ditolak server, ulangi tanpa hint.
+        cursor = mongo_collection.find(query, projection).sort('confidence_score', -1).limit(limit + 1)
+        try:
+            documents = list(cursor.clone().hint([('location', '2dsphere')]))
+        except OperationFailure:
+            documents = list(cursor)
+        truncated = len(documents) > limit
+
+        return Response({
+            "type": "FeatureCollection",
+            "features": [_as_geojson_feature(doc) for doc in documents[:limit]],
+            "metadata": {
+                "count": min(len(documents), limit),
+                "limit": limit,
+                "zoom": zoom,
+                "mode": mode,
+                "truncated": truncated
+            }
+        })
+    except Exception as e:
+        return Response({"error": str(e)}, status=500)
+
 
 @api_view(['GET'])
-def feature_list(request):
+def feature_tile(request, z, x, y):
+    """Mapbox Vector Tile (layer ai_features) untuk tile z/x/y, dengan cache disk"""
     try:
-        cursor = mongo_collection.find({}, {'_id': 0}).sort('created_at', -1)
-        return Response(list(cursor))
+        if not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+            return Response({"error": "Koordinat tile tidak valid"}, status=400)
+
+        # Di luar rentang zoom: tile kosong (zoom rendah memakai endpoint viewport)
+        if z < MVT_MIN_ZOOM or z > MVT_MAX_ZOOM:
+            data, cache_status = b"", "SKIP"
+        else:
+            data = read_cached_tile(z, x, y)
+            cache_status = "HIT"
+            if data is None:
+                cursor = mongo_collection.find(
+                    {"location": {"$geoIntersects": {"$geometry": _bbox_polygon(tile_bounds(z, x, y))}}},
+                    {"_id": 0, "feature_id": 1, "kategori": 1, "confidence_score": 1,
+                     "metadata.luas_estimasi": 1, "location": 1}
+                ).limit(MVT_MAX_FEATURES)
+                data = build_feature_tile(cursor, z, x, y)
+                write_cached_tile(z, x, y, data)
+                cache_status = "MISS"
+
+        response = HttpResponse(data, content_type='application/vnd.mapbox-vector-tile')
+        response['X-Tile-Cache'] = cache_status
+        return response
     except Exception as e:
+        print(f"Error tile {z}/{x}/{y}: {str(e)}")
         return Response({"error": str(e)}, status=500)
 
+
+def _simplify_tolerance(request):
+    """Toleransi simplifikasi poligon (meter) dari request, simplify=false untuk menonaktifkan"""
+    if str(request.data.get('simplify', 'true')).lower() == 'false':
+        return 0.0
+    try:
+        return max(0.0, float(request.data.get('simplify_tolerance', SIMPLIFY_TOLERANCE_M)))
+    except (ValueError, TypeError):
+        return SIMPLIFY_TOLERANCE_M
+
 @api_view(['POST'])
 def run_detection(request):
     image_file = request.FILES.get('image')
@@ -98,74 +288,98 @@ def run_detection(request):
         return Response({"error": "Data tidak lengkap"}, status=400)
 
     try:
-        img = Image.open(image_file)
+        img_resized = prepare_image(image_file)
         
-        # Resize gambar untuk deteksi optimal
-        target_size = 640
-        if img.size != (target_size, target_size):
-            img_resized = img.resize((target_size, target_size), Image.LANCZOS)
-        else:
-            img_resized = img
-        
-        results = model.predict(source=img_resized, save=False)
-        detected_data = []
-
-        # Scale factor
-        scale_x = capture_size / target_size
-        scale_y = capture_size / target_size
-
-        for result in results:
-            if result.masks is not None:
-                for i, mask in enumerate(result.masks.xy):
-                    cls_idx = int(result.boxes.cls[i])
-                    raw_label = result.names[cls_idx].lower()
-                    confidence = float(result.boxes.conf[i])
-
-                    if raw_label in selected_categories:
-                        # Scale koordinat mask
-                        segment_list = [[pt[0] * scale_x, pt[1] * scale_y] for pt in mask.tolist()]
-                        
-                        # Hitung luas dari segmentasi
-                        luas_m2 = calculate_pixel_polygon_area(segment_list, lat, lng, capture_size)
-
-                        detected_data.append({
-                            "nama": f"{raw_label.capitalize()} Terdeteksi",
-                            "kategori": raw_label,
-                            "segmentation": segment_list,
-                            "confidence_score": round(confidence, 2),
-                            "luas_m2": luas_m2,
-                            "lat": lat,
-                            "lng": lng,
-                            "capture_size": capture_size
-                        })
-            else:
-                # Bounding box fallback
-                for box in result.boxes:
-                    raw_label = result.names[int(box.cls[0])].lower()
-                    if raw_label in selected_categories:
-                        x1, y1, x2, y2 = box.xyxy[0].tolist()
-                        detected_data.append({
-                            "nama": f"{raw_label.capitalize()} Terdeteksi",
-                            "kategori": raw_label,
-                            "bbox": [
-                                int(x1 * scale_x), 
-                                int(y1 * scale_y), 
-                                int(x2 * scale_x), 
-                                int(y2 * scale_y)
-                            ],
-                            "confidence_score": round(float(box.conf[0]), 2),
-                            "lat": lat,
-                            "lng": lng,
-                            "capture_size": capture_size
-                        })
+        results = get_model().predict(source=img_resized, save=False)
+        detected_data, stats = process_results(
+            results, lat, lng, capture_size, selected_categories, _simplify_tolerance(request)
+        )
 
         return Response({
             "status": "success",
             "results": detected_data,
+            "metadata": tile_metadata(capture_size, stats)
+        })
+
+    except Exception as e:
+        print(f"Error AI: {str(e)}")
+        return Response({"error": str(e)}, status=500)
+
+def _parse_batch_request(request):
+    """
+    Baca payload deteksi multi-tile.
+    Returns: (image_files, tiles_meta, selected_categories, batch_size, error_response)
+    """
+    image_files = request.FILES.getlist('images')
+
+    try:
+        tiles_raw = request.data.get('tiles', '[]')
+        tiles_meta = json.loads(tiles_raw) if isinstance(tiles_raw, str) else tiles_raw
+        batch_size = int(request.data.get('batch_size', DETECTION_BATCH_SIZE))
+    except (ValueError, TypeError):
+        return None, None, None, None, Response({"error": "Format tiles atau batch_size salah"}, status=400)
+    if not isinstance(tiles_meta, list):
+        return None, None, None, None, Response({"error": "Format tiles atau batch_size salah"}, status=400)
+
+    categories_raw = request.data.get('categories', '')
+    selected_categories = [c.strip().lower() for c in categories_raw.split(',') if c]
+
+    if not image_files or len(image_files) != len(tiles_meta):
+        return None, None, None, None, Response({"error": "Jumlah images dan tiles harus sama"}, status=400)
+
+    if len(image_files) > DETECTION_MAX_TILES:
+        return None, None, None, None, Response({"error": f"Maksimal {DETECTION_MAX_TILES} tile per request"}, status=400)
+
+    batch_size = max(1, min(batch_size, DETECTION_MAX_BATCH_SIZE))
+    return image_files, tiles_meta, selected_categories, batch_size, None
+
+def _tile_info(index, meta):
+    return {
+        "index": index,
+        "lat": float(meta.get('lat')),
+        "lng": float(meta.get('lng')),
+        "capture_size": int(meta.get('capture_size', 640))
+    }
+
+@api_view(['POST'])
+def run_detection_batch(request):
+    """
+    Deteksi banyak tile sekaligus.
+    - images: beberapa file gambar (field 'images')
+    - tiles: JSON list [{lat, lng, capture_size}, ...] sejajar dengan images
+    - categories: kategori dipisah koma
+    - batch_size: ukuran mini-batch inferensi (opsional)
+    """
+    image_files, tiles_meta, selected_categories, batch_size, error = _parse_batch_request(request)
+    if error:
+        return error
+
+    try:
+        files = []
+        tiles = []
+        tile_results = []
+
+        for index, (image_file, meta) in enumerate(zip(image_files, tiles_meta)):
+            try:
+                tiles.append(_tile_info(index, meta))
+                files.append(image_file)
+            except Exception as e:
+                # Tile rusak tidak menggagalkan seluruh batch
+                tile_results.append({"index": index, "status": "error", "error": str(e)})
+
+        # Gambar di-decode per mini-batch di run_batch
+        detected_tiles, stats = run_batch(
+            get_model(), files, tiles, selected_categories, batch_size, _simplify_tolerance(request)
+        )
+        tile_results.extend(detected_tiles)
+        tile_results.sort(key=lambda t: t["index"])
+
+        return Response({
+            "status": "success",
+            "tiles": tile_results,
             "metadata": {
-                "capture_size": capture_size,
-                "detection_size": target_size,
-                "scale_factor": scale_x
+                **stats,
+                "detection_size": DETECTION_SIZE
             }
         })
 
@@ -173,61 +387,299 @@ def run_detection(request):
         print(f"Error AI: {str(e)}")
         return Response({"error": str(e)}, status=500)
 
+@api_view(['POST'])
+def detect_area(request):
+    """
+    Deteksi area dari tile lokal (XYZ / MBTiles) tanpa upload gambar.
+    - bbox: "minLng,minLat,maxLng,maxLat"
+    - zoom: level zoom tile
+    - categories, batch_size, simplify_tolerance: sama dengan run_detection_batch
+    """
+    try:
+        bbox = parse_bbox(request.data.get('bbox', ''))
+        zoom = int(request.data.get('zoom', 18))
+        batch_size = max(1, min(int(request.data.get('batch_size', DETECTION_BATCH_SIZE)), DETECTION_MAX_BATCH_SIZE))
+    except (ValueError, TypeError):
+        return Response({"error": "Format bbox, zoom atau batch_size salah"}, status=400)
+
+    categories_raw = request.data.get('categories', '')
+    selected_categories = [c.strip().lower() for c in categories_raw.split(',') if c]
+
+    try:
+        feature_collection = run_area_detection(
+            get_model(), bbox, zoom, selected_categories, batch_size, _simplify_tolerance(request)
+        )
+        return Response(feature_collection)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    except Exception as e:
+        print(f"Error AI: {str(e)}")
+        return Response({"error": str(e)}, status=500)
+
+@api_view(['POST'])
+def submit_detection_job(request):
+    """
+    Mode job: tile dimasukkan ke antrian, client menerima job_id lalu polling hasil.
+    Payload sama dengan run_detection_batch.
+    """
+    image_files, tiles_meta, selected_categories, batch_size, error = _parse_batch_request(request)
+    if error:
+        return error
+
+    try:
+        tiles = []
+        for index, (image_file, meta) in enumerate(zip(image_files, tiles_meta)):
+            tile = _tile_info(index, meta)
+            # Simpan bytes gambar, file upload ditutup setelah request selesai
+            tile["image_bytes"] = image_file.read()
+            tiles.append(tile)
+    except (ValueError, TypeError, AttributeError):
+        return Response({"error": "Format tiles salah"}, status=400)
+
+    try:
+        job_id = detection_jobs.submit_job(
+            tiles,
+            selected_categories,
+            batch_size,
+            simplify_tolerance_m=_simplify_tolerance(request),
+            user_id=request.user.id if request.user.is_authenticated else None
+        )
+        return Response({
+            "status": "queued",
+            "job_id": job_id,
+            "total_tiles": len(tiles),
+            "queue": detection_jobs.queue_status()
+        }, status=202)
+    except detection_jobs.QueueFullError as e:
+        return Response({"error": str(e), "queue": detection_jobs.queue_status()}, status=503, headers={"Retry-After": "10"})
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+    except Exception as e:
+        print(f"Error AI: {str(e)}")
+        return Response({"error": str(e)}, status=500)
+
+@api_view(['GET'])
+def detection_job_status(request, job_id):
+    """Polling status job. ?since=N hanya mengembalikan hasil tile mulai index ke-N"""
+    try:
+        since = int(request.query_params.get('since', 0))
+    except ValueError:
+        return Response({"error": "Parameter since harus angka"}, status=400)
+
+    try:
+        job = detection_jobs.get_job(job_id, since)
+        if not job:
+            return Response({"error": "Job tidak ditemukan"}, status=404)
+
+        job["since"] = since
+        job["next_since"] = job["results"][-1]["index"] + 1 if job["results"] else since
+        return Response(job)
+    except Exception as e:
+        return Response({"error": str(e)}, status=500)
+
+@api_view(['GET', 'POST'])
+def detection_model_status(request):
+    """GET: status model YOLO, POST: warm-up model secara eksplisit"""
+    try:
+        if request.method == 'POST':
+            return Response(warm_up())
+        return Response(model_status())
+    except Exception as e:
+        print(f"Error AI: {str(e)}")
+        return Response({"error": str(e)}, status=500)
+
+def _parse_polygon_coords(raw_coords):
+    """Parse string "lng lat, lng lat, ..." menjadi ring tertutup, ValueError jika tidak valid"""
+    if not isinstance(raw_coords, str):
+        raise ValueError("polygon_coords harus berupa string")
+
+    coords_list = []
+    for pair in raw_coords.split(','):
+        c = pair.strip().split()
+        if len(c) == 2:
+            coords_list.append([float(c[0]), float(c[1])])
+
+    if coords_list and coords_list[0] != coords_list[-1]:
+        coords_list.append(coords_list[0])
+    if len(coords_list) < 4:
+        raise ValueError("Poligon minimal 3 titik")
+    return coords_list
+
+
 @api_view(['POST'])
 def save_detection(request):
     try:
         features = request.data.get('features', [])
-
-        for item in features:
-            raw_coords = item.get('polygon_coords') 
-            
+        tolerance_m = _simplify_tolerance(request)
+        bytes_saved = 0
+
+        # Kebijakan deduplikasi terhadap fitur tersimpan: drop | merge | off
+        dedup_policy = str(request.data.get('dedup', 'drop')).lower()
+        if dedup_policy not in DEDUP_POLICIES:
+            return Response({"error": f"dedup harus salah satu dari {DEDUP_POLICIES}"}, status=400)
+        try:
+            iou_threshold = float(request.data.get('dedup_iou', DEDUP_IOU_THRESHOLD))
+        except (ValueError, TypeError):
+            iou_threshold = DEDUP_IOU_THRESHOLD
+
+        user_id = request.user.id if request.user.is_authenticated else None
+        item_status = [{"index": i} for i in range(len(features))]
+
+        # 1. Validasi & parse semua fitur sebelum menulis apa pun
+        valid = []
+        for i, item in enumerate(features):
             try:
-                coords_list = []
-                for pair in raw_coords.split(','):
-                    c = pair.strip().split()
-                    if len(c) == 2:
-                        coords_list.append([float(c[0]), float(c[1])])
-                
-                if coords_list and coords_list[0] != coords_list[-1]:
-                    coords_list.append(coords_list[0])
-            except Exception:
-                return Response({"error": "Format koordinat salah"}, status=400)
-
-            # Hitung luas dari koordinat geografis
-            luas_m2 = calculate_polygon_area(coords_list)
-
-            feature_uuid = str(uuid.uuid4())
+                valid.append((i, item, _parse_polygon_coords(item.get('polygon_coords'))))
+            except (ValueError, TypeError, AttributeError) as e:
+                item_status[i].update({"status": "invalid", "error": f"Format koordinat salah: {e}"})
+
+        if features and not valid:
+            return Response({"error": "Format koordinat salah", "items": item_status}, status=400)
+
+        # 2. Luas, keliling & centroid semua poligon dalam satu perhitungan
+        areas, perimeters, centroids = geo_ring_metrics([coords for _, _, coords in valid])
+
+        # 3. Simplifikasi & susun dokumen
+        prepared = []
+        now = datetime.now().isoformat()
+
+        for (i, item, coords_list), luas_m2, keliling, centroid in zip(
+                valid, areas.tolist(), perimeters.tolist(), centroids.tolist()):
+            # Simplifikasi geometri yang disimpan (luas tetap dari poligon asli)
+            kategori = item.get('kategori')
+            vertices_before = len(coords_list)
+            if tolerance_m > 0 or vertex_cap(kategori):
+                simplified = simplify_geo_ring(coords_list, tolerance_m, vertex_cap(kategori)).tolist()
+                bytes_saved += len(json.dumps(coords_list)) - len(json.dumps(simplified))
+                coords_list = simplified
 
             mongo_document = {
-                "feature_id": feature_uuid,
-                "user_id": request.user.id if request.user.is_authenticated else None,
+                "feature_id": str(uuid.uuid4()),
+                "user_id": user_id,
                 "nama": item.get('nama'),
-                "kategori": item.get('kategori'),
+                "kategori": kategori,
                 "confidence_score": item.get('confidence_score'),
                 "location": {
                     "type": "Polygon",
-                    "coordinates": [coords_list] 
+                    "coordinates": [coords_list]
                 },
                 "metadata": {
                     **item.get('metadata', {}),
                     "luas_estimasi": round(luas_m2, 2),
-                    "satuan": "m2"
+                    "keliling_estimasi": round(keliling, 2),
+                    "centroid": [round(v, 7) for v in centroid],
+                    "satuan": "m2",
+                    "simplifikasi": {
+                        "tolerance_m": tolerance_m,
+                        "vertices_before": vertices_before,
+                        "vertices_after": len(coords_list)
+                    }
                 },
-                "created_at": datetime.now().isoformat()
+                "created_at": now,
+                "updated_at": now
             }
-            mongo_collection.insert_one(mongo_document)
-
-        return Response({"status": "success", "message": f"{len(features)} objek berhasil disimpan"}, status=201)
+            prepared.append((i, mongo_document))
+
+        # Cek duplikat terhadap fitur tersimpan & fitur lain di request ini
+        # (satu sinkronisasi index + satu query kandidat untuk seluruh batch)
+        duplicates = [(None, 0.0)] * len(prepared)
+        if dedup_policy != 'off':
+            duplicates = deduplicator.find_duplicates(
+                [(doc["feature_id"], doc["kategori"], doc["location"]["coordinates"][0]) for _, doc in prepared],
+                iou_threshold
+            )
+
+        documents = []
+        document_index = []
+        merge_ops = []
+        for (i, mongo_document), (duplicate_id, iou) in zip(prepared, duplicates):
+            if duplicate_id:
+                item_status[i].update({"status": "duplicate", "duplicate_of": duplicate_id, "iou": round(iou, 3)})
+                if dedup_policy == 'merge':
+                    merge_ops.append((i, duplicate_id, mongo_document))
+                continue
+            documents.append(mongo_document)
+            document_index.append(i)
+
+        # 4. Tulis dengan insert_many unordered per chunk
+        inserted = 0
+        changed_rings = []
+        for start in range(0, len(documents), SAVE_DETECTION_CHUNK_SIZE):
+            chunk = documents[start:start + SAVE_DETECTION_CHUNK_SIZE]
+            chunk_index = document_index[start:start + SAVE_DETECTION_CHUNK_SIZE]
+            failed = {}
+            try:
+                mongo_collection.insert_many(chunk, ordered=False)
+            except BulkWriteError as bwe:
+                failed = {err["index"]: err.get("errmsg", "") for err in bwe.details.get("writeErrors", [])}
+
+            for offset, (i, doc) in enumerate(zip(chunk_index, chunk)):
+                doc.pop('_id', None)
+                if offset in failed:
+                    deduplicator.remove(doc["feature_id"])
+                    item_status[i].update({"status": "error", "error": failed[offset]})
+                else:
+                    item_status[i].update({"status": "inserted", "feature_id": doc["feature_id"]})
+                    inserted += 1
+                    changed_rings.append(doc["location"]["coordinates"][0])
+
+        # Mode merge: ganti geometri fitur lama bila deteksi baru lebih yakin
+        merged = 0
+        if merge_ops:
+            existing = {}
+            old_rings = {}
+            for doc in mongo_collection.find(
+                    {"feature_id": {"$in": [fid for _, fid, _ in merge_ops]}},
+                    {"_id": 0, "feature_id": 1, "confidence_score": 1, "location.coordinates": 1}):
+                existing[doc["feature_id"]] = doc.get("confidence_score") or 0
+                old_rings[doc["feature_id"]] = doc["location"]["coordinates"][0]
+            updates = []
+            for i, duplicate_id, doc in merge_ops:
+                if duplicate_id in existing and (doc["confidence_score"] or 0) > existing[duplicate_id]:
+                    existing[duplicate_id] = doc["confidence_score"]
+                    changed_rings.extend((old_rings[duplicate_id], doc["location"]["coordinates"][0]))
+                    updates.append(UpdateOne({"feature_id": duplicate_id}, {"$set": {
+                        "confidence_score": doc["confidence_score"],
+                        "location": doc["location"],
+                        "metadata": doc["metadata"],
+                        "updated_at": now
+                    }}))
+                    deduplicator.add(duplicate_id, doc["kategori"], doc["location"]["coordinates"][0])
+                    item_status[i]["status"] = "merged"
+                    merged += 1
+            if updates:
+                mongo_collection.bulk_write(updates, ordered=False)
+
+        # Tile vektor yang memuat fitur baru/berubah harus dirender ulang
+        invalidate_rings(changed_rings)
+
+        dropped = sum(1 for s in item_status if s.get("status") == "duplicate")
+        return Response({
+            "status": "success",
+            "message": f"{inserted} objek berhasil disimpan",
+            "inserted": inserted,
+            "bytes_saved": bytes_saved,
+            "deduplication": {
+                "policy": dedup_policy,
+                "iou_threshold": iou_threshold,
+                "dropped": dropped,
+                "merged": merged
+            },
+            "items": item_status
+        }, status=201)
     except Exception as e:
         return Response({"error": str(e)}, status=500)
 
-
 @api_view(['DELETE'])
 def delete_feature(request, feature_id):
     try:
-        result = mongo_collection.delete_one({"feature_id": feature_id})
+        deleted = mongo_collection.find_one_and_delete(
+            {"feature_id": feature_id}, projection={"_id": 0, "location.coordinates": 1}
+        )
         
-        if result.deleted_count > 0:
+        if deleted:
+            deduplicator.remove(feature_id)
+            invalidate_rings(deleted.get("location", {}).get("coordinates", [])[:1])
             return Response({"message": "Data berhasil dihapus dari NoSQL"}, status=200)
         return Response({"error": "Data tidak ditemukan"}, status=404)
     except Exception as e:
@@ -239,16 +691,19 @@ def update_feature_mongo(request, feature_id):
         new_nama = request.data.get('nama')
         new_kategori = request.data.get('kategori')
 
-        result = mongo_collection.update_one(
+        updated = mongo_collection.find_one_and_update(
             {"feature_id": feature_id}, 
             {"$set": {
                 "nama": new_nama,
                 "kategori": new_kategori,
                 "updated_at": datetime.now().isoformat()
-            }}
+            }},
+            projection={"_id": 0, "location.coordinates": 1}
         )
 
-        if result.matched_count > 0:
+        if updated:
+            deduplicator.update_kategori(feature_id, new_kategori)
+            invalidate_rings(updated.get("location", {}).get("coordinates", [])[:1])
             return Response({"message": "Update Berhasil"})
         return Response({"error": "Data tidak ditemukan"}, status=404)
     except Exception as e:
@@ -288,26 +743,63 @@ def rbi_kesehatan_list(request):
     })
 
 # BOUNDARY DATA
-@api_view(['GET'])
-def batas_provinsi(request):
+def _etag_matches(request, etag):
+    """Cek header If-None-Match (boleh berisi beberapa ETag / weak ETag)"""
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if header.strip() == '*':
+        return True
+    return etag in [tag.strip().removeprefix('W/') for tag in header.split(',')]
+
+
+def _preferred_encoding(request, variants):
+    """Pilih varian terkompresi sesuai Accept-Encoding (br > gzip > identity)"""
+    accepted = [part.split(';')[0].strip() for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(',')]
+    for encoding in ('br', 'gzip'):
+        if encoding in accepted and encoding in variants:
+            return encoding
+    return 'identity'
+
+
+def _boundary_response(request, level):
+    """
+    Layer batas dari cache proses, band dipilih lewat zoom / tolerance (meter).
+    output=topojson untuk topologi dengan arc bersama (bukan `format`, yang dipakai DRF
+    untuk memilih renderer sebelum view jalan).
+    """
     try:
-        cursor = mongo_db["batas_provinsi"].find({}, {'_id': 0})
-        features = list(cursor)
-        return Response({
-            "type": "FeatureCollection",
-            "features": features
-        })
+        band = request_band(request.query_params.get('zoom'), request.query_params.get('tolerance'))
+    except ValueError:
+        return Response({"error": "zoom/tolerance harus berupa angka"}, status=400)
+
+    fmt = request.query_params.get('output', 'geojson')
+    if fmt not in BOUNDARY_FORMATS:
+        return Response({"error": f"output harus salah satu dari {BOUNDARY_FORMATS}"}, status=400)
+
+    try:
+        variants = boundary_registry.payload(level, band, fmt)
+        encoding = _preferred_encoding(request, variants)
+        body, etag = variants[encoding]
+
+        if _etag_matches(request, etag):
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(body, content_type='application/json')
+            if encoding != 'identity':
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = 'no-cache'
+        response['X-Boundary-Band'] = band
+        return response
     except Exception as e:
         return Response({"error": str(e)}, status=500)
-    
+
+
+@api_view(['GET'])
+def batas_provinsi(request):
+    return _boundary_response(request, "provinsi")
+
+
 @api_view(['GET'])
 def batas_kabupaten(request):
-    try:
-        cursor = mongo_db["batas_kabupaten"].find({}, {'_id': 0})
-        features = list(cursor)
-        return Response({
-            "type": "FeatureCollection",
-            "features": features
-        })
-    except Exception as e:
-        return Response({"error": str(e)}, status=500)
\ No newline at end of file
+    return _boundary_response(request, "kabupaten")
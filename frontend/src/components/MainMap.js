@@ -16,7 +16,8 @@ export default function MainMap({ activePanel, setActivePanel }) {
   // STATE UTAMA
   const [currentBasemap, setCurrentBasemap] = useState(BASEMAP_OPTIONS[0].url);
   const [activeLayers, setActiveLayers] = useState([]);
-  const [data, setData] = useState(null);
+  // Versi data tersimpan: dinaikkan setelah simpan/hapus agar layer memuat ulang viewport
+  const [dataVersion, setDataVersion] = useState(0);
   const [previewData, setPreviewData] = useState([]);
   const [goHome, setGoHome] = useState(false);
   const [activeRadius, setActiveRadius] = useState(null);
@@ -38,23 +39,6 @@ export default function MainMap({ activePanel, setActivePanel }) {
     return () => window.removeEventListener('resize', checkMobile);
   }, []);
 
-  // Fetch data awal dari MongoDB
-  useEffect(() => {
-    const fetchData = async () => {
-      try {
-        const res = await fetch('http://127.0.0.1:8000/api/features/');
-        if (!res.ok) throw new Error('Gagal mengambil data');
-        const json = await res.json();
-        setData(json);
-      } catch (err) {
-        console.error("Error:", err);
-        toast.error('Gagal memuat data peta');
-      }
-    };
-    
-    fetchData();
-  }, []);
-
   // Fetch data analysis detail
   useEffect(() => {
     if (!activeAnalysisId) {
@@ -203,7 +187,7 @@ export default function MainMap({ activePanel, setActivePanel }) {
         <MapStuff
           activePanel={activePanel}
           activeLayers={activeLayers}
-          data={data}
+          dataVersion={dataVersion}
           previewData={previewData}
           goHome={goHome}
           rbiData={rbiData}
@@ -214,11 +198,7 @@ export default function MainMap({ activePanel, setActivePanel }) {
           setActivePanel={setActivePanel}
           getCategoryColor={getCategoryColor}
           
-          onRefreshData={() => {
-            fetch('http://127.0.0.1:8000/api/features/')
-              .then(res => res.json())
-              .then(json => setData(json));
-          }}
+          onRefreshData={() => setDataVersion(v => v + 1)}
         />
 
         {/* PANEL RADIUS - DI DALAM MAP (butuh useMap) */}
@@ -244,11 +224,7 @@ export default function MainMap({ activePanel, setActivePanel }) {
           <div className="leaflet-top leaflet-right" style={{ pointerEvents: 'none' }}>
             <aside className={`${getPanelClasses()} shadow-2xl z-[1050] bg-white dark:bg-slate-900 overflow-hidden`} style={{ pointerEvents: 'auto' }}>
               <GeoAI 
-                onNewData={() => {
-                  fetch('http://127.0.0.1:8000/api/features/')
-                    .then(res => res.json())
-                    .then(json => setData(json));
-                }}
+                onNewData={() => setDataVersion(v => v + 1)}
                 onDetectionComplete={(res) => setPreviewData(res)}
                 onClearPreview={() => setPreviewData([])}
                 previewData={previewData}
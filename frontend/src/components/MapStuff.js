@@ -424,7 +424,43 @@ export function PreviewLayer({ previewData, setPreviewData, getCategoryColor })
 }
 
 // SAVED DATA LAYER - Popup dengan LUAS
-export function SavedDataLayer({ data, onRefreshData, getCategoryColor }) {
+// Data diambil per viewport (jumlah fitur dibatasi server sesuai zoom), bukan seluruh koleksi
+export function SavedDataLayer({ dataVersion, onRefreshData, getCategoryColor }) {
+  const map = useMap();
+  const [data, setData] = useState([]);
+  const [viewVersion, setViewVersion] = useState(0);
+
+  useMapEvents({
+    moveend: () => setViewVersion(v => v + 1),
+  });
+
+  useEffect(() => {
+    const controller = new AbortController();
+    const bounds = map.getBounds();
+    const bbox = [
+      Math.max(bounds.getWest(), -180),
+      Math.max(bounds.getSouth(), -85),
+      Math.min(bounds.getEast(), 180),
+      Math.min(bounds.getNorth(), 85)
+    ].join(',');
+
+    axios.get('http://127.0.0.1:8000/api/features/viewport/', {
+      params: { bbox, zoom: Math.floor(map.getZoom()) },
+      signal: controller.signal
+    })
+      .then(res => {
+        setData(res.data.features.map(feature => ({ ...feature.properties, location: feature.geometry })));
+      })
+      .catch(err => {
+        if (axios.isCancel(err)) return;
+        console.error("Error:", err);
+        toast.error('Gagal memuat data peta');
+      });
+
+    // Request viewport lama dibatalkan saat peta bergeser lagi
+    return () => controller.abort();
+  }, [map, viewVersion, dataVersion]);
+
   const handleDelete = async (feature_id) => {
     toast.custom((t) => (
       <div className="bg-white dark:bg-slate-800 rounded-xl shadow-xl p-4 min-w-[300px]">
@@ -644,7 +680,7 @@ export default function MapStuff(props) {
       
       {/* 5. Persistence Layer (Data dari MongoDB) */}
       <SavedDataLayer 
-        data={props.data}
+        dataVersion={props.dataVersion}
         onRefreshData={props.onRefreshData}
         getCategoryColor={props.getCategoryColor}
       />